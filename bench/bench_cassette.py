@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+
+"""
+Record/replay of LLM calls: headless run is recorded against local mock LLM server with scripted agents,
+then replayed from its cassette, offline, with recorded latency and with zero latency: iterations/s, size of
+cassette per call, and check that replayed runs reproduce recorded conversation and cost. With cassette dir
+of recorded run (its settings must match nochbinich.py), only replays it at zero latency, until it diverges.
+
+Usage: bench_cassette.py [--iterations N] [--latency SEC] [--jitter SEC] [--streaming] [CASSETTE_DIR]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import nochbinich
+import mock_llm_server
+
+
+PROVIDERS = [nochbinich.API_PROVIDERS.ANTHROPIC, nochbinich.API_PROVIDERS.OPENAI] # both, so that replay has to follow recorded choices of router
+
+
+def run(dirpath, n_iterations):
+	# (iterations, iterations/s, messages, cost, stop reason) of headless run in fresh dirpath
+	os.makedirs(dirpath)
+	os.chdir(dirpath) # calibration file of router, cassette
+	supervisor = nochbinich.Supervisor(dirpath)
+	supervisor.begin()
+	n_done = 0
+	t = time.perf_counter()
+	while (n_done < n_iterations) and not supervisor.is_stopped:
+		supervisor.step()
+		n_done += 1
+	dt = time.perf_counter() - t
+	supervisor.finish()
+	os.chdir('/')
+	return n_done, n_done / dt, supervisor.lineage.message_log.load(), supervisor.lineage.cost, supervisor.stop_reason
+
+
+def replay(dirpath, cassette_dirpath, n_iterations, is_latency):
+	nochbinich.LLM_CASSETTE = 'replay'
+	nochbinich.LLM_CASSETTE_LATENCY = is_latency
+	nochbinich.cassette = nochbinich.Cassette(cassette_dirpath)
+	return run(dirpath, n_iterations)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Record and replay of headless runs')
+	parser.add_argument('--iterations', type=int, default=50)
+	parser.add_argument('--latency', type=float, default=0.2, help='sec of mock LLM per call')
+	parser.add_argument('--jitter', type=float, default=0.1, help='sec, uniformly random extra latency up to it')
+	parser.add_argument('--streaming', action='store_true')
+	parser.add_argument('cassette_dirpath', nargs='?', help='cassette of recorded run to replay')
+	args = parser.parse_args()
+
+	nochbinich.LLM_STREAMING = args.streaming
+	nochbinich.COST_LIMIT = float('inf')
+	nochbinich.TIMEOUT = 10
+
+	with tempfile.TemporaryDirectory() as tmp_dirpath:
+		if args.cassette_dirpath is not None:
+			n_done, rate, messages, cost, stop_reason = replay(os.path.join(tmp_dirpath, 'run'), os.path.abspath(args.cassette_dirpath), args.iterations, False)
+			print(f'Replay of {args.cassette_dirpath} ({len(nochbinich.cassette.entries)} distinct requests): {n_done} iterations, {rate:.2f} iterations/s, cost ${cost:.6f}' + (f', stopped by {stop_reason}' if (stop_reason is not None) else ''))
+			sys.exit(0)
+
+		server, base_url = mock_llm_server.start_mock_server(latency=args.latency, jitter=args.jitter, replies=mock_llm_server.SCRIPTED_AGENTS)
+		for provider in PROVIDERS:
+			nochbinich.API_BASE_URL[provider] = f'{base_url}/v1/messages' if (provider == nochbinich.API_PROVIDERS.ANTHROPIC) else f'{base_url}/v1/chat/completions'
+			os.environ.setdefault(f'{provider.value.upper()}_API_KEY', 'mock')
+		nochbinich.API_PROVIDER = PROVIDERS
+		nochbinich.LLM_RETRY_BACKOFF = 0.01
+		nochbinich.SUMMARISATION_TOKENS_THRESHOLD = 8000
+
+		# The same dir for all runs, so that paths in agents' output match
+		run_dirpath = os.path.join(tmp_dirpath, 'run')
+		cassette_dirpath = os.path.join(tmp_dirpath, nochbinich.LLM_CASSETTE_DIRNAME)
+		nochbinich.LLM_CASSETTE = 'record'
+		nochbinich.cassette = nochbinich.Cassette(cassette_dirpath)
+		n_done, rate, recorded_messages, recorded_cost, _ = run(run_dirpath, args.iterations)
+		server.shutdown()
+		stats = nochbinich.cassette.get_stats()
+		n_calls = sum(len(entries) for entries in nochbinich.cassette.entries.values())
+		print(f'Recorded: {n_done} iterations, {rate:.2f} iterations/s (mock latency {args.latency} + up to {args.jitter} s' + (', streaming' if args.streaming else '') + f'), {server.n_requests} requests, cost ${recorded_cost:.6f}')
+		print(f'Cassette: {n_calls} calls, {stats["n_bytes"] / 1024:.0f} KiB of requests and responses -> {stats["n_packed_bytes"] / 1024:.0f} KiB packed, {(stats["n_packed_bytes"] + os.path.getsize(nochbinich.cassette.index_filename)) / n_calls / 1024:.2f} KiB per call with index')
+
+		for is_latency in [True, False]:
+			shutil.rmtree(run_dirpath)
+			n_done, rate, messages, cost, stop_reason = replay(run_dirpath, cassette_dirpath, args.iterations, is_latency)
+			is_same = (messages == recorded_messages) and (abs(cost - recorded_cost) <= 1e-9 * max(1.0, recorded_cost))
+			print(f'Replayed with {"recorded" if is_latency else "zero"} latency: {n_done} iterations, {rate:.2f} iterations/s, cost ${cost:.6f}; conversation and cost ' + ('match' if is_same else ('DIFFER' + (f' (stopped by {stop_reason})' if (stop_reason is not None) else ''))))
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+
+"""
+Overhead of crash-safe checkpointing: atomic write of checkpoint (twice per iteration),
+against appending one fsync'ed message and against whole iteration with mock LLM and one-line agent;
+and startup consistency check of lineage with many agents.
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import nochbinich
+import mock_llm_server
+
+
+N_RUNS = 200
+N_ITERATIONS = 50
+N_LINEAGE_AGENTS = 5000
+
+
+def get_stats_str(durations):
+	durations = sorted(durations)
+	return f'median {1e3 * statistics.median(durations):7.3f} ms, p99 {1e3 * durations[int(0.99 * (len(durations) - 1))]:7.3f} ms'
+
+
+def bench_writes(dirpath):
+	lineage = nochbinich.Lineage(dirpath)
+	lineage.begin()
+	lineage.provider = nochbinich.API_PROVIDERS.LLAMA_CPP
+	durations = []
+	for _ in range(N_RUNS):
+		t = time.perf_counter()
+		lineage.save_checkpoint(False)
+		durations.append(time.perf_counter() - t)
+	print(f'checkpoint    {get_stats_str(durations)} ({os.path.getsize(lineage.path(nochbinich.COUNTERS_FILENAME))} bytes)')
+	durations = []
+	for _ in range(N_RUNS):
+		t = time.perf_counter()
+		lineage.message_log.append({'role' : 'user', 'content' : 'Ran agent 1 obtained from you before: Return code is 0.'})
+		durations.append(time.perf_counter() - t)
+	print(f'message       {get_stats_str(durations)}')
+
+
+def bench_iterations(dirpath):
+	server, base_url = mock_llm_server.start_mock_server()
+	nochbinich.API_BASE_URL[nochbinich.API_PROVIDERS.LLAMA_CPP] = base_url + '/v1/chat/completions'
+	lineage = nochbinich.Lineage(dirpath)
+	lineage.begin()
+	save_checkpoint = lineage.save_checkpoint
+	checkpoint_durations = []
+	def timed_save_checkpoint(is_iterating):
+		t = time.perf_counter()
+		save_checkpoint(is_iterating)
+		checkpoint_durations.append(time.perf_counter() - t)
+	lineage.save_checkpoint = timed_save_checkpoint
+	durations = []
+	for _ in range(N_ITERATIONS):
+		t = time.perf_counter()
+		lineage.iterate(nochbinich.API_PROVIDERS.LLAMA_CPP)
+		durations.append(time.perf_counter() - t)
+	server.shutdown()
+	share = sum(checkpoint_durations) / sum(durations)
+	print(f'iteration     {get_stats_str(durations)} with mock LLM and agent; checkpoints are {100 * share:.2f}% of it')
+
+
+def bench_startup(dirpath):
+	lineage = nochbinich.Lineage(dirpath)
+	lineage.begin()
+	for i in range(N_LINEAGE_AGENTS):
+		lineage.lineage_store.put(i, f'print({i})', None)
+	lineage.i_agent = N_LINEAGE_AGENTS
+	lineage.save_checkpoint(False)
+	t = time.perf_counter()
+	nochbinich.Lineage(dirpath).begin()
+	print(f'startup check {1e3 * (time.perf_counter() - t):7.3f} ms with {N_LINEAGE_AGENTS} agents in {nochbinich.LINEAGE_DIRNAME}')
+
+
+if __name__ == '__main__':
+	nochbinich.API_PROVIDER = [nochbinich.API_PROVIDERS.LLAMA_CPP]
+	for bench in [bench_writes, bench_iterations, bench_startup]:
+		with tempfile.TemporaryDirectory() as dirpath:
+			bench(dirpath)
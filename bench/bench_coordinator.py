@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+"""
+Coordinator of LLM calls shared by supervisors on one host: several supervisor processes (the first one with
+several lineages, as threads) call mock LLM server whose account has requests-per-minute limit, each on its own
+and then via coordinator with the same limit; 429s answered, retries, failed calls, calls per supervisor (fair
+share) and time queued. Then fleet cost cap: supervisors call until coordinator refuses, and settled cost is
+compared with limit.
+
+Usage: bench_coordinator.py [--supervisors N] [--threads K] [--duration SEC] [--rpm N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import nochbinich
+import mock_llm_server
+
+
+PROVIDER = nochbinich.API_PROVIDERS.OPENAI
+MESSAGES = [{'role' : 'system', 'content' : nochbinich.SYSTEM_MESSAGE}, {'role' : 'user', 'content' : 'Please reply with next agent (1st).'}]
+
+
+def supervise(k, n_threads, duration, results):
+	# Process of supervisor k: n_threads lineages calling LLM for duration, or until coordinator refuses
+	nochbinich.provider_clients.clear() # sessions of parent are not shared
+	calls = []
+	t_end = time.monotonic() + duration
+
+	def work():
+		while time.monotonic() < t_end:
+			t = time.monotonic()
+			try:
+				_, n_prompt_tokens, n_completion_tokens, stats = nochbinich.get_llm_response(PROVIDER, MESSAGES)
+			except nochbinich.CoordinatorRefusal:
+				calls.append(('refused', time.monotonic() - t, 0.0, 0.0))
+				return
+			except Exception:
+				calls.append(('failed', time.monotonic() - t, 0.0, 0.0))
+				continue
+			calls.append(('ok', time.monotonic() - t, stats.get('queued') or 0.0, nochbinich.get_cost(PROVIDER, n_prompt_tokens, n_completion_tokens, stats)))
+
+	threads = [nochbinich.threading.Thread(target=work) for _ in range(n_threads)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	results.put((k, calls, nochbinich.get_provider_client(PROVIDER).n_retries))
+
+
+def run_fleet(n_supervisors, n_threads, duration):
+	# {supervisor : calls}, retries
+	results = multiprocessing.Queue()
+	procs = [multiprocessing.Process(target=supervise, args=(k, (n_threads if (k == 0) else 1), duration, results)) for k in range(n_supervisors)]
+	for proc in procs:
+		proc.start()
+	fleet = {}
+	n_retries = 0
+	for _ in procs:
+		k, calls, n_proc_retries = results.get()
+		fleet[k] = calls
+		n_retries += n_proc_retries
+	for proc in procs:
+		proc.join()
+	return fleet, n_retries
+
+
+def start_coordinator(dirpath):
+	nochbinich.COORDINATOR_SOCKET = os.path.join(dirpath, 'coordinator.sock')
+	if os.path.exists(nochbinich.COORDINATOR_SOCKET):
+		os.remove(nochbinich.COORDINATOR_SOCKET) # of terminated one
+	coordinator = nochbinich.Coordinator(nochbinich.COORDINATOR_SOCKET, os.path.join(dirpath, nochbinich.COORDINATOR_LEDGER_FILENAME))
+	proc = multiprocessing.Process(target=coordinator.serve, daemon=True)
+	proc.start()
+	while not os.path.exists(nochbinich.COORDINATOR_SOCKET):
+		time.sleep(0.01)
+	return proc
+
+
+def print_fleet(label, server, fleet, n_retries):
+	calls = [call for supervisor_calls in fleet.values() for call in supervisor_calls]
+	ok_calls = [call for call in calls if call[0] == 'ok']
+	print(f'{label}: {len(ok_calls)} calls OK, {sum(1 for call in calls if call[0] == "failed")} failed after {nochbinich.LLM_RETRIES} retries; 429 answered {server.n_throttled}, retries {n_retries}')
+	print('  calls per supervisor: ' + ', '.join(f'{sum(1 for call in fleet[k] if call[0] == "ok")}' for k in sorted(fleet)) + f'; call p50 {nochbinich.get_percentile([call[1] for call in ok_calls], 0.5):.2f} s, p90 {nochbinich.get_percentile([call[1] for call in ok_calls], 0.9):.2f} s, queued p50 {nochbinich.get_percentile([call[2] for call in ok_calls], 0.5):.2f} s')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Supervisors calling LLM on their own and via coordinator')
+	parser.add_argument('--supervisors', type=int, default=4)
+	parser.add_argument('--threads', type=int, default=4, help='lineages of the first supervisor')
+	parser.add_argument('--duration', type=float, default=10.0, help='sec')
+	parser.add_argument('--rpm', type=int, default=300, help='requests per minute of mock account')
+	args = parser.parse_args()
+	multiprocessing.set_start_method('fork')
+
+	server, base_url = mock_llm_server.start_mock_server(latency=0.05, rpm=args.rpm, retry_after=None)
+	nochbinich.API_BASE_URL[PROVIDER] = f'{base_url}/v1/chat/completions'
+	os.environ.setdefault(f'{PROVIDER.value.upper()}_API_KEY', 'mock')
+	nochbinich.LLM_RETRY_BACKOFF = 0.1
+	print(f'{args.supervisors} supervisors (the first one with {args.threads} lineages) for {args.duration:.0f} s, account of {args.rpm} requests/min, backoff from {nochbinich.LLM_RETRY_BACKOFF} s')
+
+	fleet, n_retries = run_fleet(args.supervisors, args.threads, args.duration)
+	print_fleet('On their own', server, fleet, n_retries)
+
+	server.rate_level = 0.0 # account is drained again
+	server.n_throttled = 0
+	with tempfile.TemporaryDirectory() as dirpath:
+		nochbinich.COORDINATOR = True
+		nochbinich.RATE_LIMITS = {PROVIDER : {nochbinich.MODEL_ID[PROVIDER] : [args.rpm, None]}}
+		proc = start_coordinator(dirpath)
+		fleet, n_retries = run_fleet(args.supervisors, args.threads, args.duration)
+		print_fleet('Via coordinator', server, fleet, n_retries)
+		proc.terminate()
+		proc.join()
+
+		cost_per_call = sum(call[3] for calls in fleet.values() for call in calls if call[0] == 'ok') / max(1, sum(1 for calls in fleet.values() for call in calls if call[0] == 'ok'))
+		nochbinich.RATE_LIMITS = {}
+		nochbinich.COORDINATOR_COST_LIMIT = 50.5 * cost_per_call
+		os.remove(os.path.join(dirpath, nochbinich.COORDINATOR_LEDGER_FILENAME))
+		proc = start_coordinator(dirpath)
+		fleet, n_retries = run_fleet(args.supervisors, args.threads, args.duration)
+		status = nochbinich.get_coordinator_status(nochbinich.COORDINATOR_SOCKET)
+		proc.terminate()
+		proc.join()
+		n_refused = sum(1 for calls in fleet.values() for call in calls if call[0] == 'refused')
+		print(f'Fleet cost cap ${nochbinich.COORDINATOR_COST_LIMIT:.4f} (~50 calls): {status["ledger"]["n_calls"]} calls settled, ${status["ledger"]["cost"]:.4f} ({"within" if (status["ledger"]["cost"] <= nochbinich.COORDINATOR_COST_LIMIT) else "OVER"} limit); {n_refused} lineages refused')
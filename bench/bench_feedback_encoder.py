@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+
+"""
+Feedback encoder replayed against baseline of full execution results: tokens of each
+execution results message, and prompt tokens of whole run (every LLM call resends the
+conversation, so saved tokens are saved again until summarisation, which is not replayed).
+Scenario is synthetic lineage (repeated failure, progress output with small changes, mutual
+recursion), or lineage stores of given run directories, whose results are kept in full.
+
+Usage: bench_feedback_encoder.py [RUN_DIR ...]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import nochbinich
+
+
+N_AGENTS = 60
+
+TRACEBACK = '''Traceback (most recent call last):
+  File "/home/agent/workdir/agent.py", line 12, in <module>
+    articles_info = soup.find("table", {"class": "wikitable"}).find_all("tr")[0].find_all("td")[1].text
+                    ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+IndexError: list index out of range
+'''
+
+RECURSION_FRAMES = '''  File "/home/agent/workdir/agent.py", line 4, in crawl
+    return visit(links[0], depth + 1)
+           ^^^^^^^^^^^^^^^^^^^^^^^^^^
+  File "/home/agent/workdir/agent.py", line 9, in visit
+    return crawl(url, depth)
+           ^^^^^^^^^^^^^^^^^
+'''
+
+
+def capture(text):
+	# As supervisor keeps it, within STDOUTERR_SIZE_LIMIT
+	bounded_capture = nochbinich.BoundedCapture()
+	bounded_capture.feed(text.encode('utf-8'))
+	return bounded_capture.get_text()
+
+
+def make_scenario():
+	# (stdout, stderr) of agent runs
+	rng = random.Random(1)
+	progress = [f'Fetched page {k}: {rng.randrange(1000, 9999)} bytes, {rng.randrange(10, 99)} links' for k in range(30)]
+	for i_agent in range(N_AGENTS):
+		phase = (i_agent // 10) % 3
+		if phase == 0:
+			yield 'Fetching statistics...\n', TRACEBACK
+		elif phase == 1:
+			k = rng.randrange(len(progress))
+			progress[k] = f'Fetched page {k}: {rng.randrange(1000, 9999)} bytes, {rng.randrange(10, 99)} links'
+			yield '\n'.join(progress) + '\n', ''
+		else:
+			yield '', 'Traceback (most recent call last):\n  File "/home/agent/workdir/agent.py", line 12, in <module>\n    crawl(start_url, 0)\n' + RECURSION_FRAMES * rng.randrange(150, 160) + 'RecursionError: maximum recursion depth exceeded\n'
+
+
+def load_runs(run_dirpaths):
+	for run_dirpath in run_dirpaths:
+		for dirpath, dirnames, filenames in os.walk(run_dirpath):
+			if nochbinich.LINEAGE_INDEX_FILENAME in filenames:
+				store = nochbinich.LineageStore(dirpath)
+				for i_agent in sorted(store.load()):
+					result = store.get(i_agent)[1]
+					if result is None:
+						continue
+					i_stdout = result.find('.\nstdout is: "')
+					i_stderr = result.rfind('".\nstderr is: "')
+					if (i_stdout >= 0) and (i_stderr > i_stdout):
+						yield result[(i_stdout + len('.\nstdout is: "')):i_stderr], result[(i_stderr + len('".\nstderr is: "')):-len('".')]
+
+
+def replay(label, runs):
+	lineage = nochbinich.Lineage(os.devnull)
+	lineage.emit = lambda event_type, **fields: None
+	lineage.report = lambda s: None
+	n_baseline_prompt_tokens = n_prompt_tokens = 0
+	n_baseline_history_tokens = n_history_tokens = 0
+	t = time.perf_counter()
+	for i_agent, (agent_stdout, agent_stderr) in enumerate(runs):
+		lineage.i_agent = i_agent
+		result = lineage.format_result('Return code is 1', agent_stdout, agent_stderr)
+		n_baseline_history_tokens += nochbinich.estimate_tokens(lineage.agent_result)
+		n_history_tokens += nochbinich.estimate_tokens(result)
+		n_baseline_prompt_tokens += n_baseline_history_tokens
+		n_prompt_tokens += n_history_tokens
+	dt = time.perf_counter() - t
+	n_runs = i_agent + 1
+	print(f'{label}: {n_runs} runs, encoding {1e3 * dt / n_runs:.2f} ms/run')
+	print(f'  execution results messages: {n_baseline_history_tokens} -> {n_history_tokens} tokens ({100 * (1 - n_history_tokens / max(n_baseline_history_tokens, 1)):.1f}% saved, {(n_baseline_history_tokens - n_history_tokens) / n_runs:.0f} per run)')
+	print(f'  prompt tokens of whole run, without summarisation: {n_baseline_prompt_tokens} -> {n_prompt_tokens} ({100 * (1 - n_prompt_tokens / max(n_baseline_prompt_tokens, 1)):.1f}% saved)')
+
+
+if __name__ == '__main__':
+	replay('synthetic', [(capture(agent_stdout), capture(agent_stderr)) for agent_stdout, agent_stderr in make_scenario()])
+	if len(sys.argv) > 1:
+		replay(' '.join(sys.argv[1:]), list(load_runs(sys.argv[1:])))
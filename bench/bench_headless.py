@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+"""
+End-to-end benchmark of headless supervisor loop against local mock LLM server with scripted agents:
+iterations/s, supervisor overhead per iteration (iteration time not spent in LLM calls or agent runs),
+summarisations, growth of message store (in memory and on disk) and of process RSS, and check that
+accounted cost equals cost of usage reported by mock server.
+
+Usage: bench_headless.py [--iterations N] [--provider NAME] [--latency SEC] [--jitter SEC] [--error-rate P] [--streaming] [--threshold TOKENS]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import nochbinich
+import mock_llm_server
+
+
+def get_messages_size(messages):
+	return sum(sys.getsizeof(msg) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in msg.items()) for msg in messages)
+
+
+def get_rss():
+	with open('/proc/self/statm', 'r') as file:
+		return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class IterationRecorder:
+	# Listener that keeps per-iteration times and samples of memory
+
+	def __init__(self, lineage, n_samples):
+		self.lineage = lineage
+		self.n_samples = n_samples
+		self.overheads = []
+		self.durations = []
+		self.samples = []
+		self.t_in_calls = 0.0
+
+	def __call__(self, event):
+		event_type = event['event']
+		if event_type == 'iteration_started':
+			self.t_in_calls = 0.0
+		elif (event_type == 'llm_finished') and (event['purpose'] != 'background_summary'):
+			self.t_in_calls += event['latency']
+		elif event_type == 'agent_finished':
+			self.t_in_calls += event['duration']
+		elif event_type == 'iteration_finished':
+			self.durations.append(event['duration'])
+			self.overheads.append(event['duration'] - self.t_in_calls)
+			if (len(self.durations) == 1) or (len(self.durations) % self.n_samples == 0):
+				messages = self.lineage.message_log.load()
+				self.samples.append((len(self.durations), len(messages), get_messages_size(messages), os.path.getsize(self.lineage.path(nochbinich.MESSAGES_FILENAME)), get_rss()))
+
+
+def get_percentile_ms(values, q):
+	return 1e3 * nochbinich.get_percentile(values, q)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='End-to-end benchmark of headless loop against mock LLM server')
+	parser.add_argument('--iterations', type=int, default=100)
+	parser.add_argument('--provider', default=nochbinich.API_PROVIDERS.OPENAI.value, choices=[provider.value for provider in nochbinich.API_PROVIDERS if provider != nochbinich.API_PROVIDERS.LEPTONAI])
+	parser.add_argument('--latency', type=float, default=0.0, help='sec of mock LLM per call')
+	parser.add_argument('--jitter', type=float, default=0.0, help='sec, uniformly random extra latency up to it')
+	parser.add_argument('--error-rate', type=float, default=0.0, help='probability of injected error per LLM call')
+	parser.add_argument('--streaming', action='store_true')
+	parser.add_argument('--threshold', type=int, default=8000, help='SUMMARISATION_TOKENS_THRESHOLD')
+	args = parser.parse_args()
+
+	provider = nochbinich.API_PROVIDERS(args.provider)
+	server, base_url = mock_llm_server.start_mock_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, replies=mock_llm_server.SCRIPTED_AGENTS)
+	nochbinich.API_BASE_URL[provider] = {nochbinich.API_PROVIDERS.ANTHROPIC : f'{base_url}/v1/messages', nochbinich.API_PROVIDERS.GOOGLE : f'{base_url}/v1beta/models'}.get(provider, f'{base_url}/v1/chat/completions')
+	os.environ.setdefault(f'{provider.value.upper()}_API_KEY', 'mock')
+	nochbinich.API_PROVIDER = [provider]
+	nochbinich.LLM_STREAMING = args.streaming
+	nochbinich.LLM_RETRY_BACKOFF = 0.01
+	nochbinich.SUMMARISATION_TOKENS_THRESHOLD = args.threshold
+	nochbinich.COST_LIMIT = float('inf')
+	nochbinich.TIMEOUT = 10
+
+	with tempfile.TemporaryDirectory() as dirpath:
+		os.chdir(dirpath) # calibration file of router
+		supervisor = nochbinich.Supervisor(dirpath)
+		recorder = IterationRecorder(supervisor.lineage, max(1, args.iterations // 10))
+		supervisor.listeners.append(recorder)
+		supervisor.begin()
+		t = time.perf_counter()
+		for _ in range(args.iterations):
+			supervisor.step()
+		dt = time.perf_counter() - t
+		supervisor.finish()
+		lineage = supervisor.lineage
+
+		print(f'{args.iterations} iterations via {provider.value} :: {nochbinich.MODEL_ID[provider]} (mock; latency {args.latency} + up to {args.jitter} s, error rate {args.error_rate}' + (', streaming' if args.streaming else '') + f'): {args.iterations / dt:.2f} iterations/s')
+		print(f'Iteration median {get_percentile_ms(recorder.durations, 0.5):.1f} ms; supervisor overhead median {get_percentile_ms(recorder.overheads, 0.5):.2f} ms, p90 {get_percentile_ms(recorder.overheads, 0.9):.2f} ms, max {get_percentile_ms(recorder.overheads, 1.0):.2f} ms')
+		print(f'LLM requests {server.n_requests} ({server.n_agent_requests} agents, {server.n_summary_requests} summaries), injected errors {server.n_errors}, retries {nochbinich.get_provider_client(provider).n_retries}; summarisations {lineage.n_summarisations}; pre-flight failures {lineage.n_preflight_failures}')
+
+		expected_cost = sum(nochbinich.get_cost(provider, usage['prompt_tokens'], usage['completion_tokens'], {'n_cached_tokens' : usage['cached_tokens'], 'n_cache_write_tokens' : 0}) for usage in server.usages)
+		print(f'Cost accounted ${lineage.cost:.6f}, of usage reported by server ${expected_cost:.6f}: ' + ('OK' if abs(lineage.cost - expected_cost) <= 1e-9 * max(1.0, expected_cost) else 'MISMATCH'))
+
+		print()
+		print(f'{"iteration":>10}{"messages":>10}{"in memory, KiB":>16}{"on disk, KiB":>14}{"RSS, MiB":>10}')
+		for i_iteration, n_messages, n_bytes, n_file_bytes, rss in recorder.samples:
+			print(f'{i_iteration:>10}{n_messages:>10}{n_bytes / 1024:>16.1f}{n_file_bytes / 1024:>14.1f}{rss / 0x100000:>10.1f}')
+		os.chdir('/')
@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+
+"""
+Per-call overhead of posting completions to local mock LLM server:
+module-level requests.post (new connection every call, as before) vs pooled ProviderClient.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import requests
+
+import nochbinich
+from mock_llm_server import start_mock_server
+
+
+N_CALLS = 500
+
+DATA = {'model' : '_', 'messages' : [{'role' : 'system', 'content' : nochbinich.SYSTEM_MESSAGE}, {'role' : 'user', 'content' : 'Please reply with next agent (1st).'}]}
+
+
+def bench(label, post, server):
+	n_connections = server.n_connections
+	t = time.perf_counter()
+	for _ in range(N_CALLS):
+		post().json()
+	dt = time.perf_counter() - t
+	print(f'{label:<24} {1e6 * dt / N_CALLS:9.1f} us/call, {server.n_connections - n_connections} connections')
+
+
+if __name__ == '__main__':
+	server, base_url = start_mock_server()
+	url = f'{base_url}/v1/chat/completions'
+	nochbinich.API_BASE_URL[nochbinich.API_PROVIDERS.LLAMA_CPP] = url
+	client = nochbinich.get_provider_client(nochbinich.API_PROVIDERS.LLAMA_CPP)
+	headers = {'Authorization' : 'Bearer _'}
+	print(f'{N_CALLS} calls to {url}')
+	bench('requests.post (before)', lambda: requests.post(url, headers=headers, json=DATA, timeout=nochbinich.LLM_TIMEOUT), server)
+	bench('ProviderClient (after)', lambda: client.post(DATA), server)
+	server.shutdown()
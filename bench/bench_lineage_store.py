@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+
+"""
+Lineage store vs file per agent: disk usage, time to store agent with its result, and random
+access time, for lineage of near-duplicate agents (each one changes a few lines of the previous)
+whose runs fail with similar tracebacks.
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import nochbinich
+
+
+N_AGENTS = 2000
+BLOCK_SIZE = 4096 # of file system, for disk usage of small files
+
+AGENT_LINES = '''import json, urllib.request
+from bs4 import BeautifulSoup
+
+def get_article_count(url):
+	with urllib.request.urlopen(url) as response:
+		soup = BeautifulSoup(response.read(), "html.parser")
+	return int(soup.find("td", {"class": "mw-statistics-numbers"}).text.replace("\\u00a0", ""))
+
+with open("/proc/meminfo") as file:
+	mem_mb = int(file.readline().split()[1]) // 1024
+print(get_article_count("https://fr.wikipedia.org/wiki/Sp%C3%A9cial:Statistiques") * mem_mb)
+'''.splitlines(keepends=True)
+
+
+def make_lineage():
+	rng = random.Random(1)
+	lines = list(AGENT_LINES)
+	for i_agent in range(N_AGENTS):
+		for _ in range(rng.randint(1, 3)):
+			k = rng.randrange(len(lines))
+			if rng.random() < 0.5:
+				lines[k] = lines[k].rstrip('\n') + f' # attempt {i_agent}\n'
+			else:
+				lines.insert(k, f'print("step {rng.randrange(100)}", flush=True)\n')
+		if len(lines) > 3 * len(AGENT_LINES):
+			lines = list(AGENT_LINES)
+		result = f'Ran agent {i_agent} obtained from you before: Return code is 1.\nstdout is: "step {rng.randrange(100)}\n".\nstderr is: "Traceback (most recent call last):\n  File "agent.py", line {rng.randrange(30)}, in <module>\nIndexError: list index out of range\n".'
+		yield i_agent, ''.join(lines), result
+
+
+def get_disk_usage(n_bytes):
+	return -(-n_bytes // BLOCK_SIZE) * BLOCK_SIZE
+
+
+if __name__ == '__main__':
+	lineage = list(make_lineage())
+	n_raw_bytes = sum(len(agent_src.encode('utf-8')) for _, agent_src, _ in lineage)
+	n_files_usage = sum(get_disk_usage(len(agent_src.encode('utf-8'))) for _, agent_src, _ in lineage)
+	print(f'{N_AGENTS} agents, {n_raw_bytes / 1024:.0f} KiB; as files: {N_AGENTS} files, {n_files_usage / 1024:.0f} KiB on disk ({BLOCK_SIZE}-byte blocks), results not kept')
+
+	for compression in ['zlib'] + (['zstd'] if (nochbinich.zstandard is not None) else []):
+		nochbinich.LINEAGE_COMPRESSION = compression
+		with tempfile.TemporaryDirectory() as dirpath:
+			store = nochbinich.LineageStore(dirpath)
+			put_durations = []
+			for i_agent, agent_src, result in lineage:
+				t = time.perf_counter()
+				store.put(i_agent, agent_src, result)
+				put_durations.append(time.perf_counter() - t)
+			n_store_usage = sum(get_disk_usage(os.path.getsize(os.path.join(dirpath, filename))) for filename in os.listdir(dirpath))
+			stats = store.get_stats()
+
+			store = nochbinich.LineageStore(dirpath) # cold: index is loaded by first access
+			t = time.perf_counter()
+			store.load()
+			load_duration = time.perf_counter() - t
+			get_durations = []
+			for i_agent in random.Random(2).sample(range(N_AGENTS), 200):
+				t = time.perf_counter()
+				agent_src, result = store.get(i_agent)
+				get_durations.append(time.perf_counter() - t)
+				assert (agent_src, result) == lineage[i_agent][1:]
+
+			print(f'{compression}: 2 files, {n_store_usage / 1024:.0f} KiB on disk with results ({stats["n_blobs"]} unique blobs, {stats["n_bytes"] / 1024:.0f} KiB -> {stats["n_packed_bytes"] / 1024:.0f} KiB packed, depth <= {nochbinich.LINEAGE_DELTA_DEPTH})')
+			print(f'  put median {1e3 * statistics.median(put_durations):.3f} ms; index load {1e3 * load_duration:.1f} ms; random get median {1e3 * statistics.median(get_durations):.3f} ms, max {1e3 * max(get_durations):.3f} ms')
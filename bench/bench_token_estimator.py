@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+"""
+Local token estimator: speed (whole-text and incremental per message) and accuracy,
+against tiktoken if it is installed with its encodings available, and against actual
+prompt tokens reported by providers in supervisor logs of given run directories.
+
+Usage: bench_token_estimator.py [RUN_DIR ...]
+"""
+
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import nochbinich
+
+
+AGENT_SRC = '''import json, urllib.request
+from bs4 import BeautifulSoup
+
+def get_article_count():
+	with urllib.request.urlopen("https://fr.wikipedia.org/wiki/Sp%C3%A9cial:Statistiques") as response:
+		soup = BeautifulSoup(response.read(), "html.parser")
+	return int(soup.find("td", {"class": "mw-statistics-numbers"}).text.replace("\\u00a0", ""))
+
+with open("/proc/meminfo") as file:
+	mem_mb = int(file.readline().split()[1]) // 1024
+print(get_article_count() * mem_mb)
+'''
+
+TRACEBACK = '''Traceback (most recent call last):
+  File "/home/agent/workdir/agent.py", line 12, in <module>
+    articles_info = soup.find("table", {"class": "wikitable"}).find_all("tr")[0].find_all("td")[1].text
+IndexError: list index out of range
+'''
+
+
+def make_conversation(n_iterations):
+	messages = [{'role' : 'system', 'content' : nochbinich.SYSTEM_MESSAGE}]
+	for i in range(n_iterations):
+		messages.append({'role' : 'user', 'content' : f'Ran agent {i} obtained from you before: Return code is 1.\nstdout is: "".\nstderr is: "{TRACEBACK}".'})
+		messages.append({'role' : 'user', 'content' : f'Please reply with next agent ({i + 1}th).'})
+		messages.append({'role' : 'assistant', 'content' : AGENT_SRC})
+	return messages
+
+
+def bench_speed():
+	messages = make_conversation(200)
+	text = ''.join(msg['content'] for msg in messages)
+	n_repeats = 20
+	t = time.perf_counter()
+	for _ in range(n_repeats):
+		nochbinich.estimate_tokens(text)
+	dt = (time.perf_counter() - t) / n_repeats
+	print(f'Whole text: {len(text)} chars, ~{nochbinich.estimate_tokens(text)} tokens in {1e3 * dt:.2f} ms ({len(text) / dt / 1e6:.1f} Mchars/s)')
+
+	with tempfile.TemporaryDirectory() as dirpath:
+		message_log = nochbinich.MessageLog(os.path.join(dirpath, nochbinich.MESSAGES_FILENAME))
+		message_log.rewrite([])
+		t_incremental = 0.0
+		for msg in messages:
+			t = time.perf_counter()
+			message_log.n_tokens += nochbinich.estimate_message_tokens(msg)
+			t_incremental += time.perf_counter() - t
+		t = time.perf_counter()
+		n_tokens = sum(nochbinich.estimate_message_tokens(msg) for msg in messages)
+		t_full = time.perf_counter() - t
+	print(f'Per added message: {1e6 * t_incremental / len(messages):.1f} us incrementally vs {1e6 * t_full:.1f} us recounting all {len(messages)} messages ({n_tokens} tokens)')
+
+
+def bench_accuracy_tiktoken():
+	try:
+		import tiktoken
+		encoding = tiktoken.get_encoding('o200k_base')
+	except Exception as exception:
+		print(f'tiktoken reference skipped ({type(exception).__name__})')
+		return
+	for label, text in [('system message', nochbinich.SYSTEM_MESSAGE), ('agent', AGENT_SRC), ('traceback', TRACEBACK)]:
+		n_reference = len(encoding.encode(text))
+		n_estimated = nochbinich.estimate_tokens(text)
+		print(f'{label:<16} estimated {n_estimated:6d}, o200k_base {n_reference:6d}, error {100 * (n_estimated - n_reference) / n_reference:+.1f}%')
+
+
+def bench_accuracy_logs(run_dirpaths):
+	line_re = re.compile(r'tokens: (\d+) prompt \(predicted (\d+)\)')
+	errors = []
+	for run_dirpath in run_dirpaths:
+		for dirpath, _, filenames in os.walk(run_dirpath):
+			if nochbinich.SUPERVISOR_LOG_FILENAME in filenames:
+				with open(os.path.join(dirpath, nochbinich.SUPERVISOR_LOG_FILENAME), 'r') as file:
+					for n_actual, n_predicted in line_re.findall(file.read()):
+						if int(n_actual) > 0:
+							errors.append(100 * (int(n_predicted) - int(n_actual)) / int(n_actual))
+	if len(errors) == 0:
+		print('No predicted prompt sizes found in supervisor logs')
+		return
+	abs_errors = sorted(abs(error) for error in errors)
+	print(f'{len(errors)} calibrated predictions vs actual prompt tokens: mean error {statistics.mean(errors):+.1f}%, median |error| {statistics.median(abs_errors):.1f}%, 95th percentile |error| {abs_errors[int(0.95 * (len(abs_errors) - 1))]:.1f}%')
+
+
+if __name__ == '__main__':
+	bench_speed()
+	bench_accuracy_tiktoken()
+	if len(sys.argv) > 1:
+		bench_accuracy_logs(sys.argv[1:])
@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+
+"""
+Launch-to-first-line latency of agent that imports typical modules and prints:
+new python3 process for each agent (cold) vs child forked from WarmInterpreter (warm).
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import nochbinich
+
+
+N_RUNS = 20
+
+AGENT_SRC = 'import json, urllib.request, requests\nprint("first line", flush=True)\n'
+
+
+def bench(label, workdirpath, is_warm):
+	latencies = []
+	for _ in range(N_RUNS):
+		t_first_line = []
+		t = time.perf_counter()
+		nochbinich.run_agent(workdirpath, nochbinich.TIMEOUT, lambda s: t_first_line.append(time.perf_counter()) if (len(t_first_line) == 0) else None, is_warm)
+		latencies.append(1e3 * (t_first_line[0] - t))
+	print(f'{label:<6} median {statistics.median(latencies):7.1f} ms, min {min(latencies):7.1f} ms, max {max(latencies):7.1f} ms')
+
+
+if __name__ == '__main__':
+	with tempfile.TemporaryDirectory() as workdirpath:
+		with open(os.path.join(workdirpath, nochbinich.AGENT_FILENAME), 'w') as file:
+			file.write(AGENT_SRC)
+		print(f'{N_RUNS} runs of agent importing json, urllib.request, requests; WARM_MODULES = {nochbinich.WARM_MODULES}')
+		bench('cold', workdirpath, False)
+		nochbinich.get_warm_interpreter() # startup is paid once, not per agent
+		bench('warm', workdirpath, True)
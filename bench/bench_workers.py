@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+
+"""
+Background workers: each of N agents needs in-memory index that takes seconds to build; without workers,
+every agent rebuilds it, while with BACKGROUND_WORKERS the first agent starts worker that builds it once
+and serves lookups over its socket to later agents, which connect even before it is ready. Agent time per
+iteration, worker CPU time reported in execution results, and check that no worker outlives supervisor.
+
+Usage: bench_workers.py [--iterations N] [--keys N]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import nochbinich
+
+
+INDEX_SRC = '''import hashlib
+index = {{hashlib.sha256(str(i).encode()).hexdigest()[:12] : i for i in range({n_keys})}}
+'''
+
+REBUILD_AGENT_SRC = INDEX_SRC + '''key = hashlib.sha256(b'{i}').hexdigest()[:12]
+print(key, index[key])
+'''
+
+WORKER_AGENT_SRC = '''# worker: index
+import os, socket
+''' + INDEX_SRC + '''print('ready', len(index))
+listener = socket.socket(fileno=int(os.environ['WORKER_FD']))
+while True:
+	conn, _ = listener.accept()
+	key = conn.recv(64).decode()
+	conn.sendall(str(index.get(key)).encode())
+	conn.close()
+'''
+
+QUERY_AGENT_SRC = '''import hashlib, socket
+key = hashlib.sha256(b'{i}').hexdigest()[:12]
+conn = socket.socket(socket.AF_UNIX)
+conn.connect('workers/index.sock')
+conn.sendall(key.encode())
+print(key, conn.recv(64).decode())
+'''
+
+
+def run(dirpath, agent_srcs):
+	# Agent times (sec) and execution results of lineage in fresh dirpath running agent_srcs in turn
+	os.makedirs(dirpath)
+	lineage = nochbinich.Lineage(dirpath)
+	lineage.begin()
+	durations = []
+	results = []
+	for src in agent_srcs:
+		with open(os.path.join(lineage.workdirpath, nochbinich.AGENT_FILENAME), 'w') as file:
+			file.write(src)
+		t = time.perf_counter()
+		results.append(lineage.run_agent())
+		durations.append(time.perf_counter() - t)
+		lineage.i_agent += 1
+	pids = [worker.proc.pid for worker in lineage.workers.workers.values()]
+	lineage.finish()
+	n_left = sum(1 for pid in pids if nochbinich.get_process_start_time(pid) is not None)
+	return durations, results, n_left
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Agents rebuilding index vs background worker serving it')
+	parser.add_argument('--iterations', type=int, default=10)
+	parser.add_argument('--keys', type=int, default=1000000, help='entries of index')
+	args = parser.parse_args()
+	nochbinich.WORKER_STARTUP = 0.5 # worker is still building index then
+
+	with tempfile.TemporaryDirectory() as tmp_dirpath:
+		durations, results, _ = run(os.path.join(tmp_dirpath, 'rebuild'), [REBUILD_AGENT_SRC.format(n_keys=args.keys, i=i) for i in range(args.iterations)])
+		assert all('Return code is 0' in result for result in results)
+		print(f'{args.iterations} agents, index of {args.keys} keys')
+		print(f'Rebuilt by each agent:  total {sum(durations):6.2f} s, per agent median {statistics.median(durations):.3f} s')
+
+		nochbinich.BACKGROUND_WORKERS = True
+		agent_srcs = [WORKER_AGENT_SRC.format(n_keys=args.keys)] + [QUERY_AGENT_SRC.format(i=i) for i in range(args.iterations - 1)]
+		durations, results, n_left = run(os.path.join(tmp_dirpath, 'worker'), agent_srcs)
+		assert all('Return code is 0' in result for result in results[1:]), results
+		print(f'Served by worker:       total {sum(durations):6.2f} s, per agent median {statistics.median(durations[1:]):.3f} s (worker start {durations[0]:.3f} s, first query {durations[1]:.3f} s)')
+		print(f'Last execution results report: {results[-1].splitlines()[-1]}')
+		print(f'Workers left running after finish: {n_left}')
@@ -0,0 +1,259 @@
+#!/usr/bin/python3
+
+"""
+Local mock of LLM REST APIs for NochBinIch benchmarks: answers in OpenAI-compatible,
+Anthropic, or Google shape depending on request path, with HTTP/1.1 keep-alive,
+whole or streamed as server-sent events; reports prompt tokens shared with earlier requests as cached,
+like providers' prefix caches do. Replies to requests for agents cycle through script of them,
+requests for summaries get summary; latency with jitter and injected errors (HTTP status or
+dropped connection) are configurable, as is rate limit of account (429 with Retry-After),
+and usage of each answered request is recorded.
+
+Usage: mock_llm_server.py [--port 8080] [--latency SEC] [--jitter SEC] [--error-rate P] [--rpm N] [--script FILE]
+"""
+
+import argparse
+import http.server
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+
+REPLY = "print('Hello from mock LLM')"
+
+# Agents that succeed, fail, print much, do not compile, and run for a while, in turn
+SCRIPTED_AGENTS = [
+	"print('Hello from mock LLM')",
+	"import sys\nprint('partial result', flush=True)\nsys.exit(1)",
+	"raise ValueError('scripted failure')",
+	"for i in range(2000):\n\tprint(f'line {i} of long output')",
+	"def get_result(:\n\treturn 42",
+	"import time\ntime.sleep(0.2)\nprint('slept')"
+]
+
+SUMMARY_REPLY = 'So far agents have printed greetings, failed with ValueError, printed long output, and slept; none has reached the final goal.'
+
+SCRIPT_SEPARATOR = '\n# ----\n' # between agents in script file
+
+ERROR_STATUSES = [429, 500, 503, 0] # 0: connection is dropped without response
+
+
+PREFIX_CACHE_SIZE = 16 # latest prompts whose prefixes count as cached
+
+RATE_BURST = 1.0 # sec of requests per minute that may be used at once
+
+
+def make_usage(path, n_prompt_tokens, n_completion_tokens, n_cached_tokens):
+	if path.endswith('/messages'):
+		return {'input_tokens' : n_prompt_tokens - n_cached_tokens, 'cache_read_input_tokens' : n_cached_tokens, 'output_tokens' : n_completion_tokens}
+	elif (':generateContent' in path) or (':streamGenerateContent' in path):
+		return {'promptTokenCount' : n_prompt_tokens, 'cachedContentTokenCount' : n_cached_tokens, 'candidatesTokenCount' : n_completion_tokens}
+	else:
+		return {'prompt_tokens' : n_prompt_tokens, 'prompt_tokens_details' : {'cached_tokens' : n_cached_tokens}, 'completion_tokens' : n_completion_tokens}
+
+
+def get_last_text(request):
+	# Text of the last message, in any of the request shapes
+	if 'contents' in request:
+		return ''.join(part.get('text', '') for part in request['contents'][-1]['parts']) if (len(request['contents']) > 0) else ''
+	messages = request.get('messages', [])
+	if len(messages) == 0:
+		return ''
+	content = messages[-1]['content']
+	return content if isinstance(content, str) else ''.join(block.get('text', '') for block in content)
+
+
+def make_completion(path, reply, usage):
+	if path.endswith('/messages'):
+		return {'content' : [{'type' : 'text', 'text' : reply}], 'usage' : usage}
+	elif ':generateContent' in path:
+		return {'candidates' : [{'content' : {'role' : 'model', 'parts' : [{'text' : reply}]}}], 'usageMetadata' : usage}
+	else:
+		return {'choices' : [{'message' : {'role' : 'assistant', 'content' : reply}}], 'usage' : usage}
+
+
+STREAM_CHUNK_SIZE = 8 # chars of reply per event
+
+
+def make_stream_events(path, reply, usage):
+	chunks = [reply[i:(i + STREAM_CHUNK_SIZE)] for i in range(0, len(reply), STREAM_CHUNK_SIZE)]
+	if path.endswith('/messages'):
+		yield {'type' : 'message_start', 'message' : {'usage' : dict(usage, output_tokens=1)}}
+		yield {'type' : 'content_block_start', 'index' : 0, 'content_block' : {'type' : 'text', 'text' : ''}}
+		for chunk in chunks:
+			yield {'type' : 'content_block_delta', 'index' : 0, 'delta' : {'type' : 'text_delta', 'text' : chunk}}
+		yield {'type' : 'content_block_stop', 'index' : 0}
+		yield {'type' : 'message_delta', 'delta' : {'stop_reason' : 'end_turn'}, 'usage' : {'output_tokens' : usage['output_tokens']}}
+		yield {'type' : 'message_stop'}
+	elif ':streamGenerateContent' in path:
+		for i, chunk in enumerate(chunks):
+			yield {'candidates' : [{'content' : {'role' : 'model', 'parts' : [{'text' : chunk}]}}], 'usageMetadata' : dict(usage, candidatesTokenCount=((usage['candidatesTokenCount'] * (i + 1)) // len(chunks)))}
+	else:
+		for chunk in chunks:
+			yield {'choices' : [{'delta' : {'content' : chunk}}]}
+		yield {'choices' : [], 'usage' : usage}
+
+
+class MockHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1' # keep-alive
+	disable_nagle_algorithm = True # headers and body are written separately
+
+	def setup(self):
+		super().setup()
+		with self.server.lock:
+			self.server.n_connections += 1
+
+	def log_message(self, format, *args):
+		pass
+
+	def do_POST(self):
+		request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+		with self.server.lock:
+			self.server.n_requests += 1
+			retry_after = self.throttle()
+		if retry_after is not None:
+			self.send_error_body(429, f'{retry_after:.2f}')
+			return
+		with self.server.lock:
+			latency = self.server.latency + self.server.rng.uniform(0, self.server.jitter)
+			error_status = self.server.rng.choice(self.server.error_statuses) if (self.server.rng.random() < self.server.error_rate) else None
+			is_summary = 'summar' in get_last_text(request).lower()
+			if is_summary:
+				reply = SUMMARY_REPLY
+				self.server.n_summary_requests += 1
+			elif self.server.replies is not None:
+				reply = self.server.replies[self.server.n_agent_requests % len(self.server.replies)]
+				self.server.n_agent_requests += 1
+			else:
+				reply = self.server.reply
+				self.server.n_agent_requests += 1
+		if latency > 0:
+			time.sleep(latency)
+		if error_status is not None:
+			with self.server.lock:
+				self.server.n_errors += 1
+			if error_status == 0:
+				self.close_connection = True
+				self.connection.shutdown(2)
+				return
+			self.send_error_body(error_status, (str(self.server.retry_after) if ((error_status == 429) and (self.server.retry_after is not None)) else None))
+			return
+		prompt = json.dumps(request)
+		n_prompt_tokens = len(prompt) >> 2
+		n_completion_tokens = len(reply) >> 2
+		with self.server.lock:
+			n_cached_tokens = max([len(os.path.commonprefix([prompt, cached_prompt])) >> 2 for cached_prompt in self.server.cached_prompts] + [0])
+			self.server.cached_prompts = (self.server.cached_prompts + [prompt])[-PREFIX_CACHE_SIZE:]
+			self.server.usages.append({'prompt_tokens' : n_prompt_tokens, 'completion_tokens' : n_completion_tokens, 'cached_tokens' : n_cached_tokens, 'is_summary' : is_summary})
+		usage = make_usage(self.path, n_prompt_tokens, n_completion_tokens, n_cached_tokens)
+		if request.get('stream', False) or (':streamGenerateContent' in self.path):
+			self.send_response(200)
+			self.send_header('Content-Type', 'text/event-stream')
+			self.send_header('Transfer-Encoding', 'chunked')
+			self.end_headers()
+			try:
+				for event in make_stream_events(self.path, reply, usage):
+					self.write_chunk(f'data: {json.dumps(event)}\n\n'.encode('utf-8'))
+					if self.server.token_delay > 0:
+						time.sleep(self.server.token_delay)
+				if not (self.path.endswith('/messages') or (':streamGenerateContent' in self.path)):
+					self.write_chunk(b'data: [DONE]\n\n')
+				self.write_chunk(b'')
+			except (BrokenPipeError, ConnectionResetError):
+				self.close_connection = True # client has cancelled the call
+			return
+		body = json.dumps(make_completion(self.path, reply, usage)).encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+
+	def throttle(self):
+		# Sec to wait, if request exceeds requests per minute of account, else None; like providers' limits, it is
+		# token bucket refilled continuously, up to RATE_BURST sec of rate; under server.lock
+		if self.server.rpm is None:
+			return None
+		t = time.monotonic()
+		rate = self.server.rpm / 60
+		self.server.rate_level = min(max(1.0, rate * RATE_BURST), self.server.rate_level + (t - self.server.rate_t) * rate)
+		self.server.rate_t = t
+		if self.server.rate_level < 1:
+			self.server.n_throttled += 1
+			return (1 - self.server.rate_level) / rate
+		self.server.rate_level -= 1
+		return None
+
+	def send_error_body(self, status, retry_after=None):
+		body = json.dumps({'error' : {'message' : ('rate limit exceeded' if (status == 429) else 'injected error')}}).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		if retry_after is not None:
+			self.send_header('Retry-After', retry_after)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def write_chunk(self, data):
+		self.wfile.write(f'{len(data):X}\r\n'.encode('ascii') + data + b'\r\n')
+
+
+class MockServer(http.server.ThreadingHTTPServer):
+	def handle_error(self, request, client_address):
+		if not isinstance(sys.exc_info()[1], ConnectionError): # clients exiting with keep-alive connections are not errors
+			super().handle_error(request, client_address)
+
+
+def start_mock_server(port=0, latency=0.0, reply=REPLY, token_delay=0.0, replies=None, jitter=0.0, error_rate=0.0, error_statuses=ERROR_STATUSES, retry_after=0, seed=0, rpm=None):
+	server = MockServer(('127.0.0.1', port), MockHandler)
+	server.daemon_threads = True
+	server.lock = threading.Lock()
+	server.n_connections = 0
+	server.n_requests = 0
+	server.n_agent_requests = 0
+	server.n_summary_requests = 0
+	server.n_errors = 0
+	server.usages = [] # of answered requests, as reported to client
+	server.cached_prompts = []
+	server.latency = latency
+	server.jitter = jitter # sec, uniformly random extra latency up to it
+	server.reply = reply
+	server.replies = replies # script of agents, cycled; None: reply to every request for agent
+	server.token_delay = token_delay # sec between streamed events
+	server.error_rate = error_rate # probability of answering with one of error_statuses instead
+	server.error_statuses = error_statuses
+	server.retry_after = retry_after # sec, sent with 429; None: not sent
+	server.rpm = rpm # requests per minute of account, beyond which 429 is answered with Retry-After; None: unlimited
+	server.rate_level = 0.0 # requests available
+	server.rate_t = time.monotonic()
+	server.n_throttled = 0
+	server.rng = random.Random(seed)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def load_script(filename):
+	with open(filename, 'r') as file:
+		return [agent_src.strip('\n') for agent_src in file.read().split(SCRIPT_SEPARATOR)]
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Local mock of LLM REST APIs')
+	parser.add_argument('--port', type=int, default=8080)
+	parser.add_argument('--latency', type=float, default=0.0, help='sec before answer')
+	parser.add_argument('--jitter', type=float, default=0.0, help='sec, uniformly random extra latency up to it')
+	parser.add_argument('--error-rate', type=float, default=0.0, help=f'probability of answering with one of HTTP statuses {ERROR_STATUSES[:-1]} or dropping connection')
+	parser.add_argument('--rpm', type=int, help='requests per minute, beyond which 429 is answered (default: unlimited)')
+	parser.add_argument('--script', metavar='FILE', help=f'agents to reply with in turn, separated by "{SCRIPT_SEPARATOR.strip()}" lines (default: built-in script)')
+	args = parser.parse_args()
+	server, base_url = start_mock_server(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, rpm=args.rpm, replies=(load_script(args.script) if (args.script is not None) else SCRIPTED_AGENTS))
+	print(f'Mock LLM server at {base_url} (Ctrl+C stops)')
+	try:
+		while True:
+			time.sleep(1)
+	except KeyboardInterrupt:
+		server.shutdown()
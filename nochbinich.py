@@ -36,16 +36,42 @@ except ImportError:
 	print('ERROR: "requests" module not found. Install it: "$ pip[3] install [--user] requests"')
 	exit(1)
 
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+import argparse
+import atexit
+import codecs
+import collections
 import curses
+import difflib
 import enum
+import gzip
+import hashlib
 import json
 import os
+import queue
+import re
+import resource
 import secrets
+import selectors
+import shutil
+import signal
+import socket
 import subprocess
+import sys
+import tempfile
+import threading
+import textwrap
 import time
+import traceback
+import warnings
+import zlib
 
 
-VERSION = '2025.02.25_1'
+VERSION = '2026.10.17_1'
 
 
 ## Examples of...
@@ -81,6 +107,20 @@ TERMINUS_PROMPT = f'Terminus: if your reply consists of single "{TERMINUS}" inst
  # Less than context window for chosen model (see model cards), surely,
  # but first, if using paid API provider, consider the _cost_ of too long prompts (see COST_... below and provider's pricing)
 SUMMARISATION_TOKENS_THRESHOLD = 20000
+# It is compared with prompt size predicted locally (see estimate_tokens()) before each request, so summarisation precedes oversized prompt
+
+SUMMARISATION_IN_BACKGROUND = True # when predicted prompt size nears threshold, summarise snapshot of conversation while agent runs
+SUMMARISATION_BACKGROUND_FRACTION = 0.8 # of SUMMARISATION_TOKENS_THRESHOLD, "near"
+
+SUMMARISATION_REQUEST = 'Please summarise the conversation up to now.'
+
+ # Rolling summarisation: last turns (execution results, request, agent) stay verbatim, only older ones
+ # are folded into summary, and summary of earlier summarisations is extended rather than summarised again
+SUMMARISATION_KEEP_TURNS = 2 # or 0 for summarisation of whole conversation each time
+SUMMARISATION_KEEP_FRACTION = 0.5 # of SUMMARISATION_TOKENS_THRESHOLD, at most for turns kept verbatim
+SUMMARY_MAX_FRACTION = 0.2 # of SUMMARISATION_TOKENS_THRESHOLD; when summary grows larger, next summarisation is of whole conversation again
+SUMMARISATION_APPEND_REQUEST = 'Please summarise the conversation after the summary at its beginning; your reply will be appended to that summary, so do not repeat it.'
+SUMMARY_PREFIX = '\nThis conversation started before and has been summarised'
 
 SUMMARISATION_PROMPT = 'Summarisation: if conversation begins with message about summary, it means that conversation started before and has been summarised by yourself at request of supervisor, perhaps several times, to limit the size of accumulated prompt.'
 
@@ -91,9 +131,31 @@ HINTS_PROMPT = 'Hints: you rely on feedback from agents; if necessary, you make
 
 STYLE_PROMPT = 'Style: The FINAL GOAL should be achieved in scientific style.' # None
 
-TIMEOUT = 60 # sec
+PATCH_REPLIES = False # True: next agent may be requested as patch against current one, to save completion tokens
+PATCH_PROMPT = 'Patches: when asked to "reply with next agent as patch", you may reply, instead of whole agent, with one or more blocks "<<<<<<< SEARCH\n" + lines of current agent + "=======\n" + lines replacing them + ">>>>>>> REPLACE\n", or with unified diff against current agent, and nothing else; if next agent differs from current one too much, you reply with whole next agent.'
+
+TIMEOUT = 60 # sec; on timeout, the whole process group of agent is killed, its children included
+
+# Budgets of each agent besides TIMEOUT, enforced by kernel via rlimits; when agent exceeds one, its execution results say which; None: unlimited
+AGENT_CPU_LIMIT = None # sec of CPU time, of all threads
+AGENT_MEMORY_LIMIT = None # bytes of address space (of memory, with AGENT_CGROUP)
+AGENT_FILE_SIZE_LIMIT = None # bytes, of any file written
+AGENT_PROCESS_LIMIT = None # without AGENT_CGROUP, it is limit for all processes of the user, supervisor's ones included, so run supervisor as dedicated user then
+AGENT_CGROUP = False # True: each agent runs in its own cgroup v2 under supervisor's one, where memory and process budgets apply to agent and all its children together, and which is killed as whole on timeout; supervisor's cgroup must be delegated to its user, e.g. "$ systemd-run --user --scope -p Delegate=yes python3 nochbinich.py"
+AGENT_CPU_QUOTA = None # cores, with AGENT_CGROUP
+
+BUDGETS_PROMPT = 'Besides timeout, each agent has budgets of CPU time, memory, file size, or number of processes, enforced by operating system; when agent exceeds one, its execution results say which.'
+
+BACKGROUND_WORKERS = False # True: agent may declare itself background worker, which supervisor keeps running across iterations instead of killing it on timeout; see WORKERS_PROMPT
+MAX_WORKERS = 4 # running at once, per lineage; agent declaring one more is not started
+WORKER_STARTUP = 5 # sec, waited after worker is started: its output until then (or until its exit) is its execution results
+WORKER_OUTPUT_SIZE_LIMIT = 2048 # bytes, of new stdout and of new stderr of each worker, in execution results of each agent
+WORKERS_DIRNAME = 'workers' # in workdir: source (NAME.py) and Unix socket (NAME.sock) of each worker; in lineage dir: its stdout and stderr (NAME.out, NAME.err)
+WORKERS_FILENAME = 'workers.json' # running workers, so that those left by supervisor that has not stopped them are killed when it starts again
+
+WORKERS_PROMPT = f'Background workers: agent whose first line is "# worker: NAME" (letters, digits, "_", "-") is not waited for until timeout, but is started as background worker NAME, which keeps running across iterations, until terminus, or until another worker with the same NAME replaces it; at most {MAX_WORKERS} of them run at once; execution results of worker are its output during first {WORKER_STARTUP} seconds, and execution results of each next agent include new output and resource usage of running workers; worker gets listening Unix socket as file descriptor in environment variable WORKER_FD ("socket.socket(fileno=int(os.environ[\'WORKER_FD\']))"), and later agents connect to it at path "{WORKERS_DIRNAME}/NAME.sock" relative to their working directory; budgets, if any, apply to whole life of worker.'
 
-SYSTEM_MESSAGE = f'Your responses are commentless Python code and nothing else, executable verbatim by Python interpreter in Linux, except when asked for summary of preceding conversation.\nYou get prompts that mostly are results - return code, standard output and standard error streams - of execution of Python scripts obtained from you and called agents.\nThese scripts are part of the following loop, already being run without human interaction by another script called supervisor: execute current agent, wait for its termination or {TIMEOUT} seconds timeout, send execution results to you, replace current agent with next one received from you.\nThe resulting sequential execution of agents has the following FINAL GOAL: "{FINAL_GOAL_PROMPT}"\nThe initial agent 0 consists of single "pass" instruction. When asked "please reply with next agent", you do as asked so that FINAL GOAL will be achieved as definitely and as quickly and as safely and as cheaply as possible.' + (f'\n{TERMINUS_PROMPT}' if (TERMINUS is not None) else '') + f'\n{SUMMARISATION_PROMPT}' + f'\n{JAILBREAK_PROMPT}' + f'\n{HINTS_PROMPT}' + (f'\n{STYLE_PROMPT}' if (STYLE_PROMPT is not None) else '')
+SYSTEM_MESSAGE = f'Your responses are commentless Python code and nothing else, executable verbatim by Python interpreter in Linux, except when asked for summary of preceding conversation.\nYou get prompts that mostly are results - return code, standard output and standard error streams - of execution of Python scripts obtained from you and called agents.\nThese scripts are part of the following loop, already being run without human interaction by another script called supervisor: execute current agent, wait for its termination or {TIMEOUT} seconds timeout, send execution results to you, replace current agent with next one received from you.\nThe resulting sequential execution of agents has the following FINAL GOAL: "{FINAL_GOAL_PROMPT}"\nThe initial agent 0 consists of single "pass" instruction. When asked "please reply with next agent", you do as asked so that FINAL GOAL will be achieved as definitely and as quickly and as safely and as cheaply as possible.' + (f'\n{TERMINUS_PROMPT}' if (TERMINUS is not None) else '') + f'\n{SUMMARISATION_PROMPT}' + f'\n{JAILBREAK_PROMPT}' + f'\n{HINTS_PROMPT}' + (f'\n{STYLE_PROMPT}' if (STYLE_PROMPT is not None) else '') + (f'\n{PATCH_PROMPT}' if PATCH_REPLIES else '') + (f'\n{BUDGETS_PROMPT}' if any(budget is not None for budget in [AGENT_CPU_LIMIT, AGENT_MEMORY_LIMIT, AGENT_FILE_SIZE_LIMIT, AGENT_PROCESS_LIMIT, AGENT_CPU_QUOTA]) else '') + (f'\n{WORKERS_PROMPT}' if BACKGROUND_WORKERS else '')
 
 
 class API_PROVIDERS(enum.Enum):
@@ -151,8 +213,31 @@ MAX_COMPLETION_TOKENS = None
 # 0x4000 - Grok-2, xAI # https://docs.x.ai/docs/guides/chat#parameters
 # ? - "your" model run by llama.cpp
 
+# Context windows, in tokens, see model cards; prompt predicted to exceed it (less completion tokens) triggers summarisation as well
+CONTEXT_WINDOW = {
+	API_PROVIDERS.AI21LABS : {'jamba-1.5-large' : 256000},
+	API_PROVIDERS.ANTHROPIC : {'claude-3-7-sonnet-latest' : 200000, 'claude-3-5-sonnet-latest' : 200000, 'claude-3-5-haiku-latest' : 200000},
+	API_PROVIDERS.DEEPSEEK : {'deepseek-chat' : 64000, 'deepseek-reasoner' : 64000},
+	API_PROVIDERS.FIREWORKSAI : {'deepseek-v3' : 131072, 'deepseek-r1' : 163840},
+	API_PROVIDERS.GOOGLE : {'gemini-1.5-pro-latest' : 2097152},
+	API_PROVIDERS.LEPTONAI : {'llama3-1-405b' : 128000},
+	API_PROVIDERS.LLAMA_CPP : {}, # depends on "your" model and llama-server's "-c"
+	API_PROVIDERS.MISTRALAI : {'mistral-large-latest' : 131072},
+	API_PROVIDERS.OPENAI : {'gpt-4o' : 128000, 'o3-mini' : 200000, 'o1-mini' : 128000, 'o1' : 200000},
+	API_PROVIDERS.XAI : {'grok-2' : 131072}
+}
+
 LLM_TIMEOUT = 120 # sec
 
+LLM_STREAMING = False # True: receive response as server-sent events, displaying it while it arrives
+
+LLM_RETRIES = 3 # extra attempts after HTTP status 429 or 5xx, or connection error, or timeout
+LLM_RETRY_BACKOFF = 2.0 # sec, doubled at each next attempt, unless provider sends "Retry-After"
+
+LLM_CASSETTE = None # 'record': each LLM request, its response, usage and timing are saved to cassette in LLM_CASSETTE_DIRNAME; 'replay': requests are answered from cassette, by hash of request, without API keys or network (cost is accounted as recorded, though nothing is paid); see "--record" and "--replay" options
+LLM_CASSETTE_DIRNAME = 'cassette'
+LLM_CASSETTE_LATENCY = True # replay: True: recorded latency is simulated (time to headers, then to end of response, streamed evenly); False: responses are immediate
+
 # See
 # https://www.ai21.com/pricing
 # https://www.anthropic.com/pricing#anthropic-api
@@ -178,17 +263,61 @@ COSTS_PER_TOKEN = {
 	API_PROVIDERS.XAI : {'grok-2' : [2e-6, 1e-5]}
 }
 
+PROMPT_CACHING = True # mark stable prefix of conversation for caching by provider where it has to be marked (Anthropic); others cache it automatically, if at all
+# Prompt tokens read from provider's cache, and written into it, are charged at these rates instead of PER-PROMPT-TOKEN;
+# for models not listed here, at PER-PROMPT-TOKEN
+# {'MODEL' : [PER-CACHED-PROMPT-TOKEN, PER-CACHE-WRITE-TOKEN]}
+COSTS_PER_CACHED_TOKEN = {
+	API_PROVIDERS.ANTHROPIC : {'claude-3-7-sonnet-latest' : [3e-7, 3.75e-6], 'claude-3-5-sonnet-latest' : [3e-7, 3.75e-6], 'claude-3-5-haiku-latest' : [8e-8, 1e-6]},
+	API_PROVIDERS.DEEPSEEK : {'deepseek-chat' : [7e-8, 2.7e-7], 'deepseek-reasoner' : [1.4e-7, 5.5e-7]},
+	API_PROVIDERS.GOOGLE : {'gemini-1.5-pro-latest' : [3.125e-7, 1.25e-6]},
+	API_PROVIDERS.OPENAI : {'gpt-4o' : [1.25e-6, 2.5e-6], 'o3-mini' : [5.5e-7, 1.1e-6], 'o1-mini' : [5.5e-7, 1.1e-6], 'o1' : [7.5e-6, 1.5e-5]}
+}
+
 STDOUTERR_SIZE_LIMIT = 8192 # in bytes, to prevent too large stdout/stderr from overflowing context window
+STDOUTERR_HEAD_SIZE = STDOUTERR_SIZE_LIMIT >> 1 # of these, kept from beginning of stream; the rest is kept from its end
+
+FEEDBACK_ENCODING = True # stdout or stderr identical to that of recent agent is sent as reference to it, nearly identical one as line diff against it, and repeated cycles of traceback frames are collapsed
+FEEDBACK_HISTORY = 8 # latest outputs, sent in full since last summarisation, that later ones may refer to
+FEEDBACK_MIN_TOKENS = 32 # shorter outputs are sent as they are
+FEEDBACK_DIFF_MAX_RATIO = 0.5 # diff is sent instead of output when it has at most this fraction of output's tokens
+FEEDBACK_MAX_CYCLE = 4 # frames in repeated cycle of traceback that is collapsed, when repeated 3+ times
 
-MESSAGES_FILENAME = 'messages.json'
+WARM_INTERPRETER = False # True: each agent runs in clean child forked from pre-started interpreter that has imported WARM_MODULES already, instead of new python3
+WARM_MODULES = ['json', 'urllib.request', 'requests'] # unavailable ones are skipped
+
+MESSAGES_FILENAME = 'messages.jsonl' # append-only, one JSON message per line
+LEGACY_MESSAGES_FILENAME = 'messages.json' # whole-list format of earlier versions, migrated at startup
 
 SUPERVISOR_LOG_FILENAME = 'supervisor.log'
 AGENT_LOG_FILENAME = 'agent.log'
 
 LINEAGE_DIRNAME = 'lineage'
+# Agents and results of their runs are kept in lineage dir as compressed blobs in one pack file, addressed by content
+# (identical ones are stored once), and index that maps agent number to them; see "extract" and "diff" commands
+LINEAGE_PACK_FILENAME = 'blobs.pack'
+LINEAGE_INDEX_FILENAME = 'index.jsonl'
+LINEAGE_COMPRESSION = 'zlib' # or 'zstd', which needs "zstandard" module ("$ pip[3] install [--user] zstandard"); zlib is used without it
+LINEAGE_DELTA_DEPTH = 16 # blob is compressed with previous one of its kind as dictionary (delta), up to this many in chain, then alone
+
+LOG_ROTATION_SIZE = 0x1000000 # bytes, over which supervisor and agent logs are rotated when iteration ends: log.1.gz, log.2.gz...; 0: never
+LOG_ROTATION_COUNT = 5 # compressed old logs kept
 
 COUNTERS_FILENAME = 'counters.json'
 
+METRICS_FILENAME = 'metrics.jsonl' # record per iteration: LLM calls, agent run, time, cost; see "report" command
+
+# Results of agents that left workdir unchanged are cached, keyed by agent source, goal, and workdir state;
+# identical agent run at the same workdir state gets them back without being run again; set False for goals
+# whose agents depend on anything else (network, time, files outside workdir...)
+RESULT_CACHE = False
+RESULT_CACHE_TTL = 3600 # sec, after which cached result is not used
+RESULT_CACHE_SIZE = 256 # results, least recently used ones are evicted
+RESULT_CACHE_FILENAME = 'result_cache.json'
+
+CALIBRATION_FILENAME = 'calibration.json' # ratios of actual prompt tokens to estimated ones, per provider and model
+TOKEN_CALIBRATION_RATE = 0.3 # weight of the latest ratio in moving average
+
 WORKDIRPATH = 'workdir'
 
 AGENT_FILENAME = 'agent.py'
@@ -199,8 +328,35 @@ API_PROVIDER = [API_PROVIDERS.ANTHROPIC, API_PROVIDERS.FIREWORKSAI, API_PROVIDER
 # If this list includes LLAMA_CPP, you need llama-server of llama.cpp or the like that runs the model of your choice and provides OpenAI-compatible API to it locally
 # Otherwise, you need account at corresponding API provider and API key... and money
 
+PROVIDER_ROUTING = False # True: instead of uniformly random choice, prefer provider that has been the fastest recently
+ROUTER_WINDOW = 20 # latest LLM calls per provider whose latencies are kept
+ROUTER_EXPLORATION = 0.1 # probability of choosing random healthy provider anyway, to keep statistics of others current
+CIRCUIT_BREAKER_FAILURES = 3 # consecutive failed LLM calls after which provider is not chosen...
+CIRCUIT_BREAKER_COOLDOWN = 300 # sec # ...for this time, then it is tried again
+
+HEDGING = False # True: if LLM call lasts longer than 95th percentile of latencies of its provider, the same request is sent to another provider; the first response wins, the other call is cancelled (but paid for)
+HEDGING_MIN_SAMPLES = 5 # latencies of provider needed to know its 95th percentile
+
+
+COST_LIMIT = 10.0 # $ # for all lineages of population together
+
+
+COORDINATOR = False # True: LLM calls of this supervisor, as of all others on this host that have it, go through coordinator process ("$ python3 nochbinich.py coordinator"), which grants them in turn by supervisor within RATE_LIMITS and COORDINATOR_COST_LIMIT of its own script, and is told actual usage of each
+COORDINATOR_SOCKET = '/tmp/nochbinich-coordinator.sock'
+COORDINATOR_COMPLETION_TOKENS = 1000 # reserved for response when MAX_COMPLETION_TOKENS is None; reservation is settled by actual usage
+COORDINATOR_COST_LIMIT = 100.0 # $ # for all supervisors via coordinator together, enforced by coordinator
+COORDINATOR_LEDGER_FILENAME = 'coordinator.json' # in coordinator's dir: settled cost, calls and tokens, kept across its restarts
+
+# {API_PROVIDERS.X : {'MODEL' : [REQUESTS-PER-MINUTE, TOKENS-PER-MINUTE]}}, as limits of provider accounts; None: unlimited
+RATE_LIMITS = { # enforced by coordinator as token buckets, shared by its supervisors; absent ones are unlimited
+	# API_PROVIDERS.ANTHROPIC : {'claude-3-7-sonnet-latest' : [50, 40000]},
+	# API_PROVIDERS.OPENAI : {'gpt-4o' : [500, 30000]},
+}
+RATE_LIMIT_BURST = 1.0 # sec of rate that may be used at once; providers enforce per-minute limits over shorter periods
+
 
-COST_LIMIT = 10.0 # $
+POPULATION_SIZE = 1 # K > 1: K independent lineages of agents run concurrently, each in its own POPULATION_DIRNAME/k subdirectory; first to reach terminus wins
+POPULATION_DIRNAME = 'population'
 
 
 # Get key(s) at
@@ -228,37 +384,100 @@ def get_secret_api_key(provider):
 	exit(1)
 
 
-def load_messages():
-	messages = []
-	try:
-		with open(MESSAGES_FILENAME, 'r') as file:
-			messages = json.loads(file.read())
-	except:
-		pass
-	return messages
+# Local token estimate: words (long ones count double), numbers by 3 digits, other symbols one by one
+TOKEN_RE = re.compile(r'\s?[A-Za-z]+|\d{1,3}|\s?[^\sA-Za-z\d]|\s+')
+LONG_WORD_RE = re.compile(r'[A-Za-z]{9,}')
+MESSAGE_OVERHEAD_TOKENS = 4 # role, delimiters
 
 
-def clear_messages():
-	with open(MESSAGES_FILENAME, 'w') as file:
-		file.write(json.dumps([]))
+def estimate_tokens(s):
+	return len(TOKEN_RE.findall(s)) + len(LONG_WORD_RE.findall(s))
 
 
-def add_message(role, content):
-	messages = load_messages()
-	with open(MESSAGES_FILENAME, 'w') as file:
-		file.write(json.dumps(messages + [{'role' : role, 'content' : content}]))
+def estimate_message_tokens(message):
+	return estimate_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
 
 
-def add_system_message(content):
-	add_message('system', content)
+def write_file_atomically(filename, data):
+	# Write-temp-then-rename, so that either old or new file survives a crash, never a torn one
+	tmp_filename = f'{filename}.tmp'
+	with open(tmp_filename, 'wb') as file:
+		file.write(data)
+		file.flush()
+		os.fsync(file.fileno())
+	os.replace(tmp_filename, filename)
+	try:
+		dir_fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+		try:
+			os.fsync(dir_fd)
+		finally:
+			os.close(dir_fd)
+	except OSError:
+		pass
+
 
+class MessageLog:
+	# Conversation as append-only JSON Lines file mirrored in memory: adding a message costs one fsync'ed line
+	# instead of reparsing and rewriting the whole history, and a crash can tear at most the last line
 
-def add_user_message(content):
-	add_message('user', content)
+	def __init__(self, filename, legacy_filename=None):
+		self.filename = filename
+		self.legacy_filename = legacy_filename
+		self.messages = None
+		self.n_tokens = 0 # estimated, kept up to date incrementally
 
+	def exists(self):
+		return os.path.isfile(self.filename) or ((self.legacy_filename is not None) and os.path.isfile(self.legacy_filename))
 
-def add_assistant_message(content):
-	add_message('assistant', content)
+	def migrate(self):
+		if (self.legacy_filename is None) or os.path.isfile(self.filename) or (not os.path.isfile(self.legacy_filename)):
+			return
+		try:
+			with open(self.legacy_filename, 'r') as file:
+				messages = json.loads(file.read())
+		except:
+			messages = []
+		self.rewrite(messages)
+		os.rename(self.legacy_filename, f'{self.legacy_filename}.migrated')
+
+	def load(self):
+		if self.messages is None:
+			self.migrate()
+			self.messages = []
+			try:
+				with open(self.filename, 'rb') as file:
+					data = file.read()
+			except FileNotFoundError:
+				data = b''
+			n_valid_bytes = 0
+			for line in data.splitlines(keepends=True):
+				if not line.endswith(b'\n'):
+					break # torn by crash during append
+				try:
+					self.messages.append(json.loads(line))
+				except ValueError:
+					break
+				n_valid_bytes += len(line)
+			self.n_tokens = sum(estimate_message_tokens(msg) for msg in self.messages)
+			if n_valid_bytes < len(data):
+				with open(self.filename, 'r+b') as file:
+					file.truncate(n_valid_bytes)
+		return self.messages
+
+	def append(self, message):
+		messages = self.load()
+		with open(self.filename, 'ab') as file:
+			file.write((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+			file.flush()
+			os.fsync(file.fileno())
+		messages.append(message)
+		self.n_tokens += estimate_message_tokens(message)
+
+	def rewrite(self, messages):
+		# Compaction
+		write_file_atomically(self.filename, ''.join(json.dumps(msg, ensure_ascii=False) + '\n' for msg in messages).encode('utf-8'))
+		self.messages = list(messages)
+		self.n_tokens = sum(estimate_message_tokens(msg) for msg in self.messages)
 
 
 def convert_to_google(messages):
@@ -269,11 +488,139 @@ def convert_system_to_developer(messages):
 	return [{'role' : 'developer' if (msg['role'] == 'system') else msg['role'], 'content' : msg['content']} for msg in messages]
 
 
-def get_llm_response(provider):
-	# Do you like spaghetti?
-	messages = load_messages()
-	api_base_url = API_BASE_URL[provider]
-	secret_api_key = get_secret_api_key(provider)
+# Time spent connecting (TCP and TLS) by current thread, measured by connections of ProviderClient's pools
+connect_timing = threading.local()
+
+
+def get_timed_connection_pool_class(pool_class):
+	class TimedConnection(pool_class.ConnectionCls):
+		def connect(self):
+			t_start = time.monotonic()
+			try:
+				super().connect()
+			finally:
+				connect_timing.duration = getattr(connect_timing, 'duration', 0.0) + (time.monotonic() - t_start)
+
+	class TimedConnectionPool(pool_class):
+		ConnectionCls = TimedConnection
+
+	return TimedConnectionPool
+
+
+class ProviderClient:
+	# Per-provider persistent HTTP session (keep-alive connection pool, TLS handshake once)
+	# with key, URL, and headers prepared once, and retries with exponential backoff
+
+	def __init__(self, provider):
+		self.provider = provider
+		self.model_id = MODEL_ID[provider]
+		api_base_url = API_BASE_URL[provider]
+		secret_api_key = get_secret_api_key(provider)
+		if provider == API_PROVIDERS.ANTHROPIC:
+			self.url = api_base_url
+			self.headers = {'x-api-key' : secret_api_key, 'anthropic-version' : '2023-06-01'}
+		elif provider == API_PROVIDERS.GOOGLE:
+			self.url = f'{api_base_url}/{self.model_id}:generateContent?key={secret_api_key}'
+			self.stream_url = f'{api_base_url}/{self.model_id}:streamGenerateContent?alt=sse&key={secret_api_key}'
+			self.headers = {}
+		else:
+			self.url = f'{api_base_url[0]}{self.model_id}{api_base_url[1]}' if (provider == API_PROVIDERS.LEPTONAI) else api_base_url
+			self.headers = {'Authorization' : f'Bearer {secret_api_key}'}
+			if provider == API_PROVIDERS.MISTRALAI:
+				self.headers.update({'Accept' : 'application/json'}) # ? works even without this...
+		if provider != API_PROVIDERS.GOOGLE:
+			self.stream_url = self.url
+		self.session = requests.Session()
+		self.session.headers.update(self.headers)
+		adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(POPULATION_SIZE, requests.adapters.DEFAULT_POOLSIZE)) # concurrent lineages share session
+		adapter.poolmanager.pool_classes_by_scheme = {scheme : get_timed_connection_pool_class(pool_class) for scheme, pool_class in adapter.poolmanager.pool_classes_by_scheme.items()}
+		self.session.mount('http://', adapter)
+		self.session.mount('https://', adapter)
+		self.n_retries = 0
+
+	def post(self, data, stream=False, reservation=None):
+		# Body is read when used, so that returned completion has time of connecting (all attempts), connect_duration,
+		# and time to its headers (first byte), ttfb; with reservation of coordinator, retry waits in its queue
+		t_start = time.monotonic()
+		connect_timing.duration = 0.0
+		delay = LLM_RETRY_BACKOFF
+		for i_attempt in range(LLM_RETRIES + 1):
+			is_last_attempt = i_attempt == LLM_RETRIES
+			is_throttled = False
+			try:
+				completion = self.session.post(self.stream_url if stream else self.url, json=data, timeout=LLM_TIMEOUT, stream=True)
+				ttfb = time.monotonic() - t_start
+				if not stream:
+					completion.content # whole body, as if not streamed; reading it may time out or break as well
+			except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+				if is_last_attempt:
+					raise
+				wait = delay
+			else:
+				if is_last_attempt or not ((completion.status_code == 429) or (completion.status_code >= 500)):
+					completion.ttfb = ttfb
+					completion.connect_duration = connect_timing.duration
+					completion.raise_for_status()
+					return completion
+				try:
+					wait = float(completion.headers['Retry-After'])
+				except (KeyError, ValueError):
+					wait = delay
+				is_throttled = completion.status_code == 429
+				completion.close()
+			self.n_retries += 1
+			if reservation is not None:
+				reservation.retry(wait, is_throttled)
+			else:
+				time.sleep(wait)
+			delay *= 2
+
+
+provider_clients = {}
+
+
+def get_provider_client(provider):
+	try:
+		return provider_clients[provider]
+	except KeyError:
+		client = ProviderClient(provider)
+		provider_clients[provider] = client
+		return client
+
+
+class StopRun(Exception):
+	# Raised from LLM call through iteration, to stop the run with reason of "stopped" event
+
+	reason = None
+
+
+class CoordinatorRefusal(StopRun):
+	reason = 'cost'
+
+
+class LLMCallCancelled(Exception):
+	# Streamed call abandoned midway, with usage known (or estimated) by then
+
+	def __init__(self, n_prompt_tokens, n_completion_tokens):
+		super().__init__('LLM call cancelled')
+		self.n_prompt_tokens = n_prompt_tokens
+		self.n_completion_tokens = n_completion_tokens
+
+
+def iter_sse_data(completion, lines=None):
+	# JSON payloads of "data:" lines of server-sent events; all lines are appended to lines, if given
+	for line in completion.iter_lines():
+		if lines is not None:
+			lines.append(line)
+		if line.startswith(b'data:'):
+			payload = line[5:].strip()
+			if payload == b'[DONE]':
+				break
+			if len(payload) > 0:
+				yield json.loads(payload)
+
+
+def get_llm_request_data(provider, messages):
 	model_id = MODEL_ID[provider]
 	# See
 	# https://docs.ai21.com/reference/jamba-15-api-ref
@@ -287,20 +634,22 @@ def get_llm_response(provider):
 	# https://docs.x.ai/docs/tutorial#step-3-make-your-first-request
 	# and https://requests.readthedocs.io/en/latest/
 	if provider == API_PROVIDERS.ANTHROPIC:
-		url = api_base_url
-		headers = {'x-api-key' : secret_api_key, 'anthropic-version' : '2023-06-01'}
 		data = {
 			'model' : model_id,
 			'system' : messages[0]['content'],
 			'messages' : messages[1:]
 		}
+		if PROMPT_CACHING:
+			# Breakpoints after system message, stable for the whole run, and after the last message, so that
+			# next request, which extends this one, reads the prefix written now
+			data['system'] = [{'type' : 'text', 'text' : messages[0]['content'], 'cache_control' : {'type' : 'ephemeral'}}]
+			if len(messages) > 1:
+				data['messages'] = messages[1:-1] + [{'role' : messages[-1]['role'], 'content' : [{'type' : 'text', 'text' : messages[-1]['content'], 'cache_control' : {'type' : 'ephemeral'}}]}]
 		if TEMPERATURE is not None:
 			data.update({'temperature' : TEMPERATURE}) # no "+=" for dicts
 		data.update({'max_tokens' : MAX_COMPLETION_TOKENS if (MAX_COMPLETION_TOKENS is not None) else 0x2000}) # must be specified explicitly, else HTTPError
 
 	elif provider == API_PROVIDERS.GOOGLE:
-		url = f'{api_base_url}/{model_id}:generateContent?key={secret_api_key}'
-		headers = {}
 		messages = convert_to_google(messages)
 		data = {			
 			'system_instruction' : {'parts' : {'text' : messages[0]['parts'][0]['text']}},
@@ -315,10 +664,6 @@ def get_llm_response(provider):
 			data.update({'generationConfig' : generationConfig})
 
 	else:
-		url = f'{api_base_url[0]}{model_id}{api_base_url[1]}' if (provider == API_PROVIDERS.LEPTONAI) else api_base_url
-		headers = {'Authorization' : f'Bearer {secret_api_key}'}
-		if provider == API_PROVIDERS.MISTRALAI:
-			headers.update({'Accept' : 'application/json'}) # ? works even without this...
 		if provider == API_PROVIDERS.OPENAI:
 			if model_id in {'o3-mini', 'o1-mini', 'o1'}:
 				messages = convert_system_to_user(messages)
@@ -331,29 +676,616 @@ def get_llm_response(provider):
 		if MAX_COMPLETION_TOKENS is not None:
 			max_tokens_prm_name = 'max_completion_tokens' if (provider in {API_PROVIDERS.FIREWORKSAI, API_PROVIDERS.OPENAI}) else 'max_tokens'
 			data.update({max_tokens_prm_name : MAX_COMPLETION_TOKENS})
+		if LLM_STREAMING and (provider in {API_PROVIDERS.DEEPSEEK, API_PROVIDERS.LLAMA_CPP, API_PROVIDERS.OPENAI, API_PROVIDERS.XAI}):
+			data.update({'stream_options' : {'include_usage' : True}}) # others send usage in last chunk anyway
 
-	completion = requests.post(url, headers=headers, json=data, timeout=LLM_TIMEOUT)
-	# print(completion.json()) # DEBUG
-	completion.raise_for_status()
-	jc = completion.json()
+	if LLM_STREAMING and (provider != API_PROVIDERS.GOOGLE):
+		data.update({'stream' : True})
 
-	if provider == API_PROVIDERS.ANTHROPIC:
-		response = jc['content'][0]['text']
-		n_prompt_tokens = jc['usage']['input_tokens']
-		n_completion_tokens = jc['usage']['output_tokens']
+	return data
 
-	elif provider == API_PROVIDERS.GOOGLE:
-		response = jc['candidates'][0]['content']['parts'][0]['text']
-		n_prompt_tokens = jc['usageMetadata']['promptTokenCount']
-		n_completion_tokens = jc['usageMetadata']['candidatesTokenCount']
+
+def get_llm_response(provider, messages, on_delta=None, cancel=None):
+	# With COORDINATOR, capacity is reserved before request is sent, and settled by actual usage afterwards
+	if (not COORDINATOR) or (LLM_CASSETTE == 'replay'):
+		return request_llm_response(provider, messages, on_delta, cancel)
+	n_completion_tokens = MAX_COMPLETION_TOKENS if (MAX_COMPLETION_TOKENS is not None) else COORDINATOR_COMPLETION_TOKENS
+	reservation = CoordinatorReservation(provider, sum(len(message['content']) for message in messages) >> 2, n_completion_tokens) # ~4 chars per token
+	try:
+		result = request_llm_response(provider, messages, on_delta, cancel, reservation)
+	except LLMCallCancelled as exception:
+		reservation.settle(exception.n_prompt_tokens, exception.n_completion_tokens)
+		raise
+	except Exception:
+		reservation.settle(0, 0)
+		raise
+	reservation.settle(result[1], result[2], result[3])
+	result[3]['queued'] = reservation.queued
+	return result
+
+
+def request_llm_response(provider, messages, on_delta=None, cancel=None, reservation=None):
+	# Do you like spaghetti?
+	data = get_llm_request_data(provider, messages)
+
+	t_start = time.monotonic()
+	t_first_token = None
+
+	is_recording = LLM_CASSETTE == 'record'
+	lines = [] if (is_recording and LLM_STREAMING) else None # of server-sent events, as received
+	if LLM_CASSETTE == 'replay':
+		completion = get_cassette().replay(provider, data, LLM_STREAMING)
+	else:
+		completion = get_provider_client(provider).post(data, stream=LLM_STREAMING, reservation=reservation)
+
+	if LLM_STREAMING:
+		# Usage is taken from the last event that has it
+		deltas = []
+		n_prompt_tokens = 0
+		n_completion_tokens = 0
+		usage = {}
+		for jc in iter_sse_data(completion, lines):
+			delta = ''
+			if provider == API_PROVIDERS.ANTHROPIC:
+				if jc['type'] == 'message_start':
+					usage = jc['message']['usage']
+					n_prompt_tokens = usage['input_tokens']
+					n_completion_tokens = usage.get('output_tokens', 0)
+				elif jc['type'] == 'content_block_delta':
+					delta = jc['delta'].get('text', '')
+				elif jc['type'] == 'message_delta':
+					n_completion_tokens = jc['usage']['output_tokens']
+				elif jc['type'] == 'error':
+					raise requests.HTTPError(jc['error']['message'], response=completion)
+
+			elif provider == API_PROVIDERS.GOOGLE:
+				try:
+					delta = ''.join(part.get('text', '') for part in jc['candidates'][0]['content']['parts'])
+				except (KeyError, IndexError):
+					pass
+				if 'usageMetadata' in jc:
+					usage = jc['usageMetadata']
+					n_prompt_tokens = usage.get('promptTokenCount', n_prompt_tokens)
+					n_completion_tokens = usage.get('candidatesTokenCount', n_completion_tokens)
+
+			else:
+				if len(jc.get('choices', [])) > 0:
+					delta = jc['choices'][0].get('delta', {}).get('content') or ''
+				if jc.get('usage') is not None:
+					usage = jc['usage']
+					n_prompt_tokens = usage['prompt_tokens']
+					n_completion_tokens = usage['completion_tokens']
+
+			if len(delta) > 0:
+				if t_first_token is None:
+					t_first_token = time.monotonic()
+				deltas.append(delta)
+				if on_delta is not None:
+					on_delta(delta)
+
+			if (cancel is not None) and cancel.is_set():
+				completion.close()
+				raise LLMCallCancelled(n_prompt_tokens, max(n_completion_tokens, sum(len(delta) for delta in deltas) >> 2)) # ~4 chars per token
+		response = ''.join(deltas)
 
 	else:
-		response = jc['choices'][0]['message']['content']
-		n_prompt_tokens = jc['usage']['prompt_tokens']
-		n_completion_tokens = jc['usage']['completion_tokens']
+		# print(completion.json()) # DEBUG
+		jc = completion.json()
+
+		if provider == API_PROVIDERS.ANTHROPIC:
+			response = jc['content'][0]['text']
+			usage = jc['usage']
+			n_prompt_tokens = usage['input_tokens']
+			n_completion_tokens = usage['output_tokens']
+
+		elif provider == API_PROVIDERS.GOOGLE:
+			response = jc['candidates'][0]['content']['parts'][0]['text']
+			usage = jc['usageMetadata']
+			n_prompt_tokens = usage['promptTokenCount']
+			n_completion_tokens = usage['candidatesTokenCount']
+
+		else:
+			response = jc['choices'][0]['message']['content']
+			usage = jc['usage']
+			n_prompt_tokens = usage['prompt_tokens']
+			n_completion_tokens = usage['completion_tokens']
 
-	add_assistant_message(response)
-	return response, n_prompt_tokens, n_completion_tokens
+	# Cached prompt tokens; Anthropic counts them apart from input_tokens, others include them in prompt tokens
+	if provider == API_PROVIDERS.ANTHROPIC:
+		n_cached_tokens = usage.get('cache_read_input_tokens') or 0
+		n_cache_write_tokens = usage.get('cache_creation_input_tokens') or 0
+		n_prompt_tokens += n_cached_tokens + n_cache_write_tokens
+	elif provider == API_PROVIDERS.GOOGLE:
+		n_cached_tokens = usage.get('cachedContentTokenCount') or 0
+		n_cache_write_tokens = 0
+	else: # DeepSeek has its own field
+		n_cached_tokens = usage.get('prompt_cache_hit_tokens') or (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+		n_cache_write_tokens = 0
+
+	t_end = time.monotonic()
+	stats = {'latency' : t_end - t_start, 'connect' : completion.connect_duration, 'ttfb' : completion.ttfb, 'ttft' : None, 'tokens_per_sec' : None, 'n_cached_tokens' : n_cached_tokens, 'n_cache_write_tokens' : n_cache_write_tokens}
+	if t_first_token is not None:
+		stats['ttft'] = t_first_token - t_start
+		if t_end > t_first_token:
+			stats['tokens_per_sec'] = n_completion_tokens / (t_end - t_first_token)
+
+	if is_recording:
+		get_cassette().record(provider, data, LLM_STREAMING, (b''.join(line + b'\n' for line in lines) if LLM_STREAMING else completion.content), n_prompt_tokens, n_completion_tokens, stats)
+
+	return response, n_prompt_tokens, n_completion_tokens, stats
+
+
+class Router:
+	# Chooses provider for LLM calls by rolling statistics of their latencies and failures (circuit breaker),
+	# and hedges slow calls by sending the same request to another provider
+
+	def __init__(self, providers):
+		self.providers = list(providers)
+		self.lock = threading.Lock()
+		self.latencies = {provider : collections.deque(maxlen=ROUTER_WINDOW) for provider in self.providers}
+		self.n_failures = {provider : 0 for provider in self.providers} # consecutive
+		self.t_closed = {provider : 0.0 for provider in self.providers} # when circuit breaker lets provider be chosen again
+		self.token_ratios = {} # actual prompt tokens per estimated one, by f'{provider.value} :: {model}'
+
+	def load_calibration(self, filename=CALIBRATION_FILENAME):
+		try:
+			with open(filename, 'r') as file:
+				self.token_ratios.update(json.loads(file.read()))
+		except:
+			pass
+
+	def save_calibration(self, filename=CALIBRATION_FILENAME):
+		with self.lock:
+			with open(filename, 'w') as file:
+				file.write(json.dumps(self.token_ratios))
+
+	def predict_prompt_tokens(self, provider, n_estimated_tokens):
+		return round(self.token_ratios.get(f'{provider.value} :: {MODEL_ID[provider]}', 1.0) * n_estimated_tokens)
+
+	def record_prompt_tokens(self, provider, n_estimated_tokens, n_prompt_tokens):
+		# Exponential moving average, so that calibration follows provider's tokenizer and prompt format
+		if (n_estimated_tokens <= 0) or (n_prompt_tokens <= 0):
+			return
+		key = f'{provider.value} :: {MODEL_ID[provider]}'
+		with self.lock:
+			ratio = n_prompt_tokens / n_estimated_tokens
+			self.token_ratios[key] = ratio if (key not in self.token_ratios) else ((1 - TOKEN_CALIBRATION_RATE) * self.token_ratios[key] + TOKEN_CALIBRATION_RATE * ratio)
+
+	def is_healthy(self, provider):
+		return time.monotonic() >= self.t_closed[provider]
+
+	def record_success(self, provider, latency):
+		with self.lock:
+			self.latencies[provider].append(latency)
+			self.n_failures[provider] = 0
+
+	def record_failure(self, provider):
+		with self.lock:
+			self.n_failures[provider] += 1
+			if self.n_failures[provider] >= CIRCUIT_BREAKER_FAILURES:
+				self.t_closed[provider] = time.monotonic() + CIRCUIT_BREAKER_COOLDOWN
+
+	def get_latency_percentile(self, provider, q):
+		with self.lock:
+			latencies = sorted(self.latencies[provider])
+		if len(latencies) == 0:
+			return None
+		return latencies[int(q * (len(latencies) - 1))]
+
+	def choose(self, exclude=()):
+		candidates = [provider for provider in self.providers if provider not in exclude]
+		healthy = [provider for provider in candidates if self.is_healthy(provider)]
+		if len(healthy) == 0:
+			if (len(candidates) == 0) or (len(exclude) > 0):
+				return None
+			healthy = candidates # all circuits open, still something must be called
+		if not PROVIDER_ROUTING:
+			return secrets.choice(healthy)
+		untried = [provider for provider in healthy if len(self.latencies[provider]) == 0]
+		if len(untried) > 0:
+			return secrets.choice(untried)
+		if secrets.randbelow(1000) < 1000 * ROUTER_EXPLORATION:
+			return secrets.choice(healthy)
+		return min(healthy, key=lambda provider: self.get_latency_percentile(provider, 0.5))
+
+	def call_provider(self, provider, messages, on_delta=None, cancel=None):
+		try:
+			result = get_llm_response(provider, messages, on_delta, cancel)
+		except (LLMCallCancelled, StopRun):
+			raise
+		except Exception:
+			self.record_failure(provider)
+			raise
+		self.record_success(provider, result[3]['latency'])
+		return result
+
+	def call(self, provider, messages, on_delta=None, on_extra_cost=None):
+		# Returns provider that has responded, its response, numbers of prompt and completion tokens, and stats;
+		# cost of cancelled hedged call is passed to on_extra_cost() whenever it becomes known
+		budget = None
+		if LLM_CASSETTE == 'replay':
+			# Provider that answered this request when it was recorded, which need not be the chosen one
+			provider = next((candidate for candidate in [provider] + self.providers if get_cassette().find(candidate, get_llm_request_data(candidate, messages), LLM_STREAMING) is not None), provider)
+		elif HEDGING and (len(self.latencies[provider]) >= HEDGING_MIN_SAMPLES):
+			budget = self.get_latency_percentile(provider, 0.95)
+		if budget is None:
+			response, n_prompt_tokens, n_completion_tokens, stats = self.call_provider(provider, messages, on_delta)
+			stats['hedged_provider'] = None
+			return provider, response, n_prompt_tokens, n_completion_tokens, stats
+
+		results = queue.Queue()
+		cancels = {}
+		is_won = threading.Event()
+
+		def attempt(attempt_provider, attempt_on_delta):
+			cancel = cancels[attempt_provider]
+			try:
+				result = self.call_provider(attempt_provider, messages, attempt_on_delta, cancel)
+			except LLMCallCancelled as exception:
+				if on_extra_cost is not None:
+					on_extra_cost(get_cost(attempt_provider, exception.n_prompt_tokens, exception.n_completion_tokens))
+				return
+			except Exception as exception:
+				results.put((attempt_provider, None, exception))
+				return
+			if is_won.is_set():
+				# Too late, but paid for
+				if on_extra_cost is not None:
+					on_extra_cost(get_cost(attempt_provider, result[1], result[2], result[3]))
+			else:
+				results.put((attempt_provider, result, None))
+
+		cancels[provider] = threading.Event()
+		threading.Thread(target=attempt, args=(provider, on_delta), daemon=True).start()
+		n_attempts = 1
+		hedged_provider = None
+		try:
+			first = results.get(timeout=budget)
+		except queue.Empty:
+			hedged_provider = self.choose(exclude={provider})
+			if hedged_provider is not None:
+				cancels[hedged_provider] = threading.Event()
+				threading.Thread(target=attempt, args=(hedged_provider, None), daemon=True).start()
+				n_attempts += 1
+			first = results.get()
+		# The first successful response wins, failure of one attempt leaves the other one
+		while (first[2] is not None) and (n_attempts > 1):
+			n_attempts -= 1
+			first = results.get()
+		is_won.set()
+		winner, result, exception = first
+		for attempt_provider, cancel in cancels.items():
+			if attempt_provider != winner:
+				cancel.set()
+		if exception is not None:
+			raise exception
+		response, n_prompt_tokens, n_completion_tokens, stats = result
+		stats['hedged_provider'] = hedged_provider
+		return winner, response, n_prompt_tokens, n_completion_tokens, stats
+
+
+class CoordinatorReservation:
+	# Capacity of provider's model for one LLM call (and its retries), granted by coordinator after waiting
+	# in its queue; the connection lasts until actual usage is settled, and coordinator settles it by reservation
+	# if supervisor is gone before that
+
+	def __init__(self, provider, n_prompt_tokens, n_completion_tokens):
+		self.provider = provider
+		t = time.monotonic()
+		self.conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.conn.connect(COORDINATOR_SOCKET)
+		self.conn_file = self.conn.makefile('rb')
+		self.request({'op' : 'reserve', 'client' : f'{os.getpid()} {os.getcwd()}', 'provider' : provider.value, 'model' : MODEL_ID[provider],
+			'tokens' : n_prompt_tokens + n_completion_tokens, 'cost' : get_cost(provider, n_prompt_tokens, n_completion_tokens)})
+		self.queued = time.monotonic() - t # sec, before request is sent; waits of retries are part of latency of call
+
+	def send(self, msg):
+		self.conn.sendall((json.dumps(msg) + '\n').encode('utf-8'))
+
+	def request(self, msg):
+		# Returns when granted
+		self.send(msg)
+		line = self.conn_file.readline()
+		if len(line) == 0:
+			self.close()
+			raise ConnectionError('Coordinator has closed connection')
+		reply = json.loads(line)
+		if not reply['granted']:
+			self.close()
+			raise CoordinatorRefusal(reply['reason'])
+
+	def retry(self, wait, is_throttled):
+		# After failed attempt: 429 pauses provider's model for all supervisors for wait, other failures delay only this call
+		self.request({'op' : 'retry', 'wait' : wait, 'is_throttled' : is_throttled})
+
+	def settle(self, n_prompt_tokens, n_completion_tokens, llm_stats=None):
+		try:
+			self.send({'op' : 'settle', 'tokens' : n_prompt_tokens + n_completion_tokens, 'cost' : get_cost(self.provider, n_prompt_tokens, n_completion_tokens, llm_stats)})
+		except OSError:
+			pass
+		self.close()
+
+	def close(self):
+		self.conn_file.close()
+		self.conn.close()
+
+
+class TokenBucket:
+	# Refilled continuously at rate per minute, up to RATE_LIMIT_BURST of it; more than that can be taken from full
+	# bucket, and settled usage above reservation takes level below zero, so that later ones wait for it
+
+	def __init__(self, per_minute):
+		self.rate = per_minute / 60
+		self.capacity = self.rate * RATE_LIMIT_BURST
+		self.level = self.capacity
+		self.t = time.monotonic()
+
+	def refill(self, t):
+		self.level = min(self.capacity, self.level + (t - self.t) * self.rate)
+		self.t = t
+
+	def get_wait(self, n, t):
+		# Sec until n can be taken
+		self.refill(t)
+		return max(0.0, (min(n, self.capacity) - self.level) / self.rate)
+
+	def take(self, n):
+		self.level -= n
+
+	def give(self, n):
+		self.level = min(self.capacity, self.level + n)
+
+
+class Coordinator:
+	# Daemon shared by supervisors on this host via Unix socket, connection per LLM call, JSON Lines: "reserve" (request
+	# and tokens of provider's model, estimated cost) waits until granted; "retry" after failed attempt waits again;
+	# "settle" tells actual usage; "status" gets state. Waiting reservations of each model are granted one per
+	# supervisor in turn (round robin), when they fit its buckets of RATE_LIMITS and settled cost with that of calls
+	# in progress fits COORDINATOR_COST_LIMIT; reservation that does not fit it alone is refused. 429 of provider
+	# pauses the model for everybody
+
+	def __init__(self, socket_path=COORDINATOR_SOCKET, ledger_filename=COORDINATOR_LEDGER_FILENAME):
+		self.socket_path = socket_path
+		self.ledger_filename = ledger_filename
+		self.ledger = {'cost' : 0.0, 'n_calls' : 0, 'n_tokens' : 0, 'n_refusals' : 0, 'models' : {}}
+		try:
+			with open(ledger_filename, 'r') as file:
+				self.ledger.update(json.loads(file.read()))
+		except FileNotFoundError:
+			pass
+		self.n_reserved = 0 # calls in progress, granted and not settled yet
+		self.reserved_cost = 0.0 # of them
+		self.buckets = {} # key -> [requests bucket, tokens bucket], None where unlimited
+		self.t_paused = {} # key -> time until which model is throttled
+		self.queues = {} # key -> {client : deque of waiting connections}, in order of turns
+		self.conns = {} # connection -> its state
+		self.selector = selectors.DefaultSelector()
+		self.n_grants = 0
+		self.t_queued = 0.0 # sec, of all grants
+
+	def get_buckets(self, key, provider, model):
+		if key not in self.buckets:
+			try:
+				limits = RATE_LIMITS.get(API_PROVIDERS(provider), {}).get(model, [None, None])
+			except ValueError:
+				limits = [None, None]
+			self.buckets[key] = [(TokenBucket(limit) if (limit is not None) else None) for limit in limits]
+		return self.buckets[key]
+
+	def save_ledger(self):
+		write_file_atomically(self.ledger_filename, json.dumps(self.ledger, indent=1).encode('utf-8'))
+
+	def reply(self, conn, msg):
+		try:
+			conn.sendall((json.dumps(msg) + '\n').encode('utf-8'))
+		except OSError:
+			pass # connection is dropped when it is read
+
+	def is_granted(self, conn):
+		# Reservation of connection is granted, neither settled nor queued again for retry
+		state = self.conns[conn]
+		return state.get('is_reserved', False) and (not state.get('is_settled', False)) and (conn not in self.queues.get(state['key'], {}).get(state['client'], ()))
+
+	def handle(self, conn, msg):
+		# Raises ValueError, KeyError or TypeError on malformed message, or on one out of order: reservation per connection,
+		# then retries and settlement of it once granted
+		state = self.conns[conn]
+		t = time.monotonic()
+		if msg['op'] == 'reserve':
+			if 'key' in state:
+				raise ValueError('second reservation on connection')
+			provider, model, client, n_tokens, cost = str(msg['provider']), str(msg['model']), str(msg['client']), int(msg['tokens']), float(msg['cost'])
+			if self.ledger['cost'] + cost > COORDINATOR_COST_LIMIT:
+				self.refuse(conn)
+				return
+			key = f'{provider} :: {model}'
+			self.get_buckets(key, provider, model)
+			state.update({'client' : client, 'key' : key, 'tokens' : n_tokens, 'cost' : cost, 'not_before' : t, 't_queued' : t, 'is_reserved' : False})
+			self.queues.setdefault(key, {}).setdefault(client, collections.deque()).append(conn)
+		elif msg['op'] == 'retry':
+			# Tokens of failed attempt were not used
+			if not self.is_granted(conn):
+				raise ValueError('retry without granted reservation')
+			wait, is_throttled = float(msg['wait']), bool(msg['is_throttled'])
+			key = state['key']
+			if self.buckets[key][1] is not None:
+				self.buckets[key][1].give(state['tokens'])
+			if is_throttled:
+				self.t_paused[key] = max(self.t_paused.get(key, 0.0), t + wait)
+				if self.buckets[key][0] is not None:
+					self.buckets[key][0].refill(t)
+					self.buckets[key][0].level = min(self.buckets[key][0].level, 0.0) # provider has less than supposed
+			state.update({'not_before' : (t if is_throttled else (t + wait)), 't_queued' : t})
+			self.queues.setdefault(key, {}).setdefault(state['client'], collections.deque()).appendleft(conn)
+		elif msg['op'] == 'settle':
+			if not self.is_granted(conn):
+				raise ValueError('settlement without granted reservation')
+			self.settle(state, int(msg['tokens']), float(msg['cost']))
+		elif msg['op'] == 'status':
+			self.reply(conn, self.get_status())
+		else:
+			raise ValueError(f'unknown op {msg["op"]!r}')
+
+	def refuse(self, conn):
+		self.ledger['n_refusals'] += 1
+		self.reply(conn, {'granted' : False, 'reason' : f'Cost of all supervisors via coordinator (${self.ledger["cost"]:.2f} settled) would exceed limit ${COORDINATOR_COST_LIMIT:.2f}.'})
+
+	def settle(self, state, n_tokens, cost):
+		key = state['key']
+		if self.buckets[key][1] is not None:
+			if n_tokens < state['tokens']:
+				self.buckets[key][1].give(state['tokens'] - n_tokens)
+			else:
+				self.buckets[key][1].take(n_tokens - state['tokens'])
+		self.n_reserved -= 1
+		self.reserved_cost = (self.reserved_cost - state['cost']) if (self.n_reserved > 0) else 0.0
+		for ledger in [self.ledger, self.ledger['models'].setdefault(key, {'cost' : 0.0, 'n_calls' : 0, 'n_tokens' : 0})]:
+			ledger['cost'] += cost
+			ledger['n_calls'] += 1
+			ledger['n_tokens'] += n_tokens
+		state['is_settled'] = True
+		self.save_ledger()
+
+	def drop(self, conn):
+		state = self.conns.pop(conn)
+		self.selector.unregister(conn)
+		conn.close()
+		if ('key' in state) and not state.get('is_settled', False):
+			queue = self.queues.get(state['key'], {}).get(state['client'], ())
+			if conn in queue:
+				queue.remove(conn)
+				if len(queue) == 0:
+					del self.queues[state['key']][state['client']]
+			if state['is_reserved']:
+				self.settle(state, state['tokens'], state['cost']) # supervisor gone during call: as reserved
+
+	def grant(self, key, t):
+		# Returns sec until the next waiting reservation of model may be granted, or None
+		queue = self.queues[key]
+		requests_bucket, tokens_bucket = self.buckets[key]
+		while len(queue) > 0:
+			if self.t_paused.get(key, 0.0) > t:
+				return self.t_paused[key] - t
+			wait = None
+			for client, conns in queue.items():
+				conn = conns[0]
+				state = self.conns[conn]
+				if state['not_before'] > t:
+					wait = min(wait, state['not_before'] - t) if (wait is not None) else (state['not_before'] - t)
+					continue # retry of this supervisor later, next one's turn
+				is_refused = False
+				if (not state['is_reserved']) and (self.ledger['cost'] + self.reserved_cost + state['cost'] > COORDINATOR_COST_LIMIT):
+					if self.n_reserved > 0:
+						continue # until calls in progress, retries of others included, are settled
+					is_refused = True
+				bucket_wait = max((requests_bucket.get_wait(1, t) if (requests_bucket is not None) else 0.0), (tokens_bucket.get_wait(state['tokens'], t) if (tokens_bucket is not None) else 0.0))
+				if (bucket_wait > 0) and not is_refused:
+					return min(wait, bucket_wait) if (wait is not None) else bucket_wait # the one whose turn it is waits, and everybody after it
+				conns.popleft()
+				del queue[client]
+				if len(conns) > 0:
+					queue[client] = conns # turn passes to the next supervisor
+				if is_refused:
+					self.refuse(conn)
+					break
+				if requests_bucket is not None:
+					requests_bucket.take(1)
+				if tokens_bucket is not None:
+					tokens_bucket.take(state['tokens'])
+				if not state['is_reserved']:
+					state['is_reserved'] = True
+					self.n_reserved += 1
+					self.reserved_cost += state['cost']
+				self.n_grants += 1
+				self.t_queued += t - state['t_queued']
+				self.reply(conn, {'granted' : True})
+				break
+			else:
+				return wait
+		return None
+
+	def get_status(self):
+		t = time.monotonic()
+		models = {}
+		for key, (requests_bucket, tokens_bucket) in self.buckets.items():
+			for bucket in [requests_bucket, tokens_bucket]:
+				if bucket is not None:
+					bucket.refill(t)
+			models[key] = {'waiting' : sum(len(conns) for conns in self.queues.get(key, {}).values()), 'supervisors_waiting' : len(self.queues.get(key, {})),
+				'paused' : max(0.0, self.t_paused.get(key, 0.0) - t),
+				'requests_available' : (requests_bucket.level if (requests_bucket is not None) else None), 'tokens_available' : (tokens_bucket.level if (tokens_bucket is not None) else None)}
+		return {'ledger' : self.ledger, 'cost_limit' : COORDINATOR_COST_LIMIT, 'reserved_cost' : self.reserved_cost, 'n_connections' : len(self.conns), 'n_grants' : self.n_grants,
+			'mean_queued' : (self.t_queued / self.n_grants) if (self.n_grants > 0) else None, 'models' : models}
+
+	def serve(self):
+		listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			listener.connect(self.socket_path)
+		except (FileNotFoundError, ConnectionRefusedError):
+			pass
+		else:
+			raise RuntimeError(f'Coordinator is running already at {self.socket_path}')
+		listener.close()
+		listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			os.remove(self.socket_path) # of coordinator that has crashed
+		except FileNotFoundError:
+			pass
+		listener.bind(self.socket_path)
+		listener.listen(256)
+		self.selector.register(listener, selectors.EVENT_READ)
+		try:
+			while True:
+				t = time.monotonic()
+				waits = [wait for wait in (self.grant(key, t) for key in list(self.queues)) if wait is not None]
+				for key in [key for key, queue in self.queues.items() if len(queue) == 0]:
+					del self.queues[key]
+				for selector_key, _ in self.selector.select(min(waits) if (len(waits) > 0) else None):
+					if selector_key.fileobj is listener:
+						conn, _ = listener.accept()
+						self.conns[conn] = {'buffer' : b''}
+						self.selector.register(conn, selectors.EVENT_READ)
+						continue
+					conn = selector_key.fileobj
+					try:
+						data = conn.recv(0x10000)
+					except OSError:
+						data = b''
+					if len(data) == 0:
+						self.drop(conn)
+						continue
+					state = self.conns[conn]
+					state['buffer'] += data
+					while b'\n' in state['buffer']:
+						line, state['buffer'] = state['buffer'].split(b'\n', 1)
+						try:
+							self.handle(conn, json.loads(line))
+						except (ValueError, KeyError, TypeError):
+							self.drop(conn) # only this connection; its granted reservation, if any, is settled as reserved
+							break
+		finally:
+			listener.close()
+			os.remove(self.socket_path)
+
+
+def get_coordinator_status(socket_path=COORDINATOR_SOCKET):
+	conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	conn.connect(socket_path)
+	with conn, conn.makefile('rb') as conn_file:
+		conn.sendall(b'{"op" : "status"}\n')
+		return json.loads(conn_file.readline())
+
+
+def print_coordinator_status(socket_path=COORDINATOR_SOCKET):
+	status = get_coordinator_status(socket_path)
+	ledger = status['ledger']
+	print(f'Cost ${ledger["cost"]:.4f} settled + ${status["reserved_cost"]:.4f} reserved of limit ${status["cost_limit"]:.2f}; {ledger["n_calls"]} calls, {ledger["n_tokens"]} tokens, {ledger["n_refusals"]} refused')
+	print(f'{status["n_connections"]} connections; {status["n_grants"]} grants since start' + (f', queued {status["mean_queued"]:.2f} s on average' if (status['mean_queued'] is not None) else ''))
+	if len(status['models']) > 0:
+		print(f'{"model":<40}{"waiting":>9}{"supervisors":>13}{"paused, s":>11}{"requests":>10}{"tokens":>10}{"cost, $":>10}')
+		for key, model in status['models'].items():
+			available = [('-' if (level is None) else f'{level:.0f}') for level in [model['requests_available'], model['tokens_available']]]
+			print(f'{key:<40}{model["waiting"]:>9}{model["supervisors_waiting"]:>13}{model["paused"]:>11.1f}{available[0]:>10}{available[1]:>10}{ledger["models"].get(key, {}).get("cost", 0.0):>10.4f}')
 
 
 def trim_python_quote(s):
@@ -362,10 +1294,11 @@ def trim_python_quote(s):
 	if i >= 0:
 		s = s[(i + len(prefix)):]
 
-	prefix = '```\n'
-	i = s.find(prefix)
-	if i >= 0:
-		s = s[(i + len(prefix)):]
+	else:
+		prefix = '```\n'
+		i = s.find(prefix)
+		if i >= 0:
+			s = s[(i + len(prefix)):]
 
 	i = s.rfind('\n```')
 	if i >= 0:
@@ -373,262 +1306,2693 @@ def trim_python_quote(s):
 	return s
 
 
-def add_supervisor_log(s):
-	with open(SUPERVISOR_LOG_FILENAME, 'a') as file:
-		file.write(s)
+# Fenced block, maybe indented, maybe with language tag, maybe unclosed
+FENCED_BLOCK_RE = re.compile(r'^[ \t]*```[ \t]*([\w+-]*)[^\n]*\n(.*?)(?:^[ \t]*```[ \t]*$|\Z)', re.MULTILINE | re.DOTALL)
 
 
-def run(scr):
-	scr.nodelay(True)
-	if curses.can_change_color():
-		curses.init_color(0, 0, 0, 0)
+def get_compile_error(src):
+	# Error message as python3 would print it, or None; deeply nested source exhausts recursion or parser stack;
+	# SyntaxWarnings are not printed to supervisor's terminal (python3 prints them when agent runs)
+	try:
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore')
+			compile(src, AGENT_FILENAME, 'exec')
+	except (SyntaxError, ValueError, RecursionError, MemoryError) as exception:
+		return ''.join(traceback.format_exception_only(type(exception), exception))
+	return None
+
+
+def extract_agent_src(response):
+	# Source of agent from response: result of trim_python_quote() if it compiles, else the first of concatenation
+	# of Python fenced blocks, these blocks, other fenced blocks, or response without fence lines that does;
+	# returns source and its compile error, which is None if it compiles
+	src = trim_python_quote(response)
+	compile_error = get_compile_error(src)
+	if compile_error is None:
+		return src, None
+	blocks = [(match.group(1).lower(), textwrap.dedent(match.group(2))) for match in FENCED_BLOCK_RE.finditer(response)]
+	python_blocks = [block for lang, block in blocks if lang in {'python', 'python3', 'py'}]
+	candidates = (['\n'.join(python_blocks)] if (len(python_blocks) > 1) else []) + python_blocks + [block for lang, block in blocks if lang not in {'python', 'python3', 'py'}]
+	candidates.append('\n'.join(line for line in response.split('\n') if not line.lstrip().startswith('```')))
+	for candidate in candidates:
+		candidate = candidate.rstrip('\n')
+		if (len(candidate.strip()) > 0) and (get_compile_error(candidate) is None):
+			return candidate, None
+	return src, compile_error
+
+
+SEARCH_REPLACE_RE = re.compile(r'^<<<<<<< SEARCH[ \t]*\n(.*?)^=======[ \t]*\n(.*?)^>>>>>>> REPLACE[ \t]*$', re.MULTILINE | re.DOTALL)
+HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@')
+
+
+def is_patch(response):
+	return (SEARCH_REPLACE_RE.search(response) is not None) or (re.search(r'^@@ -\d+', response, re.MULTILINE) is not None)
+
+
+def apply_search_replace(src, response):
+	for match in SEARCH_REPLACE_RE.finditer(response):
+		search, replace = match.group(1), match.group(2)
+		if (len(search) > 0) and (not search.endswith('\n')) and (search not in src):
+			search += '\n'
+		if search not in src:
+			raise ValueError(f'search block not found in current agent: "{search.strip()}"')
+		src = src.replace(search, replace, 1)
+	return src
+
+
+def apply_unified_diff(src, response):
+	# Hunk is applied where its old lines are found, the nearest to the line number of its header
+	lines = src.split('\n')
+	hunks = []
+	for line in response.split('\n'):
+		match = HUNK_HEADER_RE.match(line)
+		if match is not None:
+			hunks.append((int(match.group(1)) - 1, [], []))
+		elif (len(hunks) > 0) and (line[:1] in {' ', '-', '+', ''}) and (not line.startswith(('---', '+++'))):
+			if line[:1] in {' ', '-', ''}:
+				hunks[-1][1].append(line[1:])
+			if line[:1] in {' ', '+', ''}:
+				hunks[-1][2].append(line[1:])
+		elif line.startswith('```'):
+			continue
+	if len(hunks) == 0:
+		raise ValueError('no hunks in diff')
+	offset = 0
+	for i_line, old_lines, new_lines in hunks:
+		while (len(old_lines) > 0) and (old_lines[-1] == '') and (new_lines[-1:] == ['']): # trailing empty context
+			old_lines.pop()
+			new_lines.pop()
+		positions = [i for i in range(len(lines) - len(old_lines) + 1) if lines[i:(i + len(old_lines))] == old_lines]
+		if len(positions) == 0:
+			raise ValueError(f'hunk at line {i_line + 1} does not match current agent')
+		i = min(positions, key=lambda position: abs(position - (i_line + offset)))
+		lines[i:(i + len(old_lines))] = new_lines
+		offset += len(new_lines) - len(old_lines)
+	return '\n'.join(lines)
+
+
+def apply_patch(src, response):
+	# Next agent from current one and patch, either search/replace blocks or unified diff; ValueError if patch does not apply
+	if SEARCH_REPLACE_RE.search(response) is not None:
+		return apply_search_replace(src, response)
+	return apply_unified_diff(src, response)
+
+
+class PythonQuoteScanner:
+	# Incremental counterpart of trim_python_quote() for streamed responses: passes through text
+	# as it arrives, except fence lines and anything after closing fence; text of line that may turn out
+	# to be fence is held back until line completes
+
+	def __init__(self):
+		self.line = ''
+		self.n_emitted = 0 # chars of current line passed through already
+		self.is_in_code = False
+		self.is_closed = False
+
+	def feed(self, delta):
+		out = []
+		for ch in delta:
+			if self.is_closed:
+				break
+			self.line += ch
+			if ch == '\n':
+				if self.line.lstrip().startswith('```'):
+					if self.is_in_code and (self.line.strip() == '```'):
+						self.is_closed = True
+					else:
+						self.is_in_code = True
+				else:
+					out.append(self.line[self.n_emitted:])
+				self.line = ''
+				self.n_emitted = 0
+		stripped = self.line.lstrip()
+		if (not self.is_closed) and (not ('```'.startswith(stripped) or stripped.startswith('```'))):
+			out.append(self.line[self.n_emitted:])
+			self.n_emitted = len(self.line)
+		return ''.join(out)
+
+
+class StreamDisplay:
+	# Callback for get_llm_response() that shows streamed response (not logged) in curses window
+
+	def __init__(self, wnd, scanner=None):
+		self.wnd = wnd
+		self.scanner = scanner
+		self.is_shown = False
+
+	def __call__(self, delta):
+		text = self.scanner.feed(delta) if (self.scanner is not None) else delta
+		if len(text) > 0:
+			try:
+				if not self.is_shown:
+					self.wnd.addstr('\n\r')
+					self.is_shown = True
+				self.wnd.addstr(text)
+			except curses.error:
+				pass
+			self.wnd.refresh()
+
+	def finish(self):
+		if self.is_shown:
+			self.wnd.addstr('\n\r')
+			self.is_shown = False
+
+
+def format_llm_stats(stats, provider=None):
+	s = f'{stats["latency"]:.1f} s'
+	if stats['ttft'] is not None:
+		s += f' (TTFT {stats["ttft"]:.2f} s'
+		if stats['tokens_per_sec'] is not None:
+			s += f', {stats["tokens_per_sec"]:.1f} tokens/s'
+		s += ')'
+	if (stats.get('queued') or 0.0) >= 0.05:
+		s += f'; queued by coordinator {stats["queued"]:.1f} s'
+	if stats.get('hedged_provider') is not None:
+		s += f'; hedged with {stats["hedged_provider"].value}, ' + ('it' if (provider == stats['hedged_provider']) else 'original') + ' won'
+	return s
 
-	scr.addstr(0, 0, f'FINAL GOAL: "{FINAL_GOAL_PROMPT}"')
 
-	scr.hline(1, 0, curses.ACS_HLINE, curses.COLS)
-	wn_header = f'[ SUPERVISOR (→ {SUPERVISOR_LOG_FILENAME}) ]'
-	scr.addstr(1, (curses.COLS - len(wn_header)) >> 1, wn_header)
+class BoundedCapture:
+	# Beginning ("head") and ring-buffered end ("tail") of output stream within fixed sizes,
+	# so that the supervisor's memory does not depend on how much agent prints
+
+	def __init__(self, size_limit=STDOUTERR_SIZE_LIMIT, head_size=STDOUTERR_HEAD_SIZE):
+		self.head_size = head_size
+		self.tail_size = size_limit - head_size
+		self.head = bytearray()
+		self.tail = bytearray()
+		self.n_total_bytes = 0
+
+	def feed(self, data):
+		# Returns part of data that went to head
+		self.n_total_bytes += len(data)
+		n_head_bytes = min(len(data), self.head_size - len(self.head))
+		if n_head_bytes > 0:
+			self.head += data[:n_head_bytes]
+		if (len(data) > n_head_bytes) and (self.tail_size > 0):
+			self.tail += data[max(n_head_bytes, len(data) - self.tail_size):]
+			if len(self.tail) > self.tail_size:
+				del self.tail[:(len(self.tail) - self.tail_size)]
+		return data[:n_head_bytes]
+
+	@property
+	def n_elided_bytes(self):
+		return self.n_total_bytes - len(self.head) - len(self.tail)
+
+	def get_rest_text(self):
+		# What follows head
+		s = f'\n[... {self.n_elided_bytes} bytes elided ...]\n' if (self.n_elided_bytes > 0) else ''
+		return s + self.tail.decode('utf-8', errors='replace')
+
+	def get_text(self):
+		return self.head.decode('utf-8', errors='replace') + self.get_rest_text()
+
+
+TRACEBACK_FRAME_RE = re.compile(r'\s*File ".*", line \d+, in ')
+PREVIOUS_LINE_RE = re.compile(r'\s*\[Previous line repeated (\d+) more times?\]')
+
+
+def collapse_traceback_frames(text):
+	# Frame is "File ..." line with its indented source and marker lines; cycle of up to FEEDBACK_MAX_CYCLE frames
+	# repeated 3+ times in a row (e.g. mutual recursion, which Python does not collapse itself) is kept once
+	blocks = []
+	for line in text.splitlines(keepends=True):
+		if TRACEBACK_FRAME_RE.match(line):
+			blocks.append([line])
+		elif (len(blocks) > 0) and (len(blocks[-1]) > 0) and TRACEBACK_FRAME_RE.match(blocks[-1][0]) and line.startswith('    ') and (PREVIOUS_LINE_RE.match(line) is None):
+			blocks[-1].append(line)
+		else:
+			blocks.append([line])
+	is_frame = [TRACEBACK_FRAME_RE.match(block[0]) is not None for block in blocks]
+	lines = []
+	i = 0
+	while i < len(blocks):
+		n_collapsed_blocks = 0
+		for n_cycle_frames in range(1, FEEDBACK_MAX_CYCLE + 1):
+			if not all(is_frame[i:(i + n_cycle_frames)]) or (i + n_cycle_frames > len(blocks)):
+				break
+			cycle = blocks[i:(i + n_cycle_frames)]
+			n_repeats = 1
+			while blocks[(i + n_repeats * n_cycle_frames):(i + (n_repeats + 1) * n_cycle_frames)] == cycle:
+				n_repeats += 1
+			if n_repeats >= 3:
+				for block in cycle:
+					lines += block
+				indent = cycle[0][0][:(len(cycle[0][0]) - len(cycle[0][0].lstrip()))]
+				n_collapsed_blocks = n_repeats * n_cycle_frames
+				n_more = n_repeats - 1
+				if n_cycle_frames == 1:
+					# Python has kept 3 of identical frames, followed by its own marker
+					match = PREVIOUS_LINE_RE.match(blocks[i + n_collapsed_blocks][0]) if (i + n_collapsed_blocks < len(blocks)) else None
+					if match is not None:
+						n_more += int(match.group(1))
+						n_collapsed_blocks += 1
+					lines.append(f'{indent}[Previous line repeated {n_more} more times]\n')
+				else:
+					lines.append(f'{indent}[Previous {n_cycle_frames} frames repeated {n_more} more times]\n')
+				break
+		if n_collapsed_blocks > 0:
+			i += n_collapsed_blocks
+		else:
+			lines += blocks[i]
+			i += 1
+	return ''.join(lines)
+
+
+class FeedbackEncoder:
+	# Shrinks stdout and stderr of agent before they go to conversation: reference to identical output of recent agent,
+	# or line diff against nearly identical one; only outputs sent in full, and still in conversation (since last
+	# summarisation), are referred to
+
+	def __init__(self):
+		self.history = collections.deque(maxlen=FEEDBACK_HISTORY) # (agent number, stream name, text)
+
+	def reset(self):
+		self.history.clear()
+
+	@staticmethod
+	def get_referred_agents(text):
+		# Numbers of agents whose outputs are referred to in execution results message
+		return {int(match.group(1)) for match in re.finditer(r'^(?:stdout|stderr) (?:is identical to|differs from) (?:stdout|stderr) of (?:earlier run of )?agent (\d+)', text, re.MULTILINE)}
+
+	def encode(self, i_agent, name, text):
+		# Returns description of output for execution results message, and kind of encoding: full, collapsed (traceback frames), identical, or diff
+		collapsed_text = collapse_traceback_frames(text)
+		encoding = 'collapsed' if (collapsed_text != text) else 'full'
+		text = collapsed_text
+		n_tokens = estimate_tokens(text)
+		if n_tokens >= FEEDBACK_MIN_TOKENS:
+			best = None
+			for i_earlier_agent, earlier_name, earlier_text in self.history:
+				if earlier_name != name:
+					continue
+				source = f'agent {i_earlier_agent}' if (i_earlier_agent != i_agent) else f'earlier run of agent {i_agent}'
+				if earlier_text == text:
+					return f'{name} is identical to {name} of {source}', 'identical'
+				diff_lines = list(difflib.unified_diff(earlier_text.splitlines(), text.splitlines(), n=1, lineterm=''))[2:]
+				diff = '\n'.join(diff_lines)
+				n_diff_tokens = estimate_tokens(diff)
+				if (n_diff_tokens <= FEEDBACK_DIFF_MAX_RATIO * n_tokens) and ((best is None) or (n_diff_tokens < best[0])):
+					n_added_lines = sum(1 for line in diff_lines if line.startswith('+'))
+					n_removed_lines = sum(1 for line in diff_lines if line.startswith('-'))
+					best = (n_diff_tokens, f'{name} differs from {name} of {source} (+{n_added_lines} lines/-{n_removed_lines} lines) by unified diff: "{diff}"')
+			if best is not None:
+				return best[1], 'diff'
+			self.history.append((i_agent, name, text))
+		return f'{name} is: "{text}"', encoding
+
+
+def get_cost(provider, n_prompt_tokens, n_completion_tokens, llm_stats=None):
+	# Prompt tokens include cached ones, charged at cached rates if stats of LLM call are given
+	cost = COSTS_PER_TOKEN[provider][MODEL_ID[provider]][0] * n_prompt_tokens + COSTS_PER_TOKEN[provider][MODEL_ID[provider]][1] * n_completion_tokens
+	if llm_stats is not None:
+		cached_costs = COSTS_PER_CACHED_TOKEN.get(provider, {}).get(MODEL_ID[provider])
+		if cached_costs is not None:
+			cost += (cached_costs[0] - COSTS_PER_TOKEN[provider][MODEL_ID[provider]][0]) * llm_stats['n_cached_tokens']
+			cost += (cached_costs[1] - COSTS_PER_TOKEN[provider][MODEL_ID[provider]][0]) * llm_stats['n_cache_write_tokens']
+	return cost
+
+
+# Forkserver run by "python3 -c": imports given modules, then for each connection to its Unix socket
+# receives workdir, argv, and stdin/stdout/stderr fds, forks child that runs agent as "python3 agent.py" would,
+# sends child's pid, then its return code and resource usage; exits when its own stdin (pipe from supervisor) is closed
+WARM_SERVER_SRC = '''
+import importlib, json, os, resource, select, signal, socket, sys, traceback, types
+
+def serve(socket_path, modules):
+	for name in modules:
+		try:
+			importlib.import_module(name)
+		except Exception:
+			pass
+	listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	listener.bind(socket_path)
+	listener.listen(64)
+	wake_r, wake_w = os.pipe()
+	os.set_blocking(wake_r, False)
+	os.set_blocking(wake_w, False)
+	signal.set_wakeup_fd(wake_w)
+	signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+	conns = {}
+	sys.stdout.write('ready\\n')
+	sys.stdout.flush()
+	while True:
+		readable, _, _ = select.select([listener, wake_r, sys.stdin], [], [])
+		if sys.stdin in readable:
+			if len(os.read(sys.stdin.fileno(), 0x100)) == 0:
+				sys.exit(0)
+		if wake_r in readable:
+			try:
+				while len(os.read(wake_r, 0x100)) > 0:
+					pass
+			except BlockingIOError:
+				pass
+		while True:
+			try:
+				pid, status, rusage = os.wait4(-1, os.WNOHANG)
+			except ChildProcessError:
+				break
+			if pid == 0:
+				break
+			conn = conns.pop(pid, None)
+			if conn is not None:
+				try:
+					conn.sendall((json.dumps({'returncode' : os.waitstatus_to_exitcode(status), 'cpu_time' : rusage.ru_utime + rusage.ru_stime, 'max_rss' : rusage.ru_maxrss}) + '\\n').encode('ascii'))
+				except OSError:
+					pass
+				conn.close()
+		if listener in readable:
+			conn, _ = listener.accept()
+			msg, fds, _, _ = socket.recv_fds(conn, 0x10000, 3)
+			pid = os.fork()
+			if pid == 0:
+				signal.set_wakeup_fd(-1)
+				signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+				for c in [listener, conn] + list(conns.values()):
+					c.close()
+				os.close(wake_r)
+				os.close(wake_w)
+				for i, fd in enumerate(fds):
+					os.dup2(fd, i)
+					os.close(fd)
+				return json.loads(msg)
+			for fd in fds:
+				os.close(fd)
+			conns[pid] = conn
+			conn.sendall(f'{pid}\\n'.encode('ascii'))
+
+def run_child(request):
+	# As in apply_agent_limits() of supervisor: own process group, rlimits, cgroup
+	os.setsid()
+	for name, limits in request['rlimits'].items():
+		resource.setrlimit(getattr(resource, name), tuple(limits))
+	if request['cgroup'] is not None:
+		fd = os.open(os.path.join(request['cgroup'], 'cgroup.procs'), os.O_WRONLY)
+		os.write(fd, b'0')
+		os.close(fd)
+	os.chdir(request['cwd'])
+	path = os.path.abspath(request['argv'][0])
+	sys.argv = list(request['argv'])
+	sys.path[0] = os.path.dirname(path)
+	main = types.ModuleType('__main__')
+	main.__file__ = path
+	main.__builtins__ = __builtins__
+	sys.modules['__main__'] = main
+	try:
+		with open(path, 'rb') as file:
+			code = compile(file.read(), path, 'exec')
+		exec(code, main.__dict__)
+	except SystemExit:
+		raise
+	except BaseException as exception:
+		tb = exception.__traceback__
+		while (tb is not None) and (tb.tb_frame.f_code.co_filename != path):
+			tb = tb.tb_next
+		traceback.print_exception(type(exception), exception, tb)
+		sys.exit(1)
+
+run_child(serve(sys.argv[1], sys.argv[2:]))
+'''
+
+
+class WarmProcess:
+	# Agent forked by WarmInterpreter, with Popen-like pid, stdout, stderr, wait(), kill(), returncode, and rusage
+
+	def __init__(self, conn, stdout, stderr):
+		self.conn = conn
+		self.buffer = b''
+		self.pid = int(self.read_line())
+		self.stdout = stdout
+		self.stderr = stderr
+		self.returncode = None
+		self.rusage = None
+
+	def read_line(self, timeout=None):
+		# Line from warm interpreter; socket is read only once select finds it readable, not with timeout of its own,
+		# which would leave it unreadable after expiring, so that wait() after kill() works as for python3
+		deadline = (time.monotonic() + timeout) if (timeout is not None) else None
+		with selectors.DefaultSelector() as selector:
+			selector.register(self.conn, selectors.EVENT_READ)
+			while b'\n' not in self.buffer:
+				remaining = max(0.0, deadline - time.monotonic()) if (deadline is not None) else None
+				if len(selector.select(remaining)) == 0:
+					raise subprocess.TimeoutExpired(AGENT_FILENAME, timeout)
+				data = self.conn.recv(0x1000)
+				if len(data) == 0:
+					raise ConnectionError('Warm interpreter has closed connection')
+				self.buffer += data
+		line, self.buffer = self.buffer.split(b'\n', 1)
+		return line
+
+	def wait(self, timeout=None):
+		if self.returncode is None:
+			result = json.loads(self.read_line(timeout))
+			self.returncode = result.pop('returncode')
+			self.rusage = result
+			self.conn.close()
+		return self.returncode
+
+	def kill(self):
+		if self.returncode is None:
+			kill_process_group(self.pid)
+
+
+class WarmInterpreter:
+	# Pre-started interpreter with heavy modules imported, forking clean child for each agent,
+	# so that agents do not pay interpreter startup and imports again and again
+
+	def __init__(self, modules=None):
+		self.modules = WARM_MODULES if (modules is None) else modules
+		self.dirpath = tempfile.mkdtemp(prefix='nochbinich-')
+		self.socket_path = os.path.join(self.dirpath, 'warm.sock')
+		self.proc = subprocess.Popen(['python3', '-c', WARM_SERVER_SRC, self.socket_path] + list(self.modules), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+		if self.proc.stdout.readline() != b'ready\n':
+			raise RuntimeError('Warm interpreter has not started')
+
+	def is_alive(self):
+		return self.proc.poll() is None
+
+	def popen(self, argv, cwd, rlimits={}, cgroup_dirpath=None):
+		stdout_r, stdout_w = os.pipe()
+		stderr_r, stderr_w = os.pipe()
+		try:
+			conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			conn.connect(self.socket_path)
+			socket.send_fds(conn, [json.dumps({'argv' : argv, 'cwd' : os.path.abspath(cwd), 'rlimits' : rlimits, 'cgroup' : cgroup_dirpath}).encode('utf-8')], [0, stdout_w, stderr_w])
+		finally:
+			os.close(stdout_w)
+			os.close(stderr_w)
+		return WarmProcess(conn, os.fdopen(stdout_r, 'rb', buffering=0), os.fdopen(stderr_r, 'rb', buffering=0))
+
+	def stop(self):
+		self.proc.stdin.close() # server exits at EOF
+		try:
+			self.proc.wait(1)
+		except subprocess.TimeoutExpired:
+			self.proc.kill()
+			self.proc.wait()
+		try:
+			os.remove(self.socket_path)
+			os.rmdir(self.dirpath)
+		except OSError:
+			pass
 
-	used_other_lines = 6
 
-	scr.hline(2 + ((curses.LINES - used_other_lines) >> 1), 0, curses.ACS_HLINE, curses.COLS)
-	wn_header = f'[ AGENT (→ {AGENT_LOG_FILENAME}) ]'
-	scr.addstr(2 + ((curses.LINES - used_other_lines) >> 1), (curses.COLS - len(wn_header)) >> 1, wn_header)
+warm_interpreter = None
+warm_interpreter_lock = threading.Lock()
 
-	scr.hline(curses.LINES - 3, 0, curses.ACS_HLINE, curses.COLS)
-	wn_header = '[ HELP & COST ]'
-	scr.addstr(curses.LINES - 3, (curses.COLS - len(wn_header)) >> 1, wn_header)
 
-	scr.refresh()
+def get_warm_interpreter():
+	global warm_interpreter
+	with warm_interpreter_lock:
+		if (warm_interpreter is None) or (not warm_interpreter.is_alive()):
+			if warm_interpreter is not None:
+				warm_interpreter.stop()
+			warm_interpreter = WarmInterpreter()
+			atexit.register(warm_interpreter.stop)
+		return warm_interpreter
 
-	wnd_super = curses.newwin((curses.LINES - used_other_lines) >> 1, curses.COLS, 2, 0)
-	wnd_super.idlok(True)
-	wnd_super.scrollok(True)
 
-	wnd_agent = curses.newwin(curses.LINES - used_other_lines - ((curses.LINES - used_other_lines) >> 1), curses.COLS, 3 + ((curses.LINES - used_other_lines) >> 1), 0)
-	wnd_agent.idlok(True)
-	wnd_agent.scrollok(True)
+def kill_process_group(pid):
+	# Agent leads its own process group (session), so that its children are killed with it
+	try:
+		os.killpg(pid, signal.SIGKILL)
+	except (ProcessLookupError, PermissionError):
+		try:
+			os.kill(pid, signal.SIGKILL) # has not become group leader yet
+		except ProcessLookupError:
+			pass
+
+
+def get_agent_rlimits():
+	# {name of resource.RLIMIT_... : (soft, hard)} for agent budgets; soft CPU limit sends SIGXCPU, hard one a second later SIGKILL
+	budgets = {'RLIMIT_CPU' : AGENT_CPU_LIMIT, 'RLIMIT_FSIZE' : AGENT_FILE_SIZE_LIMIT}
+	if not AGENT_CGROUP:
+		budgets.update({'RLIMIT_AS' : AGENT_MEMORY_LIMIT, 'RLIMIT_NPROC' : AGENT_PROCESS_LIMIT})
+	rlimits = {}
+	for name, budget in budgets.items():
+		if budget is not None:
+			soft = int(budget)
+			hard = (soft + 1) if (name == 'RLIMIT_CPU') else soft
+			current_hard = resource.getrlimit(getattr(resource, name))[1]
+			if current_hard != resource.RLIM_INFINITY:
+				soft, hard = min(soft, current_hard), min(hard, current_hard) # unprivileged process cannot raise hard limit
+			rlimits[name] = (soft, hard)
+	return rlimits
+
+
+def apply_agent_limits(rlimits, cgroup_dirpath):
+	# In child between fork and exec, so only system calls: rlimits, moving itself into cgroup
+	for name, limits in rlimits.items():
+		resource.setrlimit(getattr(resource, name), limits)
+	if cgroup_dirpath is not None:
+		fd = os.open(os.path.join(cgroup_dirpath, 'cgroup.procs'), os.O_WRONLY)
+		os.write(fd, b'0')
+		os.close(fd)
+
+
+agent_cgroup_parent = None
+agent_cgroup_lock = threading.Lock()
+agent_cgroup_counter = 0
+
+
+def get_agent_cgroup_parent():
+	# Cgroup v2 of supervisor, where agents' cgroups are created; cgroup with processes cannot enable controllers
+	# for its children, so supervisor moves itself into child "supervisor" first
+	global agent_cgroup_parent
+	with agent_cgroup_lock:
+		if agent_cgroup_parent is None:
+			with open('/proc/self/mountinfo', 'r') as file:
+				mount_dirpaths = [line.split()[4] for line in file if ' - cgroup2 ' in line]
+			if len(mount_dirpaths) == 0:
+				raise RuntimeError('cgroup v2 is not mounted')
+			with open('/proc/self/cgroup', 'r') as file:
+				own_path = [line.strip()[3:] for line in file if line.startswith('0::')][0]
+			parent = os.path.join(mount_dirpaths[0], own_path.lstrip('/'))
+			supervisor_dirpath = os.path.join(parent, 'supervisor')
+			os.makedirs(supervisor_dirpath, exist_ok=True)
+			with open(os.path.join(supervisor_dirpath, 'cgroup.procs'), 'w') as file:
+				file.write(str(os.getpid()))
+			with open(os.path.join(parent, 'cgroup.controllers'), 'r') as file:
+				available_controllers = file.read().split()
+			needed_controllers = [controller for controller, budget in [('memory', AGENT_MEMORY_LIMIT), ('pids', AGENT_PROCESS_LIMIT), ('cpu', AGENT_CPU_QUOTA)] if budget is not None]
+			for controller in needed_controllers:
+				if controller not in available_controllers:
+					raise RuntimeError(f'cgroup controller "{controller}" is not available in {parent}')
+			if len(needed_controllers) > 0:
+				with open(os.path.join(parent, 'cgroup.subtree_control'), 'w') as file:
+					file.write(' '.join(f'+{controller}' for controller in needed_controllers))
+			agent_cgroup_parent = parent
+		return agent_cgroup_parent
+
+
+class AgentCgroup:
+	# Cgroup v2 of one run of agent, with its memory, process and CPU budgets
+
+	def __init__(self):
+		global agent_cgroup_counter
+		with agent_cgroup_lock:
+			agent_cgroup_counter += 1
+			name = f'agent-{os.getpid()}-{agent_cgroup_counter}'
+		self.dirpath = os.path.join(get_agent_cgroup_parent(), name)
+		os.mkdir(self.dirpath)
+		if AGENT_MEMORY_LIMIT is not None:
+			self.write('memory.max', str(int(AGENT_MEMORY_LIMIT)))
+			self.write('memory.swap.max', '0')
+		if AGENT_PROCESS_LIMIT is not None:
+			self.write('pids.max', str(int(AGENT_PROCESS_LIMIT)))
+		if AGENT_CPU_QUOTA is not None:
+			self.write('cpu.max', f'{int(AGENT_CPU_QUOTA * 100000)} 100000')
+
+	def write(self, filename, s):
+		try:
+			with open(os.path.join(self.dirpath, filename), 'w') as file:
+				file.write(s)
+		except FileNotFoundError:
+			pass # e.g. memory.swap.max without swap accounting
 
-	wnd_help = curses.newwin(2, curses.COLS, curses.LINES - 2, 0)
-	wnd_help.idlok(True)
-	wnd_help.scrollok(True)
+	def get_events(self, filename):
+		# {event : count} of memory.events, pids.events...
+		try:
+			with open(os.path.join(self.dirpath, filename), 'r') as file:
+				return {name : int(count) for name, count in (line.split() for line in file)}
+		except OSError:
+			return {}
 
-	# Begin anew or continue
+	def kill(self):
+		try:
+			self.write('cgroup.kill', '1')
+		except OSError:
+			pass
+
+	def remove(self):
+		# Possible once all processes have exited; killed ones are reaped asynchronously
+		for _ in range(50):
+			try:
+				os.rmdir(self.dirpath)
+				return
+			except FileNotFoundError:
+				return
+			except OSError:
+				self.kill()
+				time.sleep(0.01)
+
+
+def get_exceeded_budgets(ret_code, stderr_text, rusage, cgroup=None):
+	# Budgets that agent has exceeded, judging by its termination signal, CPU time, errors in its stderr, and events of its cgroup
+	budgets = []
+	if (AGENT_CPU_LIMIT is not None) and ((ret_code == -signal.SIGXCPU) or ((rusage is not None) and (rusage['cpu_time'] >= AGENT_CPU_LIMIT))):
+		budgets.append(f'CPU time {AGENT_CPU_LIMIT} s')
+	if (AGENT_MEMORY_LIMIT is not None) and (('MemoryError' in stderr_text) or ((cgroup is not None) and (cgroup.get_events('memory.events').get('oom_kill', 0) > 0))):
+		budgets.append(f'memory {AGENT_MEMORY_LIMIT / 0x100000:.0f} MiB')
+	if (AGENT_FILE_SIZE_LIMIT is not None) and ((ret_code == -signal.SIGXFSZ) or ('File too large' in stderr_text)):
+		budgets.append(f'file size {AGENT_FILE_SIZE_LIMIT / 0x100000:.0f} MiB')
+	if (AGENT_PROCESS_LIMIT is not None) and (('Resource temporarily unavailable' in stderr_text) or ("can't start new thread" in stderr_text) or ((cgroup is not None) and (cgroup.get_events('pids.events').get('max', 0) > 0))):
+		budgets.append(f'processes {AGENT_PROCESS_LIMIT}')
+	return budgets
+
+
+def wait_with_rusage(proc, timeout=None):
+	# Popen.wait() that keeps resource usage of child as proc.rusage, {'cpu_time' : sec, 'max_rss' : KiB}:
+	# waits for pidfd of child to become readable, then reaps child itself
+	if proc.returncode is not None:
+		return proc.returncode
+	try:
+		pidfd = os.pidfd_open(proc.pid)
+	except (AttributeError, OSError):
+		proc.rusage = None # unknown, here
+		return proc.wait(timeout)
+	try:
+		with selectors.DefaultSelector() as selector:
+			selector.register(pidfd, selectors.EVENT_READ)
+			if len(selector.select(timeout)) == 0:
+				raise subprocess.TimeoutExpired(proc.args, timeout)
+	finally:
+		os.close(pidfd)
+	pid, status, rusage = os.wait4(proc.pid, 0)
+	proc.returncode = os.waitstatus_to_exitcode(status)
+	proc.rusage = {'cpu_time' : rusage.ru_utime + rusage.ru_stime, 'max_rss' : rusage.ru_maxrss}
+	return proc.returncode
+
+
+def run_agent(workdirpath=WORKDIRPATH, timeout=TIMEOUT, on_output=None, is_warm=None):
+	# Runs agent in its own process group with budgets, with stdout and stderr captured by BoundedCapture-s via
+	# non-blocking reads, passing their heads to on_output() while agent runs; returns return code (None on timeout),
+	# stdout and stderr captures, whether timeout has expired, resource usage (see wait_with_rusage()) or None,
+	# and exceeded budgets
+	cgroup = AgentCgroup() if AGENT_CGROUP else None
+	try:
+		return run_agent_process(workdirpath, timeout, on_output, is_warm, cgroup)
+	finally:
+		if cgroup is not None:
+			cgroup.remove()
 
-	i_agent = 0
-	n_summarisations = 0
-	n_prompt_tokens = 0
-	cost = 0.0
+
+def run_agent_process(workdirpath, timeout, on_output, is_warm, cgroup):
+	rlimits = get_agent_rlimits()
+	cgroup_dirpath = cgroup.dirpath if (cgroup is not None) else None
+	if (WARM_INTERPRETER if (is_warm is None) else is_warm):
+		proc = get_warm_interpreter().popen([AGENT_FILENAME], workdirpath, rlimits, cgroup_dirpath)
+	else:
+		proc = subprocess.Popen(['python3', AGENT_FILENAME], stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=workdirpath, start_new_session=True,
+			preexec_fn=((lambda: apply_agent_limits(rlimits, cgroup_dirpath)) if ((len(rlimits) > 0) or (cgroup_dirpath is not None)) else None))
+	captures = {proc.stdout.fileno() : BoundedCapture(), proc.stderr.fileno() : BoundedCapture()}
+	decoders = {fd : codecs.getincrementaldecoder('utf-8')(errors='replace') for fd in captures}
+	deadline = time.monotonic() + timeout
+	is_timed_out = False
+	with selectors.DefaultSelector() as selector:
+		for fd in captures:
+			os.set_blocking(fd, False)
+			selector.register(fd, selectors.EVENT_READ)
+		while len(selector.get_map()) > 0:
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				is_timed_out = True
+				break
+			for key, _ in selector.select(remaining):
+				try:
+					data = os.read(key.fd, 0x10000)
+				except BlockingIOError:
+					continue
+				if len(data) == 0:
+					selector.unregister(key.fd)
+					continue
+				head_data = captures[key.fd].feed(data)
+				if (len(head_data) > 0) and (on_output is not None):
+					on_output(decoders[key.fd].decode(head_data))
+	wait = proc.wait if isinstance(proc, WarmProcess) else (lambda timeout=None: wait_with_rusage(proc, timeout))
+	if not is_timed_out:
+		try:
+			wait(max(0, deadline - time.monotonic()))
+		except subprocess.TimeoutExpired:
+			is_timed_out = True
+	if is_timed_out:
+		if cgroup is not None:
+			cgroup.kill()
+		kill_process_group(proc.pid)
+		wait()
+	proc.stdout.close()
+	proc.stderr.close()
+	stdout_capture, stderr_capture = captures.values()
+	if on_output is not None:
+		for fd, capture in captures.items():
+			s = decoders[fd].decode(b'', final=True) + capture.get_rest_text()
+			if len(s) > 0:
+				on_output(s)
+	exceeded_budgets = get_exceeded_budgets(proc.returncode, stderr_capture.get_text(), proc.rusage, cgroup)
+	return (None if is_timed_out else proc.returncode), stdout_capture, stderr_capture, is_timed_out, proc.rusage, exceeded_budgets
+
+
+WORKER_RE = re.compile(r'\A[ \t]*#[ \t]*worker:[ \t]*([A-Za-z0-9_-]{1,32})[ \t]*$', re.MULTILINE)
+
+
+def get_worker_name(agent_src):
+	# NAME of agent whose first line is "# worker: NAME", else None
+	match = WORKER_RE.match(agent_src)
+	return match.group(1) if (match is not None) else None
+
+
+def get_process_start_time(pid):
+	# In clock ticks since boot, which tells process from later one with the same pid; None if there is no such process
 	try:
-		with open(COUNTERS_FILENAME, 'r') as file:
-			counters = json.loads(file.read())
+		with open(f'/proc/{pid}/stat', 'r') as file:
+			return int(file.read().rsplit(')', 1)[1].split()[19])
+	except (OSError, IndexError, ValueError):
+		return None
+
+
+def get_process_usage(pid, cgroup=None):
+	# {'cpu_time' : sec, 'rss' : KiB} of running process, with its children that it has waited for, or of its cgroup
+	usage = {'cpu_time' : None, 'rss' : None}
+	try:
+		with open(f'/proc/{pid}/stat', 'r') as file:
+			fields = file.read().rsplit(')', 1)[1].split()
+		usage['cpu_time'] = sum(int(field) for field in fields[11:15]) / os.sysconf('SC_CLK_TCK') # utime, stime, cutime, cstime
+		with open(f'/proc/{pid}/status', 'r') as file:
+			for line in file:
+				if line.startswith('VmRSS:'):
+					usage['rss'] = int(line.split()[1])
+	except (OSError, IndexError, ValueError):
+		pass
+	if cgroup is not None:
+		try:
+			with open(os.path.join(cgroup.dirpath, 'cpu.stat'), 'r') as file:
+				usage['cpu_time'] = int(dict(line.split() for line in file)['usage_usec']) / 1e6
+			with open(os.path.join(cgroup.dirpath, 'memory.current'), 'r') as file:
+				usage['rss'] = int(file.read()) >> 10
+		except (OSError, KeyError, ValueError):
+			pass
+	return usage
+
+
+class Worker:
+	# Background worker: agent run without timeout in its own process group, with listening socket,
+	# and with stdout and stderr going to files, which are read incrementally
+
+	def __init__(self, name, i_agent, proc, cgroup, socket_path, output_filenames):
+		self.name = name
+		self.i_agent = i_agent # of agent that has declared it
+		self.proc = proc
+		self.cgroup = cgroup
+		self.socket_path = socket_path
+		self.output_filenames = output_filenames
+		self.start_time = get_process_start_time(proc.pid)
+		self.t_start = time.monotonic()
+		self.offsets = [0, 0] # of stdout and stderr, read so far
+		self.cpu_time = 0.0 # at previous report
+		self.returncode = None
+		self.rusage = None # once exited, see wait_with_rusage()
+		self.t_exit = None
+
+	def poll(self):
+		# Return code once worker has exited (reaped here, with its resource usage), else None
+		if self.returncode is None:
 			try:
-				i_agent = counters['i_agent']
-			except KeyError:
+				pid, status, rusage = os.wait4(self.proc.pid, os.WNOHANG)
+			except ChildProcessError:
+				pid, status, rusage = self.proc.pid, 0, None
+			if pid != 0:
+				self.returncode = self.proc.returncode = os.waitstatus_to_exitcode(status)
+				self.rusage = {'cpu_time' : rusage.ru_utime + rusage.ru_stime, 'max_rss' : rusage.ru_maxrss} if (rusage is not None) else None
+				self.t_exit = time.monotonic()
+		return self.returncode
+
+	def get_usage(self):
+		# {'cpu_time' : sec, 'rss' : KiB or None} now, or at exit (max RSS then)
+		if self.poll() is None:
+			return get_process_usage(self.proc.pid, self.cgroup)
+		return {'cpu_time' : self.rusage['cpu_time'], 'rss' : self.rusage['max_rss']} if (self.rusage is not None) else {'cpu_time' : None, 'rss' : None}
+
+	def read_output(self):
+		# BoundedCapture-s of stdout and stderr written since previous read, within WORKER_OUTPUT_SIZE_LIMIT each
+		captures = []
+		for k, filename in enumerate(self.output_filenames):
+			capture = BoundedCapture(WORKER_OUTPUT_SIZE_LIMIT, WORKER_OUTPUT_SIZE_LIMIT >> 1)
+			try:
+				with open(filename, 'rb') as file:
+					file.seek(self.offsets[k])
+					while True:
+						data = file.read(0x10000)
+						if len(data) == 0:
+							break
+						capture.feed(data)
+			except OSError:
 				pass
+			self.offsets[k] += capture.n_total_bytes
+			captures.append(capture)
+		return captures
+
+	def kill(self):
+		# With its whole process group, children that have outlived worker included
+		if self.poll() is None:
+			if self.cgroup is not None:
+				self.cgroup.kill()
+			kill_process_group(self.proc.pid)
+			wait_with_rusage(self.proc)
+			self.returncode = self.proc.returncode
+			self.rusage = self.proc.rusage
+			self.t_exit = time.monotonic()
+		else:
 			try:
-				n_prompt_tokens = counters['n_prompt_tokens']
-			except KeyError:
+				os.killpg(self.proc.pid, signal.SIGKILL) # not kill(), pid may be reused once group is gone
+			except (ProcessLookupError, PermissionError):
 				pass
+		if self.cgroup is not None:
+			self.cgroup.remove()
+		try:
+			os.remove(self.socket_path)
+		except FileNotFoundError:
+			pass
+
+
+class WorkerPool:
+	# Background workers of lineage by name: started from agents that declare themselves workers, reported
+	# in execution results of each agent, stopped at terminus or quit (or when supervisor starts again)
+
+	def __init__(self, workdirpath, output_dirpath, filename):
+		self.workdirpath = workdirpath
+		self.output_dirpath = output_dirpath # stdout and stderr of workers
+		self.filename = filename
+		self.workers = {}
+		self.is_registered = False # stop() at exit
+
+	def __len__(self):
+		return len(self.workers)
+
+	def save(self):
+		write_file_atomically(self.filename, json.dumps({name : {'pid' : worker.proc.pid, 'start_time' : worker.start_time, 'socket' : worker.socket_path} for name, worker in self.workers.items()}).encode('utf-8'))
+
+	def kill_stale(self):
+		# Kills workers that supervisor has not stopped (it has been killed, or crashed) and returns their number;
+		# start time tells worker from later process with the same pid
+		try:
+			with open(self.filename, 'r') as file:
+				stale_workers = json.load(file)
+		except (OSError, ValueError):
+			return 0
+		n_killed = 0
+		for entry in stale_workers.values():
+			if (entry['start_time'] is not None) and (get_process_start_time(entry['pid']) == entry['start_time']):
+				kill_process_group(entry['pid'])
+				n_killed += 1
 			try:
-				n_summarisations = counters['n_summarisations']
-			except KeyError:
+				os.remove(entry['socket'])
+			except OSError:
 				pass
+		os.remove(self.filename)
+		return n_killed
+
+	def start(self, name, i_agent, agent_src):
+		# Worker NAME running agent_src as WORKERS_DIRNAME/NAME.py in workdir, replacing running one of the same name;
+		# listening socket is bound before worker starts, so that agents may connect to it while it is starting
+		if name in self.workers:
+			self.remove(name)
+		n_running = sum(1 for worker in self.workers.values() if worker.poll() is None)
+		if n_running >= MAX_WORKERS:
+			raise RuntimeError(f'{n_running} workers are running already ({", ".join(self.workers)}), which is maximum')
+		dirpath = os.path.join(self.workdirpath, WORKERS_DIRNAME)
+		os.makedirs(dirpath, exist_ok=True)
+		os.makedirs(self.output_dirpath, exist_ok=True)
+		src_filename = os.path.join(WORKERS_DIRNAME, f'{name}.py') # relative to workdir, as is traceback
+		write_file_atomically(os.path.join(self.workdirpath, src_filename), agent_src.encode('utf-8', errors='surrogateescape'))
+		socket_path = os.path.join(dirpath, f'{name}.sock')
+		try:
+			os.remove(socket_path)
+		except FileNotFoundError:
+			pass
+		output_filenames = [os.path.join(self.output_dirpath, f'{name}.{ext}') for ext in ['out', 'err']]
+		rlimits = get_agent_rlimits()
+		cgroup = None
+		listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			listener.bind(socket_path)
+			listener.listen(64)
+			cgroup = AgentCgroup() if AGENT_CGROUP else None
+			cgroup_dirpath = cgroup.dirpath if (cgroup is not None) else None
+			env = dict(os.environ, WORKER_FD=str(listener.fileno()), WORKER_NAME=name, PYTHONUNBUFFERED='1',
+				PYTHONPATH=os.pathsep.join([os.path.abspath(self.workdirpath)] + ([os.environ['PYTHONPATH']] if ('PYTHONPATH' in os.environ) else []))) # modules of workdir importable, as for agent
+			with open(output_filenames[0], 'wb') as stdout_file, open(output_filenames[1], 'wb') as stderr_file:
+				proc = subprocess.Popen(['python3', src_filename], stdin=subprocess.DEVNULL, stdout=stdout_file, stderr=stderr_file, cwd=self.workdirpath, env=env, start_new_session=True, pass_fds=[listener.fileno()],
+					preexec_fn=((lambda: apply_agent_limits(rlimits, cgroup_dirpath)) if ((len(rlimits) > 0) or (cgroup_dirpath is not None)) else None))
+		except Exception:
+			if cgroup is not None:
+				cgroup.remove()
 			try:
-				cost = counters['cost']
-			except KeyError:
+				os.remove(socket_path)
+			except OSError:
 				pass
-	except:
-		pass
-
-	if not os.path.isfile(MESSAGES_FILENAME):
-		add_system_message(SYSTEM_MESSAGE)
+			raise
+		finally:
+			listener.close() # worker has its own
+		worker = Worker(name, i_agent, proc, cgroup, socket_path, output_filenames)
+		self.workers[name] = worker
+		self.save()
+		if not self.is_registered:
+			atexit.register(self.stop)
+			self.is_registered = True
+		return worker
+
+	def remove(self, name):
+		self.workers.pop(name).kill()
+		self.save()
+
+	def report(self):
+		# (text for execution results, records for metrics) of new output and resource usage of each worker;
+		# exited ones are reported once, then removed
+		texts = []
+		records = []
+		for name, worker in list(self.workers.items()):
+			returncode = worker.poll()
+			usage = worker.get_usage()
+			stdout_capture, stderr_capture = worker.read_output()
+			cpu_delta = (usage['cpu_time'] - worker.cpu_time) if (usage['cpu_time'] is not None) else None
+			if usage['cpu_time'] is not None:
+				worker.cpu_time = usage['cpu_time']
+			t = worker.t_exit if (returncode is not None) else time.monotonic()
+			text = f'Background worker {name} (agent {worker.i_agent}): ' + ('running' if (returncode is None) else f'exited with return code {returncode}') + f' after {t - worker.t_start:.0f} s'
+			if usage['cpu_time'] is not None:
+				text += f', CPU time {usage["cpu_time"]:.1f} s (+{cpu_delta:.1f} s since previous agent)'
+			if usage['rss'] is not None:
+				text += f', {"max " if (returncode is not None) else ""}memory {usage["rss"] / 1024:.0f} MiB'
+			if returncode is not None:
+				exceeded_budgets = get_exceeded_budgets(returncode, stderr_capture.get_text(), worker.rusage, worker.cgroup)
+				if len(exceeded_budgets) > 0:
+					text += f' (exceeded budget: {", ".join(exceeded_budgets)})'
+			outputs = [f'new {stream} is: "{capture.get_text()}"' for stream, capture in [('stdout', stdout_capture), ('stderr', stderr_capture)] if (capture.n_total_bytes > 0)]
+			text += '; ' + ('; '.join(outputs) if (len(outputs) > 0) else 'no new output') + '.'
+			texts.append(text)
+			records.append({'name' : name, 'is_running' : (returncode is None), 'exit_code' : returncode, 'cpu_time' : usage['cpu_time'], 'cpu_delta' : cpu_delta, 'rss' : usage['rss'],
+				'stdout_bytes' : stdout_capture.n_total_bytes, 'stderr_bytes' : stderr_capture.n_total_bytes})
+			if returncode is not None:
+				self.remove(name)
+		return '\n'.join(texts), records
+
+	def stop(self):
+		# Kills all workers; returns their number
+		n_workers = len(self.workers)
+		for name in list(self.workers):
+			self.remove(name)
+		if os.path.isfile(self.filename):
+			os.remove(self.filename)
+		return n_workers
+
+
+def get_summary(messages):
+	# Summary of earlier summarisations, from message after system one, or None
+	if (len(messages) > 1) and (messages[1]['role'] == 'user') and messages[1]['content'].startswith(SUMMARY_PREFIX):
+		content = messages[1]['content']
+		return content[(content.index(':\n"') + 3):-1]
+	return None
+
+
+def get_workdir_fingerprint(workdirpath):
+	# Names, sizes and modification times of files in workdir except agent, whose source is hashed separately
+	entries = []
+	for dirpath, dirnames, filenames in os.walk(workdirpath):
+		dirnames.sort()
+		for filename in sorted(filenames):
+			filepath = os.path.join(dirpath, filename)
+			if filepath == os.path.join(workdirpath, AGENT_FILENAME):
+				continue
+			try:
+				stat = os.lstat(filepath)
+			except OSError:
+				continue
+			entries.append(f'{os.path.relpath(filepath, workdirpath)}\0{stat.st_size}\0{stat.st_mtime_ns}')
+	return hashlib.sha256('\n'.join(entries).encode('utf-8', errors='surrogateescape')).hexdigest()
 
-	if not os.path.isfile(SUPERVISOR_LOG_FILENAME):
-		with open(SUPERVISOR_LOG_FILENAME, 'w') as file:
-			file.write('')
 
-	if not os.path.isfile(AGENT_LOG_FILENAME):
-		with open(AGENT_LOG_FILENAME, 'w') as file:
-			file.write('')
+class ResultCache:
+	# Agent execution results by key, evicted when older than RESULT_CACHE_TTL or least recently used beyond RESULT_CACHE_SIZE;
+	# file is rewritten atomically on each change
 
-	try:
-		os.mkdir(LINEAGE_DIRNAME)
-	except:
-		pass
+	def __init__(self, filename):
+		self.filename = filename
+		self.entries = None # key -> result, in order of use
 
-	try:
-		os.mkdir(WORKDIRPATH)
-	except:
+	def load(self):
+		if self.entries is None:
+			self.entries = collections.OrderedDict()
+			try:
+				with open(self.filename, 'r') as file:
+					self.entries.update(json.loads(file.read()))
+			except:
+				pass
+		return self.entries
+
+	def save(self):
+		write_file_atomically(self.filename, json.dumps(self.entries, ensure_ascii=False).encode('utf-8'))
+
+	@staticmethod
+	def get_key(agent_src, fingerprint):
+		return hashlib.sha256(f'{FINAL_GOAL_PROMPT}\0{agent_src}\0{fingerprint}'.encode('utf-8', errors='surrogateescape')).hexdigest()
+
+	def get(self, key):
+		entries = self.load()
+		result = entries.get(key)
+		if result is None:
+			return None
+		if time.time() - result['t'] > RESULT_CACHE_TTL:
+			del entries[key]
+			self.save()
+			return None
+		entries.move_to_end(key)
+		self.save()
+		return result
+
+	def put(self, key, result):
+		entries = self.load()
+		entries[key] = dict(result, t=time.time())
+		entries.move_to_end(key)
+		while len(entries) > RESULT_CACHE_SIZE:
+			entries.popitem(last=False)
+		self.save()
+
+
+class BlobPack:
+	# Blobs appended to pack file, addressed by SHA-256 of content, so that identical ones are stored once; blob is
+	# compressed with the previous one of its kind as dictionary, so that near-duplicate costs about its difference,
+	# and chains are cut at LINEAGE_DELTA_DEPTH, so that reading any blob decompresses at most that many; index
+	# (JSON Lines) maps blobs to places in pack, and has entries of subclass that refer to blobs; it is mirrored
+	# in memory for random access
+
+	KINDS = [] # of blobs that entries refer to, by hash in fields of the same names
+
+	def __init__(self, dirpath, pack_filename=LINEAGE_PACK_FILENAME, index_filename=LINEAGE_INDEX_FILENAME):
+		self.pack_filename = os.path.join(dirpath, pack_filename)
+		self.index_filename = os.path.join(dirpath, index_filename)
+		self.blobs = None # hash -> {'offset', 'length', 'size', 'codec', 'base', 'depth'}
+		self.entries = None
+		self.bases = {} # kind -> (hash, content) of blob that is dictionary of the next one
+		self.lock = threading.Lock()
+
+	def load(self):
+		if self.entries is None:
+			self.blobs = {}
+			self.entries = {}
+			try:
+				with open(self.index_filename, 'rb') as file:
+					data = file.read()
+			except FileNotFoundError:
+				data = b''
+			n_valid_bytes = 0
+			last_entry = None
+			for line in data.splitlines(keepends=True):
+				if not line.endswith(b'\n'):
+					break # torn by crash during append
+				try:
+					record = json.loads(line)
+				except ValueError:
+					break
+				if 'hash' in record:
+					self.blobs[record.pop('hash')] = record
+				else:
+					self.add_entry(record)
+					last_entry = record
+				n_valid_bytes += len(line)
+			if n_valid_bytes < len(data):
+				with open(self.index_filename, 'r+b') as file:
+					file.truncate(n_valid_bytes)
+			# Blob written to pack but not to index is garbage
+			n_pack_bytes = max((blob['offset'] + blob['length'] for blob in self.blobs.values()), default=0)
+			if os.path.isfile(self.pack_filename) and (os.path.getsize(self.pack_filename) > n_pack_bytes):
+				with open(self.pack_filename, 'r+b') as file:
+					file.truncate(n_pack_bytes)
+			if last_entry is not None:
+				for kind in self.KINDS:
+					if last_entry.get(kind) is not None:
+						self.bases[kind] = (last_entry[kind], None)
+		return self.entries
+
+	def add_entry(self, record):
+		# Entry of index in memory; these are kept in order of index, subclasses key them as they look them up
+		self.entries[len(self.entries)] = record
+
+	def append_index(self, record):
+		with open(self.index_filename, 'ab') as file:
+			file.write((json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8'))
+			file.flush()
+			os.fsync(file.fileno())
+
+	@staticmethod
+	def compress(data, codec, base):
+		if codec == 'zstd':
+			return zstandard.ZstdCompressor(level=19, dict_data=(zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT) if (base is not None) else None)).compress(data)
+		compressor = zlib.compressobj(9, zdict=base) if (base is not None) else zlib.compressobj(9)
+		return compressor.compress(data) + compressor.flush()
+
+	@staticmethod
+	def decompress(data, codec, base):
+		if codec == 'zstd':
+			if zstandard is None:
+				raise RuntimeError('blob is compressed with zstd, but "zstandard" module is not found')
+			return zstandard.ZstdDecompressor(dict_data=(zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT) if (base is not None) else None)).decompress(data)
+		decompressor = zlib.decompressobj(zdict=base) if (base is not None) else zlib.decompressobj()
+		return decompressor.decompress(data) + decompressor.flush()
+
+	def put_blob(self, content, kind):
+		blob_hash = hashlib.sha256(content).hexdigest()
+		if blob_hash not in self.blobs:
+			base_hash, base = self.bases.get(kind, (None, None))
+			if (base_hash is not None) and (self.blobs[base_hash]['depth'] >= LINEAGE_DELTA_DEPTH):
+				base_hash = None
+			if (base_hash is not None) and (base is None):
+				base = self.get_blob(base_hash)
+			codec = 'zstd' if ((LINEAGE_COMPRESSION == 'zstd') and (zstandard is not None)) else 'zlib'
+			data = self.compress(content, codec, (base if (base_hash is not None) else None))
+			with open(self.pack_filename, 'ab') as file:
+				offset = file.tell()
+				file.write(data)
+				file.flush()
+				os.fsync(file.fileno())
+			blob = {'offset' : offset, 'length' : len(data), 'size' : len(content), 'codec' : codec, 'base' : base_hash, 'depth' : ((self.blobs[base_hash]['depth'] + 1) if (base_hash is not None) else 0)}
+			self.append_index(dict(blob, hash=blob_hash))
+			self.blobs[blob_hash] = blob
+		self.bases[kind] = (blob_hash, content)
+		return blob_hash
+
+	def get_blob(self, blob_hash):
+		blob = self.blobs[blob_hash]
+		base = self.get_blob(blob['base']) if (blob['base'] is not None) else None
+		with open(self.pack_filename, 'rb') as file:
+			file.seek(blob['offset'])
+			data = file.read(blob['length'])
+		return self.decompress(data, blob['codec'], base)
+
+	def get_stats(self):
+		self.load()
+		return {'n_entries' : len(self.entries), 'n_blobs' : len(self.blobs), 'n_bytes' : sum(blob['size'] for blob in self.blobs.values()), 'n_packed_bytes' : sum(blob['length'] for blob in self.blobs.values())}
+
+
+class LineageStore(BlobPack):
+	# Agents of lineage and results of their runs as blobs of pack; entries map agent numbers to blobs
+
+	KINDS = ['agent', 'result']
+
+	def add_entry(self, record):
+		# Agent number -> {'agent' : hash, 'result' : hash or None}
+		self.entries[record['i_agent']] = {'agent' : record['agent'], 'result' : record['result']}
+
+	@property
+	def n_agents(self):
+		return (max(self.load()) + 1) if (len(self.load()) > 0) else 0
+
+	def put(self, i_agent, agent_src, result):
+		# Agent, and result of its run (execution results message, in full, without feedback encoding) if any
+		with self.lock:
+			self.load()
+			record = {'i_agent' : i_agent, 'agent' : self.put_blob(agent_src.encode('utf-8', errors='surrogateescape'), 'agent'),
+				'result' : (self.put_blob(result.encode('utf-8', errors='surrogateescape'), 'result') if (result is not None) else None)}
+			self.append_index(record)
+			self.add_entry(record)
+
+	def get(self, i_agent):
+		# (agent source, result or None); KeyError if there is no such agent
+		with self.lock:
+			entry = self.load()[i_agent]
+			return (self.get_blob(entry['agent']).decode('utf-8', errors='surrogateescape'),
+				self.get_blob(entry['result']).decode('utf-8', errors='surrogateescape') if (entry['result'] is not None) else None)
+
+	def import_files(self, dirpath):
+		# Lineage dir of earlier versions: file per agent, agent.py.N; files are removed once stored
+		agent_pattern = re.compile(re.escape(AGENT_FILENAME) + r'\.(\d+)')
+		numbered_filenames = sorted((int(match.group(1)), match.group(0)) for match in map(agent_pattern.fullmatch, os.listdir(dirpath)) if match is not None)
+		for i_agent, filename in numbered_filenames:
+			with open(os.path.join(dirpath, filename), 'r', errors='surrogateescape') as file:
+				self.put(i_agent, file.read(), None)
+		for i_agent, filename in numbered_filenames:
+			os.remove(os.path.join(dirpath, filename))
+		return len(numbered_filenames)
+
+	def get_stats(self):
+		stats = super().get_stats()
+		stats.update({'n_agents' : len(self.entries), 'n_referenced_bytes' : sum(self.blobs[entry[kind]]['size'] for entry in self.entries.values() for kind in self.KINDS if entry[kind] is not None)})
+		return stats
+
+
+class CassetteMiss(StopRun):
+	reason = 'cassette'
+
+
+class ReplayedCompletion:
+	# Stands for response of provider, from cassette: body as whole, or its lines as if streamed, with recorded timing
+
+	def __init__(self, content, entry, stream):
+		self.status_code = 200
+		self.content = content
+		self.is_streamed = stream
+		self.ttfb = entry['ttfb'] if LLM_CASSETTE_LATENCY else 0.0
+		self.connect_duration = entry['connect'] if LLM_CASSETTE_LATENCY else 0.0
+		self.body_duration = max(0.0, entry['latency'] - entry['ttfb']) if LLM_CASSETTE_LATENCY else 0.0
+		time.sleep(self.ttfb if stream else (self.ttfb + self.body_duration))
+
+	def json(self):
+		return json.loads(self.content)
+
+	def iter_lines(self):
+		lines = self.content.splitlines()
+		for line in lines:
+			if self.body_duration > 0:
+				time.sleep(self.body_duration / len(lines))
+			yield line
+
+	def close(self):
 		pass
 
-	if not os.path.isfile(f'{WORKDIRPATH}/{AGENT_FILENAME}'):
-		with open(f'{WORKDIRPATH}/{AGENT_FILENAME}', 'w') as file:
-			file.write('pass')
 
-	force_summarisation = False
+class Cassette(BlobPack):
+	# LLM calls as blobs of pack: request, as sent but without API key, and response, as received (body, or lines of
+	# server-sent events); entries, in order of recording, map SHA-256 of provider and request to them, with usage
+	# and timing; identical requests (e.g. first ones of lineages of population) are replayed in order of recording,
+	# the last one repeatedly
+
+	KINDS = ['request', 'response']
+
+	def __init__(self, dirpath=LLM_CASSETTE_DIRNAME):
+		os.makedirs(dirpath, exist_ok=True)
+		super().__init__(dirpath)
+		self.n_replayed = collections.Counter() # by key
+
+	@staticmethod
+	def get_key(provider, data, stream):
+		return hashlib.sha256(json.dumps({'provider' : provider.value, 'stream' : stream, 'data' : data}, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+	def add_entry(self, record):
+		self.entries.setdefault(record['key'], []).append(record)
+
+	def record(self, provider, data, stream, content, n_prompt_tokens, n_completion_tokens, stats):
+		with self.lock:
+			self.load()
+			record = {'key' : self.get_key(provider, data, stream), 'provider' : provider.value, 'model' : MODEL_ID[provider], 'stream' : stream,
+				'request' : self.put_blob(json.dumps(data).encode('utf-8'), 'request'), 'response' : self.put_blob(content, 'response'),
+				'latency' : stats['latency'], 'connect' : stats['connect'], 'ttfb' : stats['ttfb'],
+				'usage' : {'prompt_tokens' : n_prompt_tokens, 'completion_tokens' : n_completion_tokens, 'cached_tokens' : stats['n_cached_tokens'], 'cache_write_tokens' : stats['n_cache_write_tokens']}}
+			self.append_index(record)
+			self.add_entry(record)
+
+	def find(self, provider, data, stream):
+		# Entry that is replayed next for this request, or None
+		key = self.get_key(provider, data, stream)
+		with self.lock:
+			entries = self.load().get(key)
+			return entries[min(self.n_replayed[key], len(entries) - 1)] if (entries is not None) else None
+
+	def replay(self, provider, data, stream):
+		key = self.get_key(provider, data, stream)
+		with self.lock:
+			entries = self.load().get(key)
+			if entries is None:
+				raise CassetteMiss(f'Request to {provider.value} :: {MODEL_ID[provider]} is not in cassette of {os.path.dirname(self.index_filename)}: recording ends here, or run has diverged from recorded one (other settings, or output of agents differs).')
+			entry = entries[min(self.n_replayed[key], len(entries) - 1)]
+			self.n_replayed[key] += 1
+			content = self.get_blob(entry['response'])
+		return ReplayedCompletion(content, entry, stream)
+
+
+cassette = None
+
+
+def get_cassette():
+	global cassette
+	if cassette is None:
+		cassette = Cassette()
+	return cassette
+
+
+def rotate_log(filename):
+	# filename.1.gz is the latest rotated log, filename.{LOG_ROTATION_COUNT}.gz the oldest kept
+	if (LOG_ROTATION_SIZE <= 0) or (not os.path.isfile(filename)) or (os.path.getsize(filename) <= LOG_ROTATION_SIZE):
+		return False
+	for k in range(LOG_ROTATION_COUNT - 1, 0, -1):
+		if os.path.isfile(f'{filename}.{k}.gz'):
+			os.replace(f'{filename}.{k}.gz', f'{filename}.{k + 1}.gz')
+	if LOG_ROTATION_COUNT > 0:
+		with open(filename, 'rb') as src_file, gzip.open(f'{filename}.1.gz.tmp', 'wb') as dst_file:
+			shutil.copyfileobj(src_file, dst_file)
+		os.replace(f'{filename}.1.gz.tmp', f'{filename}.1.gz')
+	with open(filename, 'w') as file:
+		file.write('')
+	return True
+
+
+class Summarisation(threading.Thread):
+	# Summarisation of snapshot of conversation, run either directly or in background while agent executes;
+	# conversation messages [0, n_summarised_messages) are to be replaced with summary
+
+	def __init__(self, router, provider, messages, on_extra_cost=None):
+		super().__init__(daemon=True)
+		self.router = router
+		self.provider = provider
+		self.on_extra_cost = on_extra_cost
+		self.on_delta = None
+		self.result = None
+		self.exception = None
+
+		self.summary = get_summary(messages)
+		i_first = 1 if (self.summary is None) else 2
+		if (self.summary is not None) and (estimate_tokens(self.summary) > SUMMARY_MAX_FRACTION * SUMMARISATION_TOKENS_THRESHOLD):
+			self.summary = None # summary is summarised again together with older turns
+		# Turn ends with agent from assistant; kept are last turns that fit SUMMARISATION_KEEP_FRACTION
+		turn_ends = [(i + 1) for i in range(i_first, len(messages)) if messages[i]['role'] == 'assistant']
+		self.n_summarised_messages = len(messages)
+		for i_end in reversed(turn_ends[-(SUMMARISATION_KEEP_TURNS + 1):]):
+			if sum(estimate_message_tokens(msg) for msg in messages[i_end:]) > SUMMARISATION_KEEP_FRACTION * SUMMARISATION_TOKENS_THRESHOLD:
+				break
+			self.n_summarised_messages = i_end
+		self.n_kept_turns = sum(1 for msg in messages[self.n_summarised_messages:] if msg['role'] == 'assistant')
 
-	clear_agent_wnd = False
-	is_paused = False
+		self.messages = messages[:self.n_summarised_messages] + [{'role' : 'user', 'content' : (SUMMARISATION_REQUEST if (self.summary is None) else SUMMARISATION_APPEND_REQUEST)}]
+		self.n_estimated_tokens = sum(estimate_message_tokens(msg) for msg in self.messages)
 
-	quit = False
+		# Compared with summarisation of whole conversation, kept messages are not sent and summary is not rewritten
+		self.n_saved_prompt_tokens = sum(estimate_message_tokens(msg) for msg in messages[self.n_summarised_messages:])
+		self.n_saved_completion_tokens = estimate_tokens(self.summary) if (self.summary is not None) else 0
 
-	while not quit:
-		provider = secrets.choice(API_PROVIDER)
+	def run(self):
+		try:
+			self.result = self.router.call(self.provider, self.messages, self.on_delta, self.on_extra_cost)
+			self.router.record_prompt_tokens(self.result[0], self.n_estimated_tokens, self.result[2])
+		except Exception as exception:
+			self.exception = exception
+
+	def get_summary(self):
+		response = self.result[1]
+		return response if (self.summary is None) else f'{self.summary}\n\n{response}'
+
+	def get_savings_str(self):
+		return f'~{self.n_saved_prompt_tokens} prompt and ~{self.n_saved_completion_tokens} response tokens saved, {self.n_kept_turns} last turns kept'
+
+
+class MetricsLog:
+	# Record of iteration assembled from events of lineage, appended to JSON Lines file when iteration finishes:
+	# LLM calls (time queued by coordinator, of connecting, to first byte, to first token, total; tokens; cost), agent run (wall and CPU time,
+	# max RSS in KiB, output bytes, exceeded budgets), background workers (CPU time since previous report, RSS, new output bytes), tokens of
+	# execution results before and after feedback encoding, duration and cost of iteration
+
+	LLM_FIELDS = ['purpose', 'provider', 'latency', 'queued', 'connect', 'ttfb', 'ttft', 'prompt_tokens', 'completion_tokens', 'cached_tokens', 'cost']
+	AGENT_FIELDS = ['source', 'exit_code', 'is_timed_out', 'duration', 'cpu_time', 'max_rss', 'stdout_bytes', 'stderr_bytes', 'exceeded_budgets']
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.record = None
+
+	def __call__(self, event):
+		event_type = event['event']
+		if event_type == 'iteration_started':
+			self.record = {'i_agent' : event['i_agent'], 't' : event['t'], 'provider' : event['provider'], 'model' : event['model'], 'cost' : -event['cost'], 'llm_calls' : [], 'agent' : None, 'workers' : None, 'feedback' : None}
+		elif self.record is None:
+			return
+		elif event_type == 'llm_finished':
+			self.record['llm_calls'].append({field : event.get(field) for field in self.LLM_FIELDS})
+		elif event_type == 'agent_finished':
+			self.record['agent'] = {field : event.get(field) for field in self.AGENT_FIELDS}
+		elif event_type == 'workers_reported':
+			self.record['workers'] = event['workers']
+		elif event_type == 'feedback_encoded':
+			self.record['feedback'] = {'baseline_tokens' : event['baseline_tokens'], 'tokens' : event['tokens']}
+		elif event_type == 'iteration_finished':
+			self.record['duration'] = event['duration']
+			self.record['cost'] += event['cost']
+			with open(self.filename, 'a') as file:
+				file.write(json.dumps(self.record, separators=(',', ':')) + '\n')
+			self.record = None
+
+
+class LineageView:
+	# Consumer of events of lineage (see Lineage.emit()); this one ignores them
+
+	def __call__(self, event):
+		pass
 
-		wnd_help.erase()
-		wnd_help.addstr(0, 0, 'S: force summarisation' + (' (PENDING)' if force_summarisation else ''))
-		wnd_help.addstr(1, 0, 'Q: quit (run again to continue) | P: pause (' + ('ON' if is_paused else 'OFF') + ') | C: clear agent window every run (' + ('ON' if clear_agent_wnd else 'OFF') + ')')
-		prv_mdl_str = f'{provider.value} :: {MODEL_ID[provider]}'
-		wnd_help.addstr(0, curses.COLS - 1 - len(prv_mdl_str), prv_mdl_str)
-		cost_str = f'Total cost ≈ ${cost:.2f}'
-		wnd_help.addstr(1, curses.COLS - 1 - len(cost_str), cost_str)
-		wnd_help.refresh()
 
-		if is_paused:
-			time.sleep(0.001) # idle
+class CursesView(LineageView):
+	# Supervisor and agent windows of single-lineage TUI
+
+	def __init__(self, wnd_super, wnd_agent):
+		self.wnd_super = wnd_super
+		self.wnd_agent = wnd_agent
+		self.stream_display = None
+		self.clear_agent_wnd = False
+
+	def __call__(self, event):
+		event_type = event['event']
+		if event_type == 'report':
+			self.wnd_super.addstr(event['text'].replace('\n', '\n\r'))
+			self.wnd_super.refresh()
+		elif event_type == 'llm_started':
+			self.stream_display = StreamDisplay(self.wnd_super, PythonQuoteScanner() if (event['purpose'] == 'agent') else None)
+		elif event_type == 'llm_delta':
+			if self.stream_display is not None:
+				self.stream_display(event['text'])
+		elif event_type in {'llm_finished', 'llm_failed'}:
+			if self.stream_display is not None:
+				self.stream_display.finish()
+				self.stream_display = None
+		elif event_type == 'agent_started':
+			if self.clear_agent_wnd:
+				self.wnd_agent.erase()
+			else:
+				self.wnd_agent.addstr(event['header'] + '\r')
+			self.wnd_agent.refresh()
+		elif event_type == 'agent_output':
+			try:
+				self.wnd_agent.addstr(event['text'].replace('\0', ''))
+			except curses.error:
+				pass
+			self.wnd_agent.refresh()
+
+
+class Lineage:
+	# One line of agents with its own conversation, workdir, lineage dir, logs, and counters, all in dirpath;
+	# supervisor iterates either single lineage in current dir, or population of them
+
+	def __init__(self, dirpath='.', view=None, router=None):
+		self.dirpath = dirpath
+		self.view = view if (view is not None) else LineageView() # receives events
+		self.router = router if (router is not None) else Router(API_PROVIDER)
+		self.message_log = MessageLog(self.path(MESSAGES_FILENAME), self.path(LEGACY_MESSAGES_FILENAME))
+		self.metrics_log = MetricsLog(self.path(METRICS_FILENAME))
+		self.result_cache = ResultCache(self.path(RESULT_CACHE_FILENAME))
+		self.lineage_store = LineageStore(self.path(LINEAGE_DIRNAME))
+		self.workdirpath = self.path(WORKDIRPATH)
+		self.workers = WorkerPool(self.workdirpath, self.path(WORKERS_DIRNAME), self.path(WORKERS_FILENAME))
+		self.i_agent = 0
+		self.n_summarisations = 0
+		self.n_prompt_tokens = 0
+		self.n_total_prompt_tokens = 0 # of all LLM calls...
+		self.n_cached_tokens = 0 # ...and of these, read from provider's cache
+		self.n_preflight_failures = 0 # agents not run because they do not compile...
+		self.preflight_saved_sec = 0.0 # ...and time that their runs would take, approximately
+		self.launch_duration = None # sec, of the shortest agent run
+		self.n_replies = {'full' : 0, 'patch' : 0} # agents obtained as whole or patch...
+		self.n_reply_completion_tokens = {'full' : 0, 'patch' : 0} # ...and their completion tokens
+		self.cost = 0.0
+		self.cost_lock = threading.Lock() # cost of cancelled hedged call may come from another thread
+		self.provider = None # of current iteration
+		self.agent_result = None # execution results message of the latest run of current agent, without feedback encoding
+		self.agent_outputs = None # its parts, (prefix, stdout, stderr, report on background workers), for feedback encoding
+		self.n_result_saved_tokens = 0 # by feedback encoding of it, in n_feedback_saved_tokens
+		self.feedback_encoder = FeedbackEncoder()
+		self.n_feedback_saved_tokens = 0 # estimated, per message; each saved token is saved again in every later prompt until summarisation
+		self.force_summarisation = False
+		self.background_summarisation = None
+		self.is_summary_near_threshold = False # last summarisation has not brought conversation under background threshold; summarising it again in background would not either
+		self.is_terminus = False
+
+	def path(self, filename):
+		return os.path.join(self.dirpath, filename)
+
+	def begin(self):
+		# Begin anew or continue
+		os.makedirs(self.dirpath, exist_ok=True)
+
+		checkpoint = None
+		try:
+			with open(self.path(COUNTERS_FILENAME), 'r') as file:
+				counters = json.loads(file.read())
+				checkpoint = counters
+				try:
+					self.i_agent = counters['i_agent']
+				except KeyError:
+					pass
+				try:
+					self.n_prompt_tokens = counters['n_prompt_tokens']
+				except KeyError:
+					pass
+				try:
+					self.n_summarisations = counters['n_summarisations']
+				except KeyError:
+					pass
+				try:
+					self.cost = counters['cost']
+				except KeyError:
+					pass
+				try:
+					self.n_total_prompt_tokens = counters['n_total_prompt_tokens']
+					self.n_cached_tokens = counters['n_cached_tokens']
+				except KeyError:
+					pass
+				try:
+					self.n_preflight_failures = counters['n_preflight_failures']
+					self.preflight_saved_sec = counters['preflight_saved_sec']
+				except KeyError:
+					pass
+				try:
+					self.n_replies = counters['n_replies']
+					self.n_reply_completion_tokens = counters['n_reply_completion_tokens']
+				except KeyError:
+					pass
+				try:
+					self.force_summarisation = counters['force_summarisation']
+				except KeyError:
+					pass
+				try:
+					self.n_feedback_saved_tokens = counters['n_feedback_saved_tokens']
+				except KeyError:
+					pass
+		except:
+			pass
+
+		is_conversation_lost = (checkpoint is not None) and (checkpoint.get('i_agent', 0) > 0) and (not self.message_log.exists())
+		if self.message_log.exists():
+			self.message_log.load() # also migrates messages file of earlier versions
 		else:
-			if force_summarisation or (n_prompt_tokens > SUMMARISATION_TOKENS_THRESHOLD):
-				super_str = ''
-				if force_summarisation:
-					super_str += 'Summarisation has been requested. '
-				if n_prompt_tokens > SUMMARISATION_TOKENS_THRESHOLD:
-					super_str += f'Reached prompt tokens threshold {SUMMARISATION_TOKENS_THRESHOLD}. '
-				super_str += f'Summarising via {prv_mdl_str} ... '
-				add_supervisor_log(super_str)
-				wnd_super.addstr(super_str)
-				wnd_super.refresh()
-
-				add_user_message('Please summarise the conversation up to now.')
+			self.add_message('system', SYSTEM_MESSAGE)
+
+		for filename in [SUPERVISOR_LOG_FILENAME, AGENT_LOG_FILENAME]:
+			if not os.path.isfile(self.path(filename)):
+				with open(self.path(filename), 'w') as file:
+					file.write('')
 
+		try:
+			os.mkdir(self.path(LINEAGE_DIRNAME))
+		except:
+			pass
+
+		try:
+			os.mkdir(self.workdirpath)
+		except:
+			pass
+
+		n_imported_agents = self.lineage_store.import_files(self.path(LINEAGE_DIRNAME))
+		if n_imported_agents > 0:
+			self.report(f'{n_imported_agents} agent files of {LINEAGE_DIRNAME} are moved to its {LINEAGE_PACK_FILENAME}.\n')
+
+		self.repair(checkpoint, is_conversation_lost)
+
+		n_stale_workers = self.workers.kill_stale()
+		if n_stale_workers > 0:
+			self.report(f'{n_stale_workers} background worker(s) left running by previous supervisor are killed.\n')
+
+		if not os.path.isfile(f'{self.workdirpath}/{AGENT_FILENAME}'):
+			with open(f'{self.workdirpath}/{AGENT_FILENAME}', 'w') as file:
+				file.write('pass')
+
+	def repair(self, checkpoint, is_conversation_lost):
+		# Crash (kill, OOM, terminal drop) between writes of lineage dir, workdir, messages and checkpoint
+		# may leave them out of step; they are brought back in step here, and what was done is reported
+		for filename in [COUNTERS_FILENAME, MESSAGES_FILENAME, RESULT_CACHE_FILENAME]:
+			if os.path.isfile(self.path(f'{filename}.tmp')):
+				os.remove(self.path(f'{filename}.tmp')) # unfinished write-temp-then-rename; the file itself is intact
+
+		# Summarisation rewrites messages before checkpoint is saved
+		messages = self.message_log.load()
+		if (len(messages) > 1) and messages[1]['content'].startswith(SUMMARY_PREFIX):
+			match = re.match(r' (\d+) times', messages[1]['content'][len(SUMMARY_PREFIX):])
+			if (match is not None) and (int(match.group(1)) > self.n_summarisations):
+				self.report(f'REPAIR: {MESSAGES_FILENAME} has summary #{match.group(1)}, checkpoint has {self.n_summarisations} summarisations.\n')
+				self.n_summarisations = int(match.group(1))
+		if is_conversation_lost:
+			self.report(f'REPAIR: {MESSAGES_FILENAME} is missing; conversation begins anew.\n')
+		elif (checkpoint is not None) and (self.n_summarisations == checkpoint.get('n_summarisations')) and (len(messages) < checkpoint.get('n_messages', 0)):
+			self.report(f'REPAIR: {MESSAGES_FILENAME} has {len(messages)} messages, checkpoint has {checkpoint["n_messages"]}; the last ones are lost.\n')
+
+		# Agent i_agent is in workdir, earlier ones are in lineage store, where each is put just before next agent is written;
+		# workdir agent is compared by hash of its bytes, as stored, so that agent that is not valid UTF-8 is recognised too
+		n_lineage_agents = self.lineage_store.n_agents
+		try:
+			with open(f'{self.workdirpath}/{AGENT_FILENAME}', 'rb') as file:
+				agent_hash = hashlib.sha256(file.read()).hexdigest()
+		except OSError:
+			agent_hash = None
+		if (n_lineage_agents > self.i_agent) and (agent_hash == self.lineage_store.load()[n_lineage_agents - 1]['agent']):
+			n_lineage_agents -= 1
+			self.report(f'REPAIR: agent {n_lineage_agents} is stored in {LINEAGE_DIRNAME}, but next one had not been written.\n')
+		if n_lineage_agents != self.i_agent:
+			self.report(f'REPAIR: checkpoint has agent {self.i_agent}, {LINEAGE_DIRNAME} has {n_lineage_agents} earlier agents; continuing with agent {n_lineage_agents}.\n')
+			self.i_agent = n_lineage_agents
+
+		if checkpoint is None:
+			if self.i_agent > 0:
+				# Cost from metrics records of iterations, the other counters restart
 				try:
-					response, n_prompt_tokens, n_completion_tokens = get_llm_response(provider)
+					with open(self.path(METRICS_FILENAME), 'r') as file:
+						self.cost = sum(json.loads(line)['cost'] for line in file if line.endswith('\n'))
+				except Exception:
+					pass
+				self.report(f'REPAIR: {COUNTERS_FILENAME} is missing or unreadable; cost ${self.cost:.4f} is recovered from {METRICS_FILENAME}.\n')
+		else:
+			if checkpoint.get('is_iterating', False):
+				self.report(f'REPAIR: iteration of agent {checkpoint["i_agent"]} via {checkpoint["provider"]} was interrupted; its LLM cost, if any, is not accounted.\n')
+			if checkpoint.get('background_summarisation') is not None:
+				self.report(f'REPAIR: background summarisation via {checkpoint["background_summarisation"]} was interrupted; it starts again when needed.\n')
+
+		if (checkpoint is None) or checkpoint.get('is_iterating', False) or (checkpoint.get('i_agent', 0) != self.i_agent):
+			self.save_checkpoint(False)
+
+	def save_checkpoint(self, is_iterating):
+		# Single record of counters and loop state, written atomically after (and at start of) every iteration
+		checkpoint = {'i_agent' : self.i_agent, 'n_prompt_tokens' : self.n_prompt_tokens, 'n_summarisations' : self.n_summarisations, 'cost' : self.cost, 'n_total_prompt_tokens' : self.n_total_prompt_tokens, 'n_cached_tokens' : self.n_cached_tokens, 'n_preflight_failures' : self.n_preflight_failures, 'preflight_saved_sec' : self.preflight_saved_sec, 'n_replies' : self.n_replies, 'n_reply_completion_tokens' : self.n_reply_completion_tokens, 'n_feedback_saved_tokens' : self.n_feedback_saved_tokens,
+			'provider' : (self.provider.value if (self.provider is not None) else None), 'is_iterating' : is_iterating, 'force_summarisation' : self.force_summarisation,
+			'background_summarisation' : (self.background_summarisation.provider.value if (self.background_summarisation is not None) else None), 'n_messages' : len(self.message_log.load())}
+		write_file_atomically(self.path(COUNTERS_FILENAME), json.dumps(checkpoint).encode('utf-8'))
+
+	def add_message(self, role, content):
+		self.message_log.append({'role' : role, 'content' : content})
+
+	def emit(self, event_type, **fields):
+		# Events, JSON-serialisable dicts, are what views show or headless supervisor prints:
+		# report (supervisor log text), iteration_started/finished, llm_started/delta/finished/failed,
+		# summarised, agent_started/output/finished
+		event = dict({'event' : event_type, 't' : round(time.time(), 3)}, **fields)
+		self.metrics_log(event)
+		self.view(event)
+
+	def emit_llm_finished(self, purpose, result, n_predicted_tokens=None):
+		provider, response, n_prompt_tokens, n_completion_tokens, llm_stats = result
+		self.emit('llm_finished', purpose=purpose, provider=provider.value, model=MODEL_ID[provider], hedged_provider=(llm_stats['hedged_provider'].value if (llm_stats.get('hedged_provider') is not None) else None),
+			latency=llm_stats['latency'], queued=llm_stats.get('queued'), connect=llm_stats.get('connect'), ttfb=llm_stats.get('ttfb'), ttft=llm_stats['ttft'], tokens_per_sec=llm_stats['tokens_per_sec'],
+			prompt_tokens=n_prompt_tokens, predicted_prompt_tokens=n_predicted_tokens, completion_tokens=n_completion_tokens, cached_tokens=llm_stats['n_cached_tokens'],
+			cost=get_cost(provider, n_prompt_tokens, n_completion_tokens, llm_stats))
+
+	def on_llm_delta(self, delta):
+		self.emit('llm_delta', text=delta)
+
+	def report(self, s):
+		with open(self.path(SUPERVISOR_LOG_FILENAME), 'a') as file:
+			file.write(s)
+		self.emit('report', text=s)
+
+	def get_mean_completion_tokens_str(self):
+		return ', '.join(f'{reply_mode} {(self.n_reply_completion_tokens[reply_mode] / self.n_replies[reply_mode]):.0f}' for reply_mode in ['full', 'patch'] if self.n_replies[reply_mode] > 0)
+
+	def add_cost(self, cost):
+		with self.cost_lock:
+			self.cost += cost
+
+	def add_llm_cost(self, provider, n_prompt_tokens, n_completion_tokens, llm_stats):
+		self.add_cost(get_cost(provider, n_prompt_tokens, n_completion_tokens, llm_stats))
+		self.n_total_prompt_tokens += n_prompt_tokens
+		self.n_cached_tokens += llm_stats['n_cached_tokens']
+
+	def get_cache_hit_rate(self):
+		return (self.n_cached_tokens / self.n_total_prompt_tokens) if (self.n_total_prompt_tokens > 0) else 0.0
+
+	def get_llm_response(self, provider, is_agent):
+		purpose = 'agent' if is_agent else 'summary'
+		self.emit('llm_started', purpose=purpose, provider=provider.value, model=MODEL_ID[provider])
+		n_estimated_tokens = self.message_log.n_tokens
+		n_predicted_tokens = self.router.predict_prompt_tokens(provider, n_estimated_tokens)
+		try:
+			result = self.router.call(provider, self.message_log.load(), self.on_llm_delta, self.add_cost)
+		except Exception as exception:
+			self.emit('llm_failed', purpose=purpose, provider=provider.value, model=MODEL_ID[provider], error=type(exception).__name__)
+			raise
+		if result[0] != provider: # hedged call won
+			n_predicted_tokens = self.router.predict_prompt_tokens(result[0], n_estimated_tokens)
+		result[4]['n_predicted_tokens'] = n_predicted_tokens
+		self.router.record_prompt_tokens(result[0], n_estimated_tokens, result[2])
+		self.emit_llm_finished(purpose, result, n_predicted_tokens)
+		self.add_message('assistant', result[1])
+		return result
+
+	def get_summarisation_reason(self, provider, n_predicted_tokens):
+		# Why conversation should be summarised before sending next prompt of n_predicted_tokens, or None
+		reason = ''
+		if self.force_summarisation:
+			reason += 'Summarisation has been requested. '
+		if n_predicted_tokens > SUMMARISATION_TOKENS_THRESHOLD:
+			reason += f'Next prompt would have ~{n_predicted_tokens} tokens, over threshold {SUMMARISATION_TOKENS_THRESHOLD}. '
+		context_window = CONTEXT_WINDOW[provider].get(MODEL_ID[provider])
+		if (context_window is not None) and (n_predicted_tokens + (MAX_COMPLETION_TOKENS if (MAX_COMPLETION_TOKENS is not None) else 0x2000) > context_window):
+			reason += f'Next prompt would have ~{n_predicted_tokens} tokens, too many for context window {context_window}. '
+		return reason if (len(reason) > 0) else None
+
+	def get_summary_messages(self, summary):
+		return [{'role' : 'system', 'content' : SYSTEM_MESSAGE}, {'role' : 'user', 'content' : f'{SUMMARY_PREFIX} {self.n_summarisations} times by request or after reaching certain threshold of prompt tokens. The following is the summary up to the messages after it (if any), provided by yourself:\n"{summary}"'}]
+
+	def apply_summarisation(self, summarisation):
+		# Splices summary in place of summarised prefix of conversation, keeping later messages
+		provider, response, n_prompt_tokens, n_completion_tokens, llm_stats = summarisation.result
+		self.n_summarisations += 1
+		self.add_llm_cost(provider, n_prompt_tokens, n_completion_tokens, llm_stats)
+		self.message_log.rewrite(self.get_summary_messages(summarisation.get_summary()) + self.expand_kept_messages(self.message_log.load()[summarisation.n_summarised_messages:]))
+		self.feedback_encoder.reset() # outputs referred to may have been summarised
+		self.force_summarisation = False
+		self.is_summary_near_threshold = self.router.predict_prompt_tokens(provider, self.message_log.n_tokens) > SUMMARISATION_BACKGROUND_FRACTION * SUMMARISATION_TOKENS_THRESHOLD
+		self.emit('summarised', n_summarisations=self.n_summarisations, is_background=(summarisation is self.background_summarisation), kept_turns=summarisation.n_kept_turns,
+			saved_prompt_tokens=summarisation.n_saved_prompt_tokens, saved_completion_tokens=summarisation.n_saved_completion_tokens)
+
+	def expand_kept_messages(self, messages):
+		# Kept messages that refer to summarised ones are made self-contained (kept messages of background summarisation
+		# include ones added after its snapshot): execution results whose outputs refer to outputs of agent whose execution
+		# results have been summarised are in full, and patch request whose reply with agent has been summarised quotes agent
+		messages = [dict(msg) for msg in messages]
+		i_kept_agents = set() # whose execution results precede
+		for k, msg in enumerate(messages):
+			match = re.match(r'Ran agent (\d+)', msg['content']) if (msg['role'] == 'user') else None
+			if match is not None:
+				i_agent = int(match.group(1))
+				if not FeedbackEncoder.get_referred_agents(msg['content']) <= i_kept_agents:
+					result = self.lineage_store.get(i_agent)[1] if (i_agent < self.lineage_store.n_agents) else self.agent_result
+					if (result is not None) and result.startswith(match.group(0) + (' ' if (i_agent > 0) else ':')):
+						self.n_feedback_saved_tokens -= estimate_tokens(result) - estimate_tokens(msg['content'])
+						msg['content'] = result
+				i_kept_agents.add(i_agent)
+			match = re.fullmatch(r'Please reply with next agent \(.+\) as patch against current agent (\d+)\.', msg['content']) if (msg['role'] == 'user') else None
+			if (match is not None) and all(earlier_msg['role'] != 'assistant' for earlier_msg in messages[:k]):
+				i_agent = int(match.group(1))
+				agent_src = self.lineage_store.get(i_agent)[0] if (i_agent < self.lineage_store.n_agents) else self.read_agent_src()
+				if agent_src is not None:
+					msg['content'] = f'{msg["content"][:-1]}, which is:\n"{agent_src}"'
+		return messages
+
+	def start_background_summarisation(self, provider, n_predicted_tokens):
+		self.report(f'Next prompt would have ~{n_predicted_tokens} tokens, near threshold {SUMMARISATION_TOKENS_THRESHOLD}. Summarising in background via {provider.value} :: {MODEL_ID[provider]}.\n')
+		self.background_summarisation = Summarisation(self.router, provider, list(self.message_log.load()), self.add_cost)
+		self.background_summarisation.start()
+
+	def finish_background_summarisation(self, wait):
+		summarisation = self.background_summarisation
+		if (summarisation is None) or (summarisation.is_alive() and (not wait)):
+			return
+		summarisation.join()
+		if summarisation.exception is not None:
+			self.background_summarisation = None
+			self.emit('llm_failed', purpose='background_summary', provider=summarisation.provider.value, model=MODEL_ID[summarisation.provider], error=type(summarisation.exception).__name__)
+			self.report(f'Background summarisation FAIL: {type(summarisation.exception).__name__} exception.\n')
+			return
+		self.emit_llm_finished('background_summary', summarisation.result)
+		self.apply_summarisation(summarisation)
+		self.background_summarisation = None
+		provider, response, n_prompt_tokens, n_completion_tokens, llm_stats = summarisation.result
+		self.report(f'Got summary #{self.n_summarisations} in background; tokens: {n_prompt_tokens} prompt, {n_completion_tokens} response; {format_llm_stats(llm_stats, provider)}; {summarisation.get_savings_str()}.\n')
+
+	def summarise(self, provider, reason):
+		self.report(f'{reason}Summarising via {provider.value} :: {MODEL_ID[provider]} ... ')
+
+		summarisation = Summarisation(self.router, provider, self.message_log.load(), self.add_cost)
+		n_predicted_tokens = self.router.predict_prompt_tokens(provider, summarisation.n_estimated_tokens)
+		summarisation.on_delta = self.on_llm_delta
+		self.emit('llm_started', purpose='summary', provider=provider.value, model=MODEL_ID[provider])
+		summarisation.run()
+
+		if summarisation.exception is None:
+			provider, response, self.n_prompt_tokens, n_completion_tokens, llm_stats = summarisation.result
+
+			self.emit_llm_finished('summary', summarisation.result, n_predicted_tokens)
+			self.apply_summarisation(summarisation)
+
+			self.report(f'OK; tokens: {self.n_prompt_tokens} prompt (predicted {n_predicted_tokens}), {n_completion_tokens} response; {format_llm_stats(llm_stats, provider)}; got summary #{self.n_summarisations}; {summarisation.get_savings_str()}.\n')
 
-					n_summarisations += 1
+		else:
+			exception_name = type(summarisation.exception).__name__
+			self.emit('llm_failed', purpose='summary', provider=provider.value, model=MODEL_ID[provider], error=exception_name)
+			self.report(f'FAIL: {exception_name} exception.\n')
+
+	def run_agent(self):
+		self.report(f'Running agent {self.i_agent}... ')
+
+		ret_code = None
+		exception_name = None
+
+		agent_stdout = ''
+		agent_stderr = ''
+		rusage = None
+		exceeded_budgets = []
+		n_output_bytes = [0, 0]
+
+		rec_header = f'================ Agent {self.i_agent} ================\n'
+		self.emit('agent_started', i_agent=self.i_agent, header=rec_header)
+
+		agent_src = self.read_agent_src()
+
+		# Pre-flight: agent that does not compile is not run, python3 would only report the same error
+		compile_error = get_compile_error(agent_src) if (agent_src is not None) else None
+		if compile_error is not None:
+			self.n_preflight_failures += 1
+			if self.launch_duration is not None:
+				self.preflight_saved_sec += self.launch_duration
+			with open(self.path(AGENT_LOG_FILENAME), 'a') as file:
+				file.write(rec_header + compile_error)
+			self.emit('agent_output', text=compile_error)
+			self.emit('agent_finished', i_agent=self.i_agent, source='preflight', result=compile_error.strip().splitlines()[-1], exit_code=None, is_timed_out=False, duration=0.0)
+			self.report(f'Not run: {compile_error.strip().splitlines()[-1]} (pre-flight check has saved {self.n_preflight_failures} launches, ~{self.preflight_saved_sec:.1f} s so far).\n')
+			return self.format_result('Not run, because compilation by supervisor failed', '', compile_error)
+
+		worker_name = get_worker_name(agent_src) if (BACKGROUND_WORKERS and (agent_src is not None)) else None
+		if worker_name is not None:
+			return self.start_worker(worker_name, agent_src, rec_header)
+
+		# Running workers may change workdir, or answer agent differently, at any time
+		cache_key = None
+		cached_result = None
+		if RESULT_CACHE and (agent_src is not None) and (len(self.workers) == 0):
+			try:
+				fingerprint = get_workdir_fingerprint(self.workdirpath)
+				cache_key = ResultCache.get_key(agent_src, fingerprint)
+				cached_result = self.result_cache.get(cache_key)
+			except Exception:
+				cache_key = None
+
+		if cached_result is not None:
+			with open(self.path(AGENT_LOG_FILENAME), 'a') as file:
+				file.write(rec_header + '(Not run, result of identical agent at the same workdir state is taken from cache.)\n')
+			self.emit('agent_output', text='(Not run, result taken from cache.)\n')
+			self.emit('agent_finished', i_agent=self.i_agent, source='cache', result=cached_result['exec_result_str'], exit_code=None, is_timed_out=False, duration=0.0)
+			self.report(f'{cached_result["exec_result_str"]} (from cache, {cached_result["duration"]:.1f} s saved).\n')
+			return self.format_result(cached_result['exec_result_str'] + ' (this result is taken from cache of supervisor: identical agent has been run before at the same state of its working directory)', cached_result['stdout'], cached_result['stderr'])
+
+		t_start = time.monotonic()
+		try:
+			with open(self.path(AGENT_LOG_FILENAME), 'a') as file:
+				file.write(rec_header)
+
+				def on_output(s):
+					file.write(s)
+					file.flush()
+					self.emit('agent_output', text=s)
+
+				ret_code, stdout_capture, stderr_capture, is_timed_out, rusage, exceeded_budgets = run_agent(self.workdirpath, TIMEOUT, on_output)
+			agent_stdout = stdout_capture.get_text()
+			agent_stderr = stderr_capture.get_text()
+			n_output_bytes = [stdout_capture.n_total_bytes, stderr_capture.n_total_bytes]
+			if is_timed_out:
+				exception_name = subprocess.TimeoutExpired.__name__ # as before, though output until timeout is kept now
+		except Exception as exception:
+			exception_name = type(exception).__name__
+			cache_key = None
+
+		exec_result_str = ((exception_name + ' exception') if (exception_name is not None) else (f'Return code is {ret_code}'))
+		if len(exceeded_budgets) > 0:
+			exec_result_str += f' (exceeded budget: {", ".join(exceeded_budgets)})'
+			cache_key = None
+
+		duration = time.monotonic() - t_start
+		self.emit('agent_finished', i_agent=self.i_agent, source='run', result=exec_result_str, exit_code=ret_code, is_timed_out=(exception_name == subprocess.TimeoutExpired.__name__), duration=duration,
+			cpu_time=(rusage['cpu_time'] if (rusage is not None) else None), max_rss=(rusage['max_rss'] if (rusage is not None) else None), stdout_bytes=n_output_bytes[0], stderr_bytes=n_output_bytes[1], exceeded_budgets=exceeded_budgets)
+
+		# Shortest run approximates cost of launch of python3 that only reports compile error
+		if exception_name is None:
+			self.launch_duration = duration if (self.launch_duration is None) else min(self.launch_duration, duration)
+
+		# Agent that has changed workdir would not be the same when run again, nor would skipping it
+		if (cache_key is not None) and (get_workdir_fingerprint(self.workdirpath) == fingerprint):
+			try:
+				self.result_cache.put(cache_key, {'exec_result_str' : exec_result_str, 'stdout' : agent_stdout, 'stderr' : agent_stderr, 'duration' : duration})
+			except Exception:
+				pass
 
-					cost += COSTS_PER_TOKEN[provider][MODEL_ID[provider]][0] * n_prompt_tokens + COSTS_PER_TOKEN[provider][MODEL_ID[provider]][1] * n_completion_tokens
+		self.report(f'{exec_result_str}.\n')
 
-					clear_messages()
-					add_system_message(SYSTEM_MESSAGE)
-					add_user_message(f'\nThis conversation started before and has been summarised {n_summarisations} times by request or after reaching certain threshold of prompt tokens. The following is the summary up to now, provided by yourself:\n"{response}"')
+		return self.format_result(exec_result_str, agent_stdout, agent_stderr)
 
-					force_summarisation = False
+	def start_worker(self, name, agent_src, rec_header):
+		# Agent that has declared itself worker is started in background; its output during WORKER_STARTUP, or until it exits, is its execution results
+		t_start = time.monotonic()
+		self.report(f'(as background worker {name}) ')
+		with open(self.path(AGENT_LOG_FILENAME), 'a') as file:
+			file.write(rec_header)
+			try:
+				worker = self.workers.start(name, self.i_agent, agent_src)
+			except Exception as exception:
+				exec_result_str = f'Not started as background worker {name}: {exception}'
+				file.write(f'({exec_result_str}.)\n')
+				self.emit('agent_output', text=f'({exec_result_str}.)\n')
+				self.emit('agent_finished', i_agent=self.i_agent, source='worker', result=exec_result_str, exit_code=None, is_timed_out=False, duration=(time.monotonic() - t_start))
+				self.report(f'{exec_result_str}.\n')
+				return self.format_result(exec_result_str, '', '')
+			while (worker.poll() is None) and (time.monotonic() - t_start < WORKER_STARTUP):
+				time.sleep(0.05)
+			stdout_capture, stderr_capture = worker.read_output()
+			agent_stdout = stdout_capture.get_text()
+			agent_stderr = stderr_capture.get_text()
+			for s in [agent_stdout, agent_stderr]:
+				if len(s) > 0:
+					file.write(s)
+					self.emit('agent_output', text=s)
+		usage = worker.get_usage()
+		exceeded_budgets = []
+		if worker.returncode is None:
+			exec_result_str = f'Started as background worker {name}, running after {WORKER_STARTUP} s (its stdout and stderr below are of these seconds)'
+		else:
+			exec_result_str = f'Started as background worker {name}, but it has exited: return code is {worker.returncode}'
+			exceeded_budgets = get_exceeded_budgets(worker.returncode, agent_stderr, worker.rusage, worker.cgroup)
+			if len(exceeded_budgets) > 0:
+				exec_result_str += f' (exceeded budget: {", ".join(exceeded_budgets)})'
+			self.workers.remove(name)
+		self.emit('agent_finished', i_agent=self.i_agent, source='worker', result=exec_result_str, exit_code=worker.returncode, is_timed_out=False, duration=(time.monotonic() - t_start),
+			cpu_time=usage['cpu_time'], max_rss=usage['rss'], stdout_bytes=stdout_capture.n_total_bytes, stderr_bytes=stderr_capture.n_total_bytes, exceeded_budgets=exceeded_budgets)
+		self.report(f'{exec_result_str}.\n')
+		return self.format_result(exec_result_str, agent_stdout, agent_stderr)
+
+	def get_workers_report(self):
+		# Part of execution results about background workers: new output and resource usage of each
+		if len(self.workers) == 0:
+			return ''
+		text, records = self.workers.report()
+		self.emit('workers_reported', i_agent=self.i_agent, workers=records)
+		with open(self.path(AGENT_LOG_FILENAME), 'a') as file:
+			file.write(text + '\n')
+		self.emit('agent_output', text=(text + '\n'))
+		self.report('Workers: ' + ', '.join(f'{record["name"]} ' + (f'running (+{record["cpu_delta"]:.1f} s CPU' if record['is_running'] else f'exited ({record["exit_code"]}') + f', +{record["stdout_bytes"] + record["stderr_bytes"]} bytes of output)' for record in records) + '.\n')
+		return '\n' + text
+
+	def format_result(self, exec_result_str, agent_stdout, agent_stderr):
+		# Execution results message, with report on background workers; kept in full for lineage store, and with outputs encoded for conversation
+		prefix = f'Ran agent {self.i_agent}' + (' obtained from you before' if (self.i_agent > 0) else '') + ': ' + exec_result_str
+		workers_str = self.get_workers_report()
+		self.agent_result = prefix + '.\nstdout is: "' + agent_stdout + '".\nstderr is: "' + agent_stderr + '".' + workers_str
+		self.agent_outputs = (prefix, agent_stdout, agent_stderr, workers_str)
+		self.n_result_saved_tokens = 0
+		return self.encode_result()
+
+	def encode_result(self):
+		# Execution results message of the latest run with outputs encoded; encoded again when summarisation lands before it is sent,
+		# as outputs referred to may have been summarised
+		if not FEEDBACK_ENCODING:
+			return self.agent_result
+		prefix, agent_stdout, agent_stderr, workers_str = self.agent_outputs
+		(stdout_str, stdout_encoding), (stderr_str, stderr_encoding) = [self.feedback_encoder.encode(self.i_agent, name, text) for name, text in [('stdout', agent_stdout), ('stderr', agent_stderr)]]
+		result = f'{prefix}.\n{stdout_str}.\n{stderr_str}.{workers_str}'
+		n_baseline_tokens = estimate_tokens(self.agent_result)
+		n_tokens = estimate_tokens(result)
+		self.n_feedback_saved_tokens += n_baseline_tokens - n_tokens - self.n_result_saved_tokens
+		self.n_result_saved_tokens = n_baseline_tokens - n_tokens
+		self.emit('feedback_encoded', i_agent=self.i_agent, stdout=stdout_encoding, stderr=stderr_encoding, baseline_tokens=n_baseline_tokens, tokens=n_tokens)
+		if n_tokens < n_baseline_tokens:
+			self.report(f'Feedback: stdout {stdout_encoding}, stderr {stderr_encoding}; ~{n_baseline_tokens - n_tokens} prompt tokens saved ({self.n_feedback_saved_tokens} so far).\n')
+		return result
+
+	def read_agent_src(self):
+		try:
+			with open(f'{self.workdirpath}/{AGENT_FILENAME}', 'r') as file:
+				return file.read()
+		except Exception:
+			return None
+
+	def get_next_agent_request(self):
+		num_suffix = 'st' if (self.i_agent == 0) else ('nd' if (self.i_agent == 1) else ('rd' if (self.i_agent == 2) else 'th'))
+		if PATCH_REPLIES and (self.i_agent > 0):
+			# Patch needs current agent verbatim; it is not in conversation if it has been patched or summarised
+			agent_src = self.read_agent_src()
+			if agent_src is not None:
+				replies = [msg['content'] for msg in self.message_log.load() if msg['role'] == 'assistant']
+				if (len(replies) > 0) and (extract_agent_src(replies[-1])[0] == agent_src):
+					return f'Please reply with next agent ({self.i_agent + 1}{num_suffix}) as patch against current agent {self.i_agent}.'
+				return f'Please reply with next agent ({self.i_agent + 1}{num_suffix}) as patch against current agent {self.i_agent}, which is:\n"{agent_src}"'
+		return f'Please reply with next agent ({self.i_agent + 1}{num_suffix}).'
+
+	def obtain_next_agent(self, provider):
+		self.report(f'Obtaining next agent via {provider.value} :: {MODEL_ID[provider]} ... ')
 
-					super_str = f'OK; tokens: {n_prompt_tokens} prompt, {n_completion_tokens} response; got summary #{n_summarisations}.\n'
-					add_supervisor_log(super_str)
-					wnd_super.addstr(super_str + '\r')
-					wnd_super.refresh()
+		try:
+			provider, response, self.n_prompt_tokens, n_completion_tokens, llm_stats = self.get_llm_response(provider, True)
 
+			reply_mode = 'full'
+			if PATCH_REPLIES and is_patch(response):
+				try:
+					next_agent_src = apply_patch(self.read_agent_src(), response)
+					compile_error = get_compile_error(next_agent_src)
+					if compile_error is not None:
+						raise ValueError(f'patched agent does not compile:\n{compile_error}')
+					reply_mode = 'patch'
 				except Exception as exception:
-					exception_name = type(exception).__name__
-					super_str = f'FAIL: {exception_name} exception.\n'
-					add_supervisor_log(super_str)
-					wnd_super.addstr(super_str + '\r')
-					wnd_super.refresh()
+					# Fallback: the same request, for whole agent
+					self.add_llm_cost(provider, self.n_prompt_tokens, n_completion_tokens, llm_stats)
+					self.report(f'patch FAIL ({n_completion_tokens} response tokens): {str(exception).splitlines()[0]}; requesting whole agent ... ')
+					self.add_message('user', f'Your patch cannot be applied: {exception}\nPlease reply with whole next agent instead.')
+					provider, response, self.n_prompt_tokens, n_completion_tokens, llm_stats = self.get_llm_response(provider, True)
+			if reply_mode == 'full':
+				next_agent_src = extract_agent_src(response)[0]
+			self.n_replies[reply_mode] += 1
+			self.n_reply_completion_tokens[reply_mode] += n_completion_tokens
+
+			with open(f'{self.workdirpath}/{AGENT_FILENAME}', 'r', errors='surrogateescape') as file:
+				self.lineage_store.put(self.i_agent, file.read(), self.agent_result)
+
+			write_file_atomically(f'{self.workdirpath}/{AGENT_FILENAME}', next_agent_src.encode('utf-8', errors='surrogateescape'))
+
+			self.i_agent += 1
+
+			self.add_llm_cost(provider, self.n_prompt_tokens, n_completion_tokens, llm_stats)
+
+			self.report(f'OK; tokens: {self.n_prompt_tokens} prompt (predicted {llm_stats["n_predicted_tokens"]}), {n_completion_tokens} response' + (f' ({reply_mode}; mean: {self.get_mean_completion_tokens_str()})' if PATCH_REPLIES else '') + f'; {format_llm_stats(llm_stats, provider)}.\n')
+
+			if TERMINUS is not None:
+				if next_agent_src == TERMINUS:
+					self.report('Terminus.\n')
+					self.is_terminus = True
+
+		except StopRun as exception:
+			self.report(f'FAIL: {exception}\n')
+			raise
+		except Exception as exception:
+			exception_name = type(exception).__name__
+			self.report(f'FAIL: {exception_name} exception.\n')
+
+	def iterate(self, provider):
+		# Requested summarisation precedes run-current-obtain-new agent; when prompt nears threshold,
+		# summarisation runs in background while agent executes; otherwise, when next prompt is predicted
+		# to be too large, conversation up to execution results of current agent is summarised
+		t_start = time.monotonic()
+		self.provider = provider
+		self.save_checkpoint(True)
+		self.emit('iteration_started', i_agent=self.i_agent, provider=provider.value, model=MODEL_ID[provider], cost=self.cost)
+
+		if self.force_summarisation:
+			self.finish_background_summarisation(True)
+		if self.force_summarisation:
+			self.summarise(provider, self.get_summarisation_reason(provider, 0))
+		elif SUMMARISATION_IN_BACKGROUND and (self.background_summarisation is None) and (not self.is_summary_near_threshold):
+			n_predicted_tokens = self.router.predict_prompt_tokens(provider, self.message_log.n_tokens)
+			if n_predicted_tokens > SUMMARISATION_BACKGROUND_FRACTION * SUMMARISATION_TOKENS_THRESHOLD:
+				self.start_background_summarisation(provider, n_predicted_tokens)
+
+		new_messages = [{'role' : 'user', 'content' : self.run_agent()}, {'role' : 'user', 'content' : self.get_next_agent_request()}]
+
+		n_summarisations = self.n_summarisations
+		self.finish_background_summarisation(False)
+		n_new_tokens = sum(estimate_message_tokens(msg) for msg in new_messages)
+		n_predicted_tokens = self.router.predict_prompt_tokens(provider, self.message_log.n_tokens + n_new_tokens)
+		reason = self.get_summarisation_reason(provider, n_predicted_tokens)
+		if (reason is not None) and (self.background_summarisation is not None):
+			self.finish_background_summarisation(True)
+			n_predicted_tokens = self.router.predict_prompt_tokens(provider, self.message_log.n_tokens + n_new_tokens)
+			reason = self.get_summarisation_reason(provider, n_predicted_tokens)
+		if reason is not None:
+			self.summarise(provider, reason)
+		if self.n_summarisations != n_summarisations:
+			# Outputs that execution results refer to, and reply that patch request refers to, may have been summarised
+			new_messages = [{'role' : 'user', 'content' : self.encode_result()}, {'role' : 'user', 'content' : self.get_next_agent_request()}]
+		for msg in new_messages:
+			self.add_message(msg['role'], msg['content'])
+		self.obtain_next_agent(provider)
+
+		self.save_checkpoint(False)
+		for filename in [SUPERVISOR_LOG_FILENAME, AGENT_LOG_FILENAME]:
+			if rotate_log(self.path(filename)):
+				self.report(f'{filename} is rotated to {filename}.1.gz.\n')
+		self.emit('iteration_finished', i_agent=self.i_agent, cost=self.cost, duration=(time.monotonic() - t_start), is_terminus=self.is_terminus)
+
+	def finish(self):
+		# Before quitting, so that pending summary is neither lost nor unpaid, nor background workers left running
+		self.finish_background_summarisation(True)
+		n_workers = self.workers.stop()
+		if n_workers > 0:
+			self.report(f'{n_workers} background worker(s) stopped.\n')
+		self.save_checkpoint(False)
+
+
+class Supervisor:
+	# Loop of single lineage in dirpath, without UI: iterations until terminus, cost limit, or quit;
+	# events of lineage, and its own started/stopped, go to listeners (curses view, JSON Lines writer...)
+
+	def __init__(self, dirpath='.', listeners=()):
+		self.listeners = list(listeners)
+		self.lineage = Lineage(dirpath, self.emit)
+		self.stop_reason = None # terminus, cost (of supervisor, or of all via coordinator), quit, or cassette (replay has diverged)
+
+	def emit(self, event):
+		for listener in self.listeners:
+			listener(event)
+
+	@property
+	def is_stopped(self):
+		return self.stop_reason is not None
+
+	def begin(self):
+		self.lineage.router.load_calibration()
+		self.lineage.begin()
+		self.lineage.emit('started', version=VERSION, goal=FINAL_GOAL_PROMPT, i_agent=self.lineage.i_agent, cost=self.lineage.cost)
+
+	def step(self, provider=None):
+		# One iteration, with provider chosen by router unless given
+		if self.is_stopped:
+			return
+		try:
+			self.lineage.iterate(provider if (provider is not None) else self.lineage.router.choose())
+		except StopRun as exception:
+			self.stop_reason = exception.reason
+			return
+		if self.lineage.is_terminus:
+			self.stop_reason = 'terminus'
+		elif self.lineage.cost > COST_LIMIT:
+			self.lineage.report('Cost exceeds limit.\n')
+			self.stop_reason = 'cost'
+
+	def quit(self):
+		if not self.is_stopped:
+			self.stop_reason = 'quit'
+
+	def finish(self):
+		self.lineage.finish()
+		self.lineage.router.save_calibration()
+		self.lineage.emit('stopped', reason=self.stop_reason, i_agent=self.lineage.i_agent, cost=self.lineage.cost)
+
+	def run(self):
+		self.begin()
+		while not self.is_stopped:
+			self.step()
+		self.finish()
+
+
+class JsonLinesWriter:
+	# Listener that writes events as JSON Lines, without text ones (supervisor log text, agent output, streamed response) unless is_text
+
+	TEXT_EVENTS = {'report', 'llm_delta', 'agent_output'}
+
+	def __init__(self, file, is_text=False):
+		self.file = file
+		self.is_text = is_text
+		self.lock = threading.Lock()
+
+	def __call__(self, event):
+		if self.is_text or (event['event'] not in self.TEXT_EVENTS):
+			with self.lock:
+				self.file.write(json.dumps(event, ensure_ascii=False) + '\n')
+				self.file.flush()
+
+
+class EventQueue:
+	# Listener that passes events from worker threads to main one, which waits for them on fileno() with select
+	# together with keyboard, instead of polling
+
+	def __init__(self):
+		self.queue = queue.Queue()
+		self.pipe_r, self.pipe_w = os.pipe()
+		os.set_blocking(self.pipe_r, False)
+		os.set_blocking(self.pipe_w, False)
+
+	def __call__(self, event):
+		self.queue.put(event)
+		try:
+			os.write(self.pipe_w, b'\0')
+		except BlockingIOError:
+			pass # pipe is full of wakeups already
 
-			super_str = f'Running agent {i_agent}... '
+	def fileno(self):
+		return self.pipe_r
 
-			add_supervisor_log(super_str)
-			wnd_super.addstr(super_str)
-			wnd_super.refresh()
+	def get_all(self):
+		try:
+			while len(os.read(self.pipe_r, 0x1000)) > 0:
+				pass
+		except BlockingIOError:
+			pass
+		events = []
+		while True:
+			try:
+				events.append(self.queue.get_nowait())
+			except queue.Empty:
+				return events
 
-			ret_code = None
-			exception_name = None
+	def close(self):
+		os.close(self.pipe_r)
+		os.close(self.pipe_w)
 
-			agent_stdout = ''
-			agent_stderr = ''
 
-			try:
-				comp_proc = subprocess.run(['python3', AGENT_FILENAME], timeout=TIMEOUT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=WORKDIRPATH)
-				ret_code = comp_proc.returncode
-				agent_stdout = comp_proc.stdout[:STDOUTERR_SIZE_LIMIT].decode('utf-8', errors='replace')
-				agent_stderr = comp_proc.stderr[:STDOUTERR_SIZE_LIMIT].decode('utf-8', errors='replace')
-				rec_header = f'================ Agent {i_agent} ================\n'
-				with open(AGENT_LOG_FILENAME, 'a') as file:
-					file.write(rec_header + agent_stdout + agent_stderr)
-				if clear_agent_wnd:
-					wnd_agent.erase()
-				else:
-					wnd_agent.addstr(rec_header + '\r')
-				wnd_agent.addstr(agent_stdout + agent_stderr)
-				wnd_agent.refresh()
-			except Exception as exception:
-				exception_name = type(exception).__name__
+def run(scr):
+	scr.nodelay(True)
+	if curses.can_change_color():
+		curses.init_color(0, 0, 0, 0)
 
-			exec_result_str = ((exception_name + ' exception') if (exception_name is not None) else (f'Return code is {ret_code}'))
+	scr.addstr(0, 0, f'FINAL GOAL: "{FINAL_GOAL_PROMPT}"')
 
-			add_user_message(f'Ran agent {i_agent}' + (' obtained from you before' if (i_agent > 0) else '') + ': ' + exec_result_str + '.\nstdout is: "' + agent_stdout + '".\nstderr is: "' + agent_stderr + '".')
+	scr.hline(1, 0, curses.ACS_HLINE, curses.COLS)
+	wn_header = f'[ SUPERVISOR (→ {SUPERVISOR_LOG_FILENAME}) ]'
+	scr.addstr(1, (curses.COLS - len(wn_header)) >> 1, wn_header)
 
-			super_str = f'Obtaining next agent via {prv_mdl_str} ... '
+	used_other_lines = 6
 
-			add_supervisor_log(f'{exec_result_str}.\n{super_str}')
-			wnd_super.addstr(f'{exec_result_str}.\n\r{super_str}')
-			wnd_super.refresh()
+	scr.hline(2 + ((curses.LINES - used_other_lines) >> 1), 0, curses.ACS_HLINE, curses.COLS)
+	wn_header = f'[ AGENT (→ {AGENT_LOG_FILENAME}) ]'
+	scr.addstr(2 + ((curses.LINES - used_other_lines) >> 1), (curses.COLS - len(wn_header)) >> 1, wn_header)
 
-			num_suffix = 'st' if (i_agent == 0) else ('nd' if (i_agent == 1) else ('rd' if (i_agent == 2) else 'th'))
-			add_user_message(f'Please reply with next agent ({i_agent + 1}{num_suffix}).')
+	scr.hline(curses.LINES - 3, 0, curses.ACS_HLINE, curses.COLS)
+	wn_header = '[ HELP & COST ]'
+	scr.addstr(curses.LINES - 3, (curses.COLS - len(wn_header)) >> 1, wn_header)
 
-			try:
-				response, n_prompt_tokens, n_completion_tokens = get_llm_response(provider)
-				next_agent_src = trim_python_quote(response)
+	scr.refresh()
 
-				os.rename(f'{WORKDIRPATH}/{AGENT_FILENAME}', f'{LINEAGE_DIRNAME}/{AGENT_FILENAME}.{i_agent}')
+	wnd_super = curses.newwin((curses.LINES - used_other_lines) >> 1, curses.COLS, 2, 0)
+	wnd_super.idlok(True)
+	wnd_super.scrollok(True)
 
-				with open(f'{WORKDIRPATH}/{AGENT_FILENAME}', 'w') as file:
-					file.write(next_agent_src)
+	wnd_agent = curses.newwin(curses.LINES - used_other_lines - ((curses.LINES - used_other_lines) >> 1), curses.COLS, 3 + ((curses.LINES - used_other_lines) >> 1), 0)
+	wnd_agent.idlok(True)
+	wnd_agent.scrollok(True)
+
+	wnd_help = curses.newwin(2, curses.COLS, curses.LINES - 2, 0)
+	wnd_help.idlok(True)
+	wnd_help.scrollok(True)
 
-				i_agent += 1
+	# Supervisor iterates in worker thread, and main thread, which alone draws, sleeps in select until
+	# event of supervisor or key comes; pause stops worker between iterations, quit happens after current one
+	view = CursesView(wnd_super, wnd_agent)
+	events = EventQueue()
+	supervisor = Supervisor('.', [events])
+	lineage = supervisor.lineage
+	supervisor.begin()
 
-				cost += COSTS_PER_TOKEN[provider][MODEL_ID[provider]][0] * n_prompt_tokens + COSTS_PER_TOKEN[provider][MODEL_ID[provider]][1] * n_completion_tokens
+	resume = threading.Event()
+	resume.set()
+	worker_exceptions = []
 
-				super_str = f'OK; tokens: {n_prompt_tokens} prompt, {n_completion_tokens} response.\n'
+	def work():
+		try:
+			while not supervisor.is_stopped:
+				resume.wait()
+				supervisor.step()
+		except BaseException as exception:
+			worker_exceptions.append(exception)
+		finally:
+			events(None)
 
-				add_supervisor_log(super_str)
-				wnd_super.addstr(super_str + '\r')
-				wnd_super.refresh()
+	worker = threading.Thread(target=work, daemon=True)
+	worker.start()
 
-				if TERMINUS is not None:
-					if next_agent_src == TERMINUS:
-						super_str = 'Terminus.\n'
-						add_supervisor_log(super_str)
-						wnd_super.addstr(super_str + '\r')
-						wnd_super.refresh()
-						quit = True
+	selector = selectors.DefaultSelector()
+	selector.register(sys.stdin.fileno(), selectors.EVENT_READ)
+	selector.register(events.fileno(), selectors.EVENT_READ)
 
-			except Exception as exception:
-				exception_name = type(exception).__name__
-				super_str = f'FAIL: {exception_name} exception.\n'
-				add_supervisor_log(super_str)
-				wnd_super.addstr(super_str + '\r')
-				wnd_super.refresh()
-
-		if cost > COST_LIMIT:
-			super_str = 'Cost exceeds limit.\n'
-			add_supervisor_log(super_str)
-			wnd_super.addstr(super_str + '\r')
-			wnd_super.refresh()
-			quit = True
+	is_paused = False
+	prv_mdl_str = ''
+	help_state = None
+
+	is_working = True
+	while True:
+		for event in events.get_all():
+			if event is None:
+				is_working = False
+			else:
+				if event['event'] == 'iteration_started':
+					prv_mdl_str = f'{event["provider"]} :: {event["model"]}'
+				view(event)
+
+		new_help_state = (lineage.force_summarisation, is_paused, supervisor.is_stopped, view.clear_agent_wnd, prv_mdl_str, round(lineage.get_cache_hit_rate(), 2), round(lineage.cost, 2))
+		if new_help_state != help_state:
+			help_state = new_help_state
+			wnd_help.erase()
+			wnd_help.addstr(0, 0, 'S: force summarisation' + (' (PENDING)' if lineage.force_summarisation else ''))
+			wnd_help.addstr(1, 0, 'Q: quit (run again to continue) | P: pause (' + ('ON' if is_paused else 'OFF') + ') | C: clear agent window every run (' + ('ON' if view.clear_agent_wnd else 'OFF') + ')' + (' | STOPPING' if supervisor.is_stopped else ''))
+			wnd_help.addstr(0, curses.COLS - 1 - len(prv_mdl_str), prv_mdl_str)
+			cost_str = f'Cache hits {lineage.get_cache_hit_rate():.0%} | Total cost ≈ ${lineage.cost:.2f}'
+			wnd_help.addstr(1, curses.COLS - 1 - len(cost_str), cost_str)
+			wnd_help.refresh()
+
+		if not is_working:
+			break
+
+		selector.select()
 
 		while True:
 			ch = scr.getch()
 			if ch != -1:
 				if ch in {ord('s'), ord('S')}:
-					force_summarisation = True
+					lineage.force_summarisation = True
 				if ch in {ord('q'), ord('Q')}:
-					quit = True
+					supervisor.quit()
+					resume.set()
 				if ch in {ord('p'), ord('P')}:
 					is_paused = not is_paused
+					if is_paused:
+						resume.clear()
+					else:
+						resume.set()
 				if ch in {ord('c'), ord('C')}:
-					clear_agent_wnd = not clear_agent_wnd
+					view.clear_agent_wnd = not view.clear_agent_wnd
+			else:
+				break
+
+	selector.close()
+	worker.join()
+	supervisor.finish()
+	for event in events.get_all():
+		view(event)
+	events.close()
+	if len(worker_exceptions) > 0:
+		raise worker_exceptions[0]
+
+
+class PopulationView(LineageView):
+	# Keeps last supervisor line of lineage for population TUI
+
+	def __init__(self):
+		self.super_line = ''
+
+	def __call__(self, event):
+		if event['event'] == 'report':
+			s = event['text']
+			if s.endswith('\n'):
+				self.super_line = s.rstrip('\n')
+			else:
+				self.super_line = s
+
+
+class Population:
+	# POPULATION_SIZE lineages iterated concurrently by threads, so that agent of one lineage runs
+	# while LLM is busy with others; COST_LIMIT is for all of them, the first one reaching terminus wins
+
+	def __init__(self, size=None, dirpath=POPULATION_DIRNAME, listeners=()):
+		if size is None:
+			size = POPULATION_SIZE
+		self.router = Router(API_PROVIDER) # shared, so that all lineages learn from each call
+		self.views = [PopulationView() for k in range(size)]
+		self.listeners = list(listeners) # receive events of all lineages, with their numbers
+		self.lineages = [Lineage(os.path.join(dirpath, str(k)), (lambda event, k=k: self.emit(k, event)), self.router) for k in range(size)]
+		self.lock = threading.Lock()
+		self.emit_lock = threading.Lock()
+		self.stop = threading.Event()
+		self.resume = threading.Event()
+		self.resume.set()
+		self.i_winner = None
+		self.is_cost_exceeded = False
+		self.n_iterations = 0
+		self.t_start = None
+		self.threads = []
+
+	def emit(self, k, event):
+		self.views[k](event)
+		with self.emit_lock:
+			for listener in self.listeners:
+				listener(dict(event, lineage=k))
+
+	@property
+	def cost(self):
+		return sum(lineage.cost for lineage in self.lineages)
+
+	@property
+	def cache_hit_rate(self):
+		n_total_prompt_tokens = sum(lineage.n_total_prompt_tokens for lineage in self.lineages)
+		return (sum(lineage.n_cached_tokens for lineage in self.lineages) / n_total_prompt_tokens) if (n_total_prompt_tokens > 0) else 0.0
+
+	@property
+	def iterations_per_minute(self):
+		with self.lock:
+			dt = time.monotonic() - self.t_start
+			return (60 * self.n_iterations / dt) if (dt > 0) else 0.0
+
+	def begin(self):
+		self.router.load_calibration()
+		for lineage in self.lineages:
+			lineage.begin()
+			lineage.emit('started', version=VERSION, goal=FINAL_GOAL_PROMPT, i_agent=lineage.i_agent, cost=lineage.cost)
+		self.t_start = time.monotonic()
+		for k in range(len(self.lineages)):
+			thread = threading.Thread(target=self.iterate_lineage, args=(k,), daemon=True)
+			thread.start()
+			self.threads.append(thread)
+
+	def iterate_lineage(self, k):
+		lineage = self.lineages[k]
+		stop_reason = None
+		while not self.stop.is_set():
+			self.resume.wait()
+			if self.stop.is_set():
+				break
+			try:
+				lineage.iterate(self.router.choose())
+			except StopRun as exception:
+				stop_reason = exception.reason
+				break
+			with self.lock:
+				self.n_iterations += 1
+				if lineage.is_terminus and (self.i_winner is None):
+					self.i_winner = k
+					lineage.emit('winner')
+					self.stop.set()
+				if self.cost > COST_LIMIT:
+					if not self.is_cost_exceeded:
+						lineage.report('Cost of population exceeds limit.\n')
+					self.is_cost_exceeded = True
+					self.stop.set()
+		lineage.finish()
+		lineage.emit('stopped', reason=('terminus' if lineage.is_terminus else (stop_reason or ('cost' if self.is_cost_exceeded else ('winner' if (self.i_winner is not None) else 'quit')))), i_agent=lineage.i_agent, cost=lineage.cost)
+
+	def is_alive(self):
+		return any(thread.is_alive() for thread in self.threads)
+
+	def quit(self):
+		self.stop.set()
+		self.resume.set()
+
+
+def run_population(scr):
+	scr.nodelay(True)
+	if curses.can_change_color():
+		curses.init_color(0, 0, 0, 0)
+
+	# Screen is redrawn when lineages report something, or keys come, or each second for rate, unless paused
+	events = EventQueue()
+	population = Population(listeners=[events])
+	population.begin()
+
+	selector = selectors.DefaultSelector()
+	selector.register(sys.stdin.fileno(), selectors.EVENT_READ)
+	selector.register(events.fileno(), selectors.EVENT_READ)
+
+	is_paused = False
+
+	while population.is_alive():
+		events.get_all()
+		scr.erase()
+		scr.addstr(0, 0, f'FINAL GOAL: "{FINAL_GOAL_PROMPT}"')
+		scr.hline(1, 0, curses.ACS_HLINE, curses.COLS)
+		wn_header = f'[ POPULATION (→ {POPULATION_DIRNAME}/k/{SUPERVISOR_LOG_FILENAME}) ]'
+		scr.addstr(1, (curses.COLS - len(wn_header)) >> 1, wn_header)
+		for k, lineage in enumerate(population.lineages[:max(0, curses.LINES - 5)]):
+			lineage_str = f'{k:>3} | agent {lineage.i_agent:>5} | ${lineage.cost:6.2f} | ' + ('WINNER | ' if (k == population.i_winner) else '') + population.views[k].super_line
+			scr.addstr(2 + k, 0, lineage_str[:(curses.COLS - 1)])
+		scr.hline(curses.LINES - 3, 0, curses.ACS_HLINE, curses.COLS)
+		wn_header = '[ HELP & COST ]'
+		scr.addstr(curses.LINES - 3, (curses.COLS - len(wn_header)) >> 1, wn_header)
+		scr.addstr(curses.LINES - 2, 0, 'Q: quit (run again to continue) | P: pause (' + ('ON' if is_paused else 'OFF') + ')' + (' | STOPPING' if population.stop.is_set() else ''))
+		rate_str = f'{population.iterations_per_minute:.1f} iterations/min'
+		scr.addstr(curses.LINES - 2, curses.COLS - 1 - len(rate_str), rate_str)
+		cost_str = f'Cache hits {population.cache_hit_rate:.0%} | Total cost ≈ ${population.cost:.2f}'
+		scr.addstr(curses.LINES - 1, curses.COLS - 1 - len(cost_str), cost_str)
+		scr.refresh()
+
+		selector.select(None if (is_paused and (not population.stop.is_set())) else 1.0)
+
+		while True:
+			ch = scr.getch()
+			if ch != -1:
+				if ch in {ord('q'), ord('Q')}:
+					population.quit()
+				if ch in {ord('p'), ord('P')}:
+					is_paused = not is_paused
+					if is_paused:
+						population.resume.clear()
+					else:
+						population.resume.set()
 			else:
 				break
 
-	with open(COUNTERS_FILENAME, 'w') as file:
-		file.write(json.dumps({'i_agent' : i_agent, 'n_prompt_tokens' : n_prompt_tokens, 'n_summarisations' : n_summarisations, 'cost' : cost}))
+	selector.close()
+	events.close()
+	population.router.save_calibration()
+
+
+def get_percentile(values, q):
+	values = sorted(values)
+	return values[int(q * (len(values) - 1))] if (len(values) > 0) else None
+
+
+def report_metrics(dirpath='.', n_trend_rows=10):
+	# Summary of metrics file(s) of lineage in dirpath, or of population whose lineages are its subdirs
+	filenames = [os.path.join(dirpath, METRICS_FILENAME)]
+	if not os.path.isfile(filenames[0]):
+		filenames = sorted((os.path.join(dirpath, name, METRICS_FILENAME) for name in os.listdir(dirpath) if os.path.isfile(os.path.join(dirpath, name, METRICS_FILENAME))), key=lambda filename: (len(filename), filename))
+	records = []
+	for filename in filenames:
+		with open(filename, 'r') as file:
+			for line in file:
+				try:
+					records.append(json.loads(line))
+				except ValueError:
+					pass # torn last line
+	if len(records) == 0:
+		print(f'No {METRICS_FILENAME} in {dirpath}')
+		return
+	records.sort(key=lambda record: record['t'])
+
+	llm_calls = [call for record in records for call in record['llm_calls']]
+	agents = [record['agent'] for record in records if record['agent'] is not None]
+	runs = [agent for agent in agents if agent['source'] == 'run']
+	n_workers = sum(1 for agent in agents if agent['source'] == 'worker')
+	workers = [worker for record in records for worker in (record.get('workers') or [])]
+
+	# Background summarisation overlaps agent run, so it is not part of iteration time; time queued by coordinator is part of LLM's
+	t_total = sum(record['duration'] for record in records)
+	t_llm = sum(call['latency'] + (call.get('queued') or 0.0) for call in llm_calls if call['purpose'] != 'background_summary')
+	t_agent = sum(agent['duration'] for agent in agents)
+	t_overhead = t_total - t_llm - t_agent
+	cost = sum(record['cost'] for record in records)
+
+	print(f'{len(filenames)} lineage(s) in {dirpath}: {len(records)} iterations, {len(llm_calls)} LLM calls, {len(runs)} agent runs ({len(agents) - len(runs) - n_workers} skipped: pre-flight or cache{f"; {n_workers} started as background workers" if (n_workers > 0) else ""}); cost ${cost:.4f}')
+	print()
+	print(f'Time: {t_total:.1f} s total; LLM {t_llm:.1f} s ({100 * t_llm / max(t_total, 1e-9):.1f}%), agent {t_agent:.1f} s ({100 * t_agent / max(t_total, 1e-9):.1f}%), supervisor {t_overhead:.1f} s ({100 * t_overhead / max(t_total, 1e-9):.1f}%)')
+	print()
+
+	rows = [
+		('iteration, s', [record['duration'] for record in records]),
+		('LLM total, s', [call['latency'] for call in llm_calls]),
+		('LLM queued, s', [call['queued'] for call in llm_calls if call.get('queued') is not None]),
+		('LLM connect, s', [call['connect'] for call in llm_calls if call['connect'] is not None]),
+		('LLM TTFB, s', [call['ttfb'] for call in llm_calls if call['ttfb'] is not None]),
+		('LLM TTFT, s', [call['ttft'] for call in llm_calls if call['ttft'] is not None]),
+		('prompt tokens', [call['prompt_tokens'] for call in llm_calls]),
+		('completion tokens', [call['completion_tokens'] for call in llm_calls]),
+		('agent wall, s', [agent['duration'] for agent in runs]),
+		('agent CPU, s', [agent['cpu_time'] for agent in runs if agent['cpu_time'] is not None]),
+		('agent max RSS, MiB', [agent['max_rss'] / 1024 for agent in runs if agent['max_rss'] is not None]),
+		('agent output, KiB', [(agent['stdout_bytes'] + agent['stderr_bytes']) / 1024 for agent in runs]),
+		('worker CPU/report, s', [worker['cpu_delta'] for worker in workers if worker['cpu_delta'] is not None]),
+		('worker RSS, MiB', [worker['rss'] / 1024 for worker in workers if worker['rss'] is not None]),
+		('feedback tokens saved', [record['feedback']['baseline_tokens'] - record['feedback']['tokens'] for record in records if record.get('feedback') is not None]),
+		('cost per iteration, $', [record['cost'] for record in records])
+	]
+	print(f'{"":<22}{"p50":>12}{"p90":>12}{"p99":>12}{"max":>12}{"n":>8}')
+	for name, values in rows:
+		if len(values) > 0:
+			print(f'{name:<22}' + ''.join(f'{get_percentile(values, q):>12.4g}' for q in [0.5, 0.9, 0.99, 1.0]) + f'{len(values):>8}')
+	print()
+
+	print(f'{"iterations":<22}{"cost/iteration, $":>18}{"prompt tokens":>15}{"iteration, s":>14}')
+	n_per_row = -(-len(records) // min(n_trend_rows, len(records)))
+	for i in range(0, len(records), n_per_row):
+		part = records[i:(i + n_per_row)]
+		part_calls = [call for record in part for call in record['llm_calls'] if call['purpose'] == 'agent']
+		mean_prompt_tokens = (sum(call['prompt_tokens'] for call in part_calls) / len(part_calls)) if (len(part_calls) > 0) else 0
+		print(f'{f"{i}..{i + len(part) - 1}":<22}{sum(record["cost"] for record in part) / len(part):>18.5f}{mean_prompt_tokens:>15.0f}{sum(record["duration"] for record in part) / len(part):>14.2f}')
+
+
+def get_lineage_agent(dirpath, i_agent):
+	# (agent source, result or None) of lineage in dirpath; the current agent, not stored yet, is taken from workdir
+	store = LineageStore(os.path.join(dirpath, LINEAGE_DIRNAME))
+	if i_agent in store.load():
+		return store.get(i_agent)
+	if i_agent == store.n_agents:
+		with open(os.path.join(dirpath, WORKDIRPATH, AGENT_FILENAME), 'r', errors='surrogateescape') as file:
+			return file.read(), None
+	raise KeyError(f'no agent {i_agent} in {os.path.join(dirpath, LINEAGE_DIRNAME)} (there are {store.n_agents} stored, and current one)')
+
+
+def extract_lineage_agent(dirpath, i_agent, is_result=False):
+	agent_src, result = get_lineage_agent(dirpath, i_agent)
+	if is_result:
+		if result is None:
+			raise KeyError(f'no result of agent {i_agent} is stored')
+		print(result)
+	else:
+		sys.stdout.write(agent_src)
+
+
+def diff_lineage_agents(dirpath, i_agent_a, i_agent_b, is_result=False):
+	texts = [get_lineage_agent(dirpath, i_agent)[1 if is_result else 0] or '' for i_agent in [i_agent_a, i_agent_b]]
+	sys.stdout.writelines(difflib.unified_diff(texts[0].splitlines(keepends=True), texts[1].splitlines(keepends=True), *(f'{"result" if is_result else AGENT_FILENAME}.{i_agent}' for i_agent in [i_agent_a, i_agent_b])))
+
+
+def run_headless(events_filename=None, is_text=False):
+	# Without TUI, for containers, systemd and benchmarks: events as JSON Lines to stdout or file;
+	# SIGTERM or SIGINT quits after current iteration
+	file = open(events_filename, 'a') if (events_filename is not None) else sys.stdout
+	writer = JsonLinesWriter(file, is_text)
+	try:
+		if POPULATION_SIZE <= 1:
+			supervisor = Supervisor('.', [writer])
+			signal.signal(signal.SIGTERM, lambda signum, frame: supervisor.quit())
+			signal.signal(signal.SIGINT, lambda signum, frame: supervisor.quit())
+			supervisor.run()
+		else:
+			population = Population(listeners=[writer])
+			signal.signal(signal.SIGTERM, lambda signum, frame: population.quit())
+			signal.signal(signal.SIGINT, lambda signum, frame: population.quit())
+			population.begin()
+			for thread in population.threads:
+				while thread.is_alive():
+					thread.join(0.5) # so that signal handlers run
+			population.router.save_calibration()
+	finally:
+		if file is not sys.stdout:
+			file.close()
+
 
 if __name__ == '__main__':
-	print(f'NochBinIch v{VERSION}')
-	# Check availability of API keys
-	for prov in API_PROVIDER:
-		get_secret_api_key(prov)
-	curses.wrapper(run)
+	parser = argparse.ArgumentParser(description=f'NochBinIch v{VERSION}')
+	parser.add_argument('--headless', action='store_true', help='run without TUI, printing events as JSON Lines')
+	parser.add_argument('--events', metavar='FILENAME', help='append events to this file instead of stdout (with --headless)')
+	parser.add_argument('--text-events', action='store_true', help='include supervisor log text, agent output and streamed LLM responses in events (with --headless)')
+	cassette_group = parser.add_mutually_exclusive_group()
+	cassette_group.add_argument('--record', action='store_true', help=f'save LLM requests and responses to cassette in {LLM_CASSETTE_DIRNAME}')
+	cassette_group.add_argument('--replay', action='store_true', help=f'answer LLM requests from cassette in {LLM_CASSETTE_DIRNAME}, offline')
+	parser.add_argument('--zero-latency', action='store_true', help='replay responses immediately, instead of with recorded latency (with --replay)')
+	subparsers = parser.add_subparsers(dest='command')
+	report_parser = subparsers.add_parser('report', help=f'print percentiles, time breakdown and cost trend from {METRICS_FILENAME} of run')
+	report_parser.add_argument('dirpath', nargs='?', default='.', help='dir of lineage, or of population (default: current dir)')
+	extract_parser = subparsers.add_parser('extract', help=f'print agent of given number from {LINEAGE_DIRNAME} (or workdir, if it is current one)')
+	extract_parser.add_argument('i_agent', type=int, help='number of agent')
+	extract_parser.add_argument('--result', action='store_true', help='print execution results of agent (in full) instead')
+	extract_parser.add_argument('--dir', dest='dirpath', default='.', help='dir of lineage (default: current dir)')
+	diff_parser = subparsers.add_parser('diff', help=f'print unified diff between agents of given numbers from {LINEAGE_DIRNAME}')
+	diff_parser.add_argument('i_agent_a', type=int, help='number of agent')
+	diff_parser.add_argument('i_agent_b', type=int, help='number of another agent')
+	diff_parser.add_argument('--result', action='store_true', help='diff their execution results instead')
+	diff_parser.add_argument('--dir', dest='dirpath', default='.', help='dir of lineage (default: current dir)')
+	coordinator_parser = subparsers.add_parser('coordinator', help=f'run coordinator of LLM calls of supervisors with COORDINATOR on this host (rate limits, fair queue, cost ledger in {COORDINATOR_LEDGER_FILENAME} of current dir)')
+	coordinator_parser.add_argument('--socket', dest='socket_path', default=COORDINATOR_SOCKET, help=f'Unix socket (default: {COORDINATOR_SOCKET})')
+	coordinator_parser.add_argument('--status', action='store_true', help='print ledger, queues and rate limit buckets of running coordinator instead')
+	args = parser.parse_args()
+	if args.command == 'report':
+		report_metrics(args.dirpath)
+		sys.exit(0)
+	if args.command in {'extract', 'diff'}:
+		try:
+			if args.command == 'extract':
+				extract_lineage_agent(args.dirpath, args.i_agent, args.result)
+			else:
+				diff_lineage_agents(args.dirpath, args.i_agent_a, args.i_agent_b, args.result)
+		except (KeyError, OSError) as exception:
+			print(f'ERROR: {exception.args[0] if isinstance(exception, KeyError) else exception}', file=sys.stderr)
+			sys.exit(1)
+		sys.exit(0)
+	if args.command == 'coordinator':
+		try:
+			if args.status:
+				print_coordinator_status(args.socket_path)
+			else:
+				signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+				print(f'NochBinIch v{VERSION} coordinator at {args.socket_path} (Ctrl+C stops)')
+				Coordinator(args.socket_path).serve()
+		except (OSError, RuntimeError) as exception:
+			print(f'ERROR: {exception}', file=sys.stderr)
+			sys.exit(1)
+		except KeyboardInterrupt:
+			pass
+		sys.exit(0)
+	if not args.headless:
+		print(f'NochBinIch v{VERSION}')
+	if args.record or args.replay:
+		LLM_CASSETTE = 'replay' if args.replay else 'record'
+	if args.zero_latency:
+		LLM_CASSETTE_LATENCY = False
+	if LLM_CASSETTE is not None:
+		get_cassette().load()
+	if LLM_CASSETTE == 'replay':
+		if len(cassette.entries) == 0:
+			print(f'ERROR: Cassette in {LLM_CASSETTE_DIRNAME} is empty. Record it first: "$ python3 nochbinich.py --record"')
+			exit(1)
+	else:
+		# Check availability of API keys, prepare clients
+		for prov in API_PROVIDER:
+			get_provider_client(prov)
+	# ...and of coordinator
+	if COORDINATOR and (LLM_CASSETTE != 'replay'):
+		try:
+			get_coordinator_status()
+		except OSError as exception:
+			print(f'ERROR: Coordinator is not running at {COORDINATOR_SOCKET} ({exception}). Start it: "$ python3 nochbinich.py coordinator", or set COORDINATOR = False')
+			exit(1)
+	# ...and of cgroup v2 for agents
+	if AGENT_CGROUP:
+		try:
+			get_agent_cgroup_parent()
+		except Exception as exception:
+			print(f'ERROR: Cannot prepare cgroup for agents: {exception}. Run supervisor in delegated cgroup, e.g. "$ systemd-run --user --scope -p Delegate=yes python3 nochbinich.py", or set AGENT_CGROUP = False')
+			exit(1)
+	if args.headless:
+		run_headless(args.events, args.text_events)
+	else:
+		curses.wrapper(run if (POPULATION_SIZE <= 1) else run_population)